@@ -1,57 +1,119 @@
 import os
 import re
+import csv
+import json
 import argparse
-import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
+
+# Every construct the complexity metrics count, found in one left-to-right scan. The leading character
+# class lets the regex engine reject most positions before trying any branch.
+_SCANNER = re.compile(r"""
+  (?=[.nifdcC])  # Cheap first-character test before trying the branches
+  (?:
+    \.(?P<low>(?:delegate|static)?call)(?P<low_end>(?!\w))?         # .call / .delegatecall / .staticcall
+  | (?<=\w)(?P<member>\.)(?=\w+\()                                 # obj.func(
+  | (?P<new>new)(?=\s+(?P<new_name>[A-Z]\w+)(?P<new_paren>\s*\()?)  # new Contract / new Proxy(
+  | (?P<if>if\s*\()
+  | (?P<proxy>fallback|delegateTo|implementation|forwardTo|functionSelector)
+  | (?P<create2>[cC][rR][eE][aA][tT][eE]2)
+  )
+""", re.VERBOSE)
+_CALLEE = re.compile(r"\w+\(")
+_LOW_CALL = re.compile(r"\.(?:delegate|static)?call")
+
+def _is_word_char(char):
+    return char.isalnum() or char == "_"
+
+def scan_interactions(content):
+    """
+    Counts every complexity metric in a single pass. Conditions are checked once per line with
+    forward searches from the first 'if (' instead of backtracking '.*' patterns.
+    """
+    counts = dict.fromkeys(("high_calls", "low_calls", "low_conditions", "opaque_preds", "proxy_patterns",
+                            "factory_proxy", "factory_new", "factory_create2"), 0)
+    proxy_names = set()
+    condition_line_end = -1  # Only the first 'if (' of a line can start a condition match
+    new_end = -1  # 'new X' matches do not overlap: 'new Anew B' is one deployment
+
+    for match in _SCANNER.finditer(content):
+        kind = match.lastgroup
+        if kind in ("low", "low_end", "member"):
+            # obj.func(: a word character before the dot, a name and '(' after it
+            dot = match.start()
+            if kind == "member" or (dot and _is_word_char(content[dot - 1]) and _CALLEE.match(content, dot + 1)):
+                counts["high_calls"] += 1
+            if kind == "low_end":
+                counts["low_calls"] += 1
+        elif kind in ("new", "new_name", "new_paren"):
+            if match.start() >= new_end:
+                new_end = match.end("new_name")
+                counts["factory_new"] += 1
+            if match.group("new_name") == "Proxy" and match.group("new_paren"):
+                counts["factory_proxy"] += 1
+        elif kind == "if":
+            start = match.end()
+            if start <= condition_line_end:
+                continue
+            line_end = content.find("\n", start)
+            condition_line_end = line_end = len(content) if line_end < 0 else line_end
+
+            # if (... .call: a low-level call anywhere later on the line
+            if _LOW_CALL.search(content, start, line_end):
+                counts["low_conditions"] += 1
+            # if (... call ... && ... ): each part after the previous one
+            call = content.find("call", start, line_end)
+            both = content.find("&&", call + 4, line_end) if call >= 0 else -1
+            if both >= 0 and content.find(")", both + 2, line_end) >= 0:
+                counts["opaque_preds"] += 1
+        elif kind == "proxy":
+            counts["proxy_patterns"] += 1
+            proxy_names.add(match.group())
+        else:  # create2
+            counts["factory_create2"] += 1
+
+    counts["distinct_proxy_patterns"] = len(proxy_names)
+    return counts
 
 def extract_interaction_data(filepath):
     """Extract contract interaction complexity and gas cost using static analysis."""
     with open(filepath, 'r', encoding='utf-8') as f:
         content = f.read()
 
-    complexity = 0
-    gas_cost = 0
+    counts = scan_interactions(content)
 
     # High-level calls
-    high_calls = re.findall(r'\w+\.\w+\(', content)
-    complexity += len(high_calls)
-    gas_cost += len(high_calls)
+    complexity = counts["high_calls"]
+    gas_cost = counts["high_calls"]
 
     # Low-level calls
-    low_calls = re.findall(r'\.(call|delegatecall|staticcall)\b', content)
-    low_conditions = re.findall(r'if\s*\(.*\.(call|delegatecall|staticcall)', content)
-    complexity += len(low_conditions) + len(low_calls)
-    gas_cost += len(low_calls) + len(low_conditions) * 2
+    complexity += counts["low_conditions"] + counts["low_calls"]
+    gas_cost += counts["low_calls"] + counts["low_conditions"] * 2
 
     # Opaque predicates
-    opaque_preds = re.findall(r'if\s*\(.*(call|delegatecall|staticcall).*&&.*\)', content)
-    complexity += len(opaque_preds)
-    gas_cost += len(opaque_preds) * 2
+    complexity += counts["opaque_preds"]
+    gas_cost += counts["opaque_preds"] * 2
 
     # Proxy patterns
-    proxy_patterns = re.findall(r'(fallback|delegateTo|implementation|forwardTo|functionSelector)', content)
-    complexity += len(set(proxy_patterns))
-    gas_cost += len(proxy_patterns) * 2
+    complexity += counts["distinct_proxy_patterns"]
+    gas_cost += counts["proxy_patterns"] * 2
 
     # Factory-related complexity
-    factory_proxy = re.findall(r'new\s+Proxy\s*\(', content)
-    complexity += len(factory_proxy)
-    gas_cost += len(factory_proxy) * 4
+    complexity += counts["factory_proxy"]
+    gas_cost += counts["factory_proxy"] * 4
 
-    factory_new = re.findall(r'new\s+[A-Z]\w+', content)
-    factory_create2 = re.findall(r'create2', content, re.IGNORECASE)
-    complexity += len(factory_new)
-    gas_cost += len(factory_new) * 2 + len(factory_create2) * 3
+    complexity += counts["factory_new"]
+    gas_cost += counts["factory_new"] * 2 + counts["factory_create2"] * 3
 
     return complexity, gas_cost
 
 def percent_change(orig, obf):
     """Calculate percentage change."""
     if orig == 0 and obf > 0:
-        return f"{(obf - orig) * 10:+.2f}%"
+        return "+inf%"
     elif orig == 0 and obf == 0:
         return "0%"
     else:
-        return f"{(obf - orig) * 10:+.2f}%"
+        return f"{(obf - orig) / orig * 100:+.2f}%"
 
 def compare_files(orig_file, obf_file):
     """Compare total complexity and gas cost between original and obfuscated contracts."""
@@ -63,20 +125,119 @@ def compare_files(orig_file, obf_file):
 
     return os.path.basename(orig_file), orig_complexity, obf_complexity, comp_change, orig_gas, obf_gas, gas_change
 
-def compare_folders(orig_folder, obf_folder):
-    """Analyze complexity across multiple contract files and generate table & charts."""
-    results = []
+COMPARISON_FIELDS = ("file", "orig_complexity", "obf_complexity", "complexity_change",
+                     "orig_gas", "obf_gas", "gas_change")
 
-    for file in os.listdir(orig_folder):
+def _compare_pair(paths):
+    return compare_files(*paths)
+
+def compare_folders(orig_folder, obf_folder, jobs=1, csv_path=None, json_path=None, chart_path=None):
+    """
+    Analyze complexity across multiple contract files, print the table and optionally write CSV, JSON and a
+    chart image. File pairs are scanned in parallel when jobs > 1; results keep file name order.
+    """
+    pairs = []
+    for file in sorted(os.listdir(orig_folder)):
         if file.endswith('.sol'):
-            orig_path = os.path.join(orig_folder, file)
             obf_path = os.path.join(obf_folder, file)
-
             if os.path.exists(obf_path):
-                results.append(compare_files(orig_path, obf_path))
+                pairs.append((os.path.join(orig_folder, file), obf_path))
+
+    if jobs > 1 and len(pairs) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(_compare_pair, pairs, chunksize=max(1, len(pairs) // (jobs * 4))))
+    else:
+        results = [_compare_pair(pair) for pair in pairs]
 
     print_table(results)
-    plot_bar_charts(results)
+    if csv_path:
+        write_csv(results, csv_path)
+    if json_path:
+        write_json(results, json_path)
+    if chart_path:
+        plot_bar_charts(results, chart_path)
+    return results
+
+def _prepare(path):
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+
+def write_csv(data, path):
+    """Write the comparison rows to a CSV file."""
+    _prepare(path)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(COMPARISON_FIELDS)
+        writer.writerows(data)
+    print(f"Comparison written to {path}")
+
+def write_json(data, path):
+    """Write the comparison rows to a JSON file, one object per contract file."""
+    _prepare(path)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump([dict(zip(COMPARISON_FIELDS, entry)) for entry in data], f, indent=4)
+    print(f"Comparison written to {path}")
+
+def measure_gas_folders(orig_folder, obf_folder):
+    """Compile, deploy and call original and obfuscated contracts on a local EVM and report measured gas."""
+    from utils.gas_measurement import measure_files
+
+    files = sorted(f for f in os.listdir(orig_folder)
+                   if f.endswith('.sol') and os.path.exists(os.path.join(obf_folder, f)))
+    try:
+        original = measure_files([os.path.join(orig_folder, f) for f in files])
+        obfuscated = measure_files([os.path.join(obf_folder, f) for f in files])
+    except Exception as e:
+        print(f"Error: gas measurement failed ({e}). Make sure solc and eth-tester[py-evm] are installed.")
+        return []
+
+    results = []
+    for file in files:
+        orig = original[os.path.join(orig_folder, file)]
+        obf = obfuscated[os.path.join(obf_folder, file)]
+        for label, measured in (("original", orig), ("obfuscated", obf)):
+            if measured["errors"]:
+                print(f" {file} ({label}) failed to compile:\n" + "\n".join(measured["errors"]))
+
+        for name in sorted(set(orig["contracts"]) | set(obf["contracts"])):
+            orig_contract = orig["contracts"].get(name)
+            obf_contract = obf["contracts"].get(name)
+            results.append((file, name, None,
+                            orig_contract and orig_contract["deploy_gas"], obf_contract and obf_contract["deploy_gas"],
+                            orig_contract and orig_contract["bytecode_size"], obf_contract and obf_contract["bytecode_size"]))
+
+            orig_functions = orig_contract["functions"] if orig_contract else {}
+            obf_functions = obf_contract["functions"] if obf_contract else {}
+            for signature in sorted(set(orig_functions) | set(obf_functions)):
+                results.append((file, name, signature, orig_functions.get(signature), obf_functions.get(signature),
+                                None, None))
+
+    print_gas_table(results)
+    return results
+
+def print_gas_table(data):
+    """Print measured deployment gas, bytecode size and per-function gas. '-' marks a revert or a missing entry."""
+    def cell(value):
+        return "-" if value is None else value
+
+    def change(orig, obf):
+        return percent_change(orig, obf) if orig is not None and obf is not None else "-"
+
+    print("\n Measured Gas (local EVM): Original vs Obfuscated\n")
+    print("-" * 130)
+    print(f"{'File / Contract':<35} | {'Function':<35} | {'Orig. Gas':>10} | {'Obf. Gas':>10} | {'% Change':>10} | {'Orig. Size':>10} | {'Obf. Size':>10}")
+    print("-" * 130)
+
+    for file, contract, signature, orig_gas, obf_gas, orig_size, obf_size in data:
+        if signature is None:
+            label = f"{file}:{contract}"
+            print(f"{label:<35} | {'(deployment)':<35} | {cell(orig_gas):>10} | {cell(obf_gas):>10} | "
+                  f"{change(orig_gas, obf_gas):>10} | {cell(orig_size):>10} | {cell(obf_size):>10}")
+        else:
+            print(f"{'':<35} | {signature:<35} | {cell(orig_gas):>10} | {cell(obf_gas):>10} | "
+                  f"{change(orig_gas, obf_gas):>10} | {'':>10} | {'':>10}")
+
+    print("-" * 130)
 
 def print_table(data):
     """Print the comparison table in structured format."""
@@ -90,8 +251,12 @@ def print_table(data):
 
     print("-" * 120)
 
-def plot_bar_charts(data):
-    """Generate four bar charts for complexity and gas cost comparison with adjusted Y-axis ranges."""
+def plot_bar_charts(data, path):
+    """Save four bar charts for complexity and gas cost comparison with adjusted Y-axis ranges to an image file."""
+    import matplotlib
+    matplotlib.use("Agg")  # Render to a file; never open a window
+    import matplotlib.pyplot as plt  # Only loaded when charts are actually drawn
+
     filenames = [entry[0] for entry in data]
     orig_complexity = [entry[1] for entry in data]
     obf_complexity = [entry[2] for entry in data]
@@ -120,16 +285,30 @@ def plot_bar_charts(data):
 
     # Improve readability for X-axis labels
     for ax in axes.flatten():
-        ax.set_xticklabels(filenames, rotation=45, ha='right')
+        plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
         ax.set_ylabel("Value")
 
     plt.tight_layout()
-    plt.show()
+    _prepare(path)
+    fig.savefig(path)
+    plt.close(fig)
+    print(f"Charts written to {path}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Compare total contract complexity and gas cost.")
     parser.add_argument('--original', required=True, help="Path to original contract folder")
     parser.add_argument('--obfuscated', required=True, help="Path to obfuscated contract folder")
+    parser.add_argument('--measure-gas', action='store_true', help="Deploy and call both versions on a local EVM")
+    parser.add_argument('--jobs', type=int, default=1, help="Number of worker processes (default: 1)")
+    parser.add_argument('--csv', help="Write the comparison to this CSV file")
+    parser.add_argument('--json', help="Write the comparison to this JSON file")
+    parser.add_argument('--chart', help="Save bar charts to this image file (e.g. comparison.png)")
     args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
 
-    compare_folders(args.original, args.obfuscated)
+    if args.measure_gas:
+        measure_gas_folders(args.original, args.obfuscated)
+    else:
+        compare_folders(args.original, args.obfuscated, jobs=args.jobs,
+                        csv_path=args.csv, json_path=args.json, chart_path=args.chart)
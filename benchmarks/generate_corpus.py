@@ -0,0 +1,179 @@
+import os
+import random
+import argparse
+
+# Interaction kinds the generator can emit and their default weights
+DEFAULT_MIX = {
+    "high_level": 4,
+    "low_level": 2,
+    "delegatecall": 1,
+    "factory": 1,
+    "proxy": 1,
+}
+
+HEADER = "// SPDX-License-Identifier: MIT\npragma solidity ^0.8.20;\n"
+
+def _interface(name):
+    return (
+        f"interface I{name} {{\n"
+        f"    function deposit(uint256 amount) external;\n"
+        f"    function balanceOf(address account) external view returns (uint256);\n"
+        f"}}\n"
+    )
+
+def _child(name):
+    return (
+        f"contract {name}Child {{\n"
+        f"    address public owner;\n"
+        f"    uint256 public created;\n\n"
+        f"    constructor(address _owner, uint256 _created) {{\n"
+        f"        owner = _owner;\n"
+        f"        created = _created;\n"
+        f"    }}\n"
+        f"}}\n"
+    )
+
+def _statements(rng, name, kind, index):
+    """
+    Body lines for one function exercising the given interaction kind.
+    """
+    value = rng.randrange(1, 10 ** 6)
+    if kind == "high_level":
+        return [
+            f"require(msg.sender == owner, \"Not owner\");",
+            f"token.deposit(amount + {value});",
+            f"total += token.balanceOf(msg.sender);",
+        ]
+    if kind == "low_level":
+        return [
+            f"(bool ok{index}, ) = target.call(abi.encodeWithSignature(\"ping(uint256)\", amount + {value}));",
+            f"require(ok{index}, \"Call failed\");",
+        ]
+    if kind == "delegatecall":
+        return [
+            f"(bool ok{index}, ) = target.delegatecall(abi.encodeWithSignature(\"run(uint256)\", {value}));",
+            f"require(ok{index}, \"Delegatecall failed\");",
+        ]
+    if kind == "factory":
+        return [
+            f"{name}Child child{index} = new {name}Child(msg.sender, amount + {value});",
+            f"last = address(child{index});",
+        ]
+    # Plain arithmetic filler keeps the proxy and padding functions realistic
+    return [
+        f"uint256 x{index} = amount * {value} + total;",
+        f"total = x{index} % {value + 7};",
+    ]
+
+def generate_contract(rng, name, lines, mix):
+    """
+    Source of one synthetic contract of roughly `lines` lines with interactions drawn from mix (kind -> weight).
+    """
+    kinds = [kind for kind, weight in mix.items() if weight > 0]
+    weights = [mix[kind] for kind in kinds]
+    proxy = "proxy" in kinds and rng.random() < mix["proxy"] / sum(weights)
+
+    parts = [HEADER, _interface(name), _child(name)]
+    body = [
+        f"contract {name} {{",
+        f"    address public owner;",
+        f"    address public target;",
+        f"    address public last;",
+        f"    uint256 public total;",
+        f"    I{name} public token;",
+    ]
+    if proxy:
+        body.append(f"    address public implementation;")
+    body += [
+        "",
+        f"    constructor(address _target, address _token) {{",
+        f"        owner = msg.sender;",
+        f"        target = _target;",
+        f"        token = I{name}(_token);",
+        f"    }}",
+    ]
+    if proxy:
+        body += [
+            "",
+            f"    function upgradeTo(address newImplementation) public {{",
+            f"        require(msg.sender == owner, \"Not owner\");",
+            f"        implementation = newImplementation;",
+            f"    }}",
+            "",
+            f"    fallback() external payable {{",
+            f"        address impl = implementation;",
+            f"        assembly {{",
+            f"            calldatacopy(0, 0, calldatasize())",
+            f"            let result := delegatecall(gas(), impl, 0, calldatasize(), 0, 0)",
+            f"            returndatacopy(0, 0, returndatasize())",
+            f"            switch result",
+            f"            case 0 {{ revert(0, returndatasize()) }}",
+            f"            default {{ return(0, returndatasize()) }}",
+            f"        }}",
+            f"    }}",
+        ]
+
+    used = sum(part.count("\n") for part in parts) + len(body) + 1
+    index = 0
+    while used < lines or index == 0:
+        kind = rng.choices(kinds, weights)[0] if kinds else "filler"
+        if kind == "proxy":
+            kind = "filler"
+        statements = _statements(rng, name, kind, index)
+        body.append("")
+        body.append(f"    function action{index}(uint256 amount) public {{")
+        body += [f"        {statement}" for statement in statements]
+        body.append("    }")
+        used += len(statements) + 3
+        index += 1
+
+    body.append("}")
+    parts.append("\n".join(body) + "\n")
+    return "\n".join(parts)
+
+def generate_corpus(folder, contracts, lines, seed=0, mix=None):
+    """
+    Writes `contracts` synthetic contracts of about `lines` lines each to folder. Returns their paths.
+    The same seed always produces the same corpus.
+    """
+    rng = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    os.makedirs(folder, exist_ok=True)
+
+    paths = []
+    width = len(str(contracts))
+    for number in range(contracts):
+        name = f"Synthetic{number:0{width}d}"
+        path = os.path.join(folder, f"{name}.sol")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(generate_contract(rng, name, lines, mix))
+        paths.append(path)
+    return paths
+
+def parse_mix(text):
+    """
+    Parses 'high_level=4,low_level=2,...' into a mix dict; unnamed kinds keep weight 0.
+    """
+    mix = {kind: 0 for kind in DEFAULT_MIX}
+    for item in text.split(","):
+        kind, _, weight = item.partition("=")
+        if kind not in mix:
+            raise ValueError(f"Unknown interaction kind: {kind}")
+        mix[kind] = int(weight or 1)
+    return mix
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a seeded corpus of synthetic Solidity contracts")
+    parser.add_argument('output', help='Folder to write the contracts to')
+    parser.add_argument('--contracts', type=int, default=10, help='Number of contracts (default: 10)')
+    parser.add_argument('--lines', type=int, default=100, help='Approximate lines per contract (default: 100)')
+    parser.add_argument('--seed', type=int, default=0, help='Generator seed (default: 0)')
+    parser.add_argument('--mix', help='Interaction weights, e.g. high_level=4,low_level=2,delegatecall=1,factory=1,proxy=1')
+    args = parser.parse_args()
+
+    paths = generate_corpus(args.output, args.contracts, args.lines, args.seed,
+                            parse_mix(args.mix) if args.mix else None)
+    print(f"Generated {len(paths)} contracts in {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import contextlib
+
+# Allow running as a script from the repository root or from benchmarks/
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.generate_corpus import generate_corpus, parse_mix
+
+DEFAULT_CONTRACTS = "10,1000"
+DEFAULT_LINES = "100,1000"
+
+def _timed(function, *args, **kwargs):
+    """
+    Runs function and returns (result, wall seconds, CPU seconds).
+    """
+    wall, cpu = time.perf_counter(), time.process_time()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - wall, time.process_time() - cpu
+
+def benchmark_case(workdir, contracts, lines, seed, mix, jobs):
+    """
+    Generates one corpus inside workdir and times analysis, each obfuscation stage and a full run_obfuscation.
+    """
+    import contract_analysis
+    from main import run_obfuscation
+    from utils.file_handler import read_contracts
+    from utils.interaction_index import InteractionIndex
+    from utils.run_manifest import resolve_run
+    from obfuscation_techniques.pipeline import build_passes, seed_rngs
+
+    corpus = os.path.join(workdir, "contracts")
+    paths = generate_corpus(corpus, contracts, lines, seed, mix)
+    corpus_bytes = sum(os.path.getsize(path) for path in paths)
+
+    run_id, analysis_wall, analysis_cpu = _timed(contract_analysis.manual_analysis, corpus, retain=None)
+    json_folder = os.path.join("output", "analysis_results")
+    index = InteractionIndex.from_json(resolve_run(json_folder, run_id))
+
+    # Stages timed one by one on the same in-memory sources the pipeline would hand along
+    sources = read_contracts(paths)
+    seed_rngs(seed)
+    stages = []
+    for title, apply_pass in build_passes(index, {}):
+        sources, wall, cpu = _timed(apply_pass, sources)
+        stages.append({"stage": title, "wall_seconds": wall, "cpu_seconds": cpu})
+
+    _, total_wall, total_cpu = _timed(
+        run_obfuscation, corpus, os.path.join(workdir, "intermediate"), os.path.join(workdir, "obfuscated"),
+        json_folder, jobs=jobs, seed=str(seed), run_id=run_id,
+    )
+
+    return {
+        "contracts": contracts,
+        "lines": lines,
+        "corpus_bytes": corpus_bytes,
+        "interactions": len(index),
+        "analysis": {"wall_seconds": analysis_wall, "cpu_seconds": analysis_cpu},
+        "stages": stages,
+        "run_obfuscation": {"wall_seconds": total_wall, "cpu_seconds": total_cpu, "jobs": jobs},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Time analysis and obfuscation on synthetic corpora")
+    parser.add_argument('--contracts', default=DEFAULT_CONTRACTS,
+                        help=f'Comma-separated corpus sizes (default: {DEFAULT_CONTRACTS}; e.g. 10,1000,10000)')
+    parser.add_argument('--lines', default=DEFAULT_LINES,
+                        help=f'Comma-separated lines per contract (default: {DEFAULT_LINES}; e.g. 100,1000,50000)')
+    parser.add_argument('--seed', type=int, default=0, help='Corpus and obfuscation seed (default: 0)')
+    parser.add_argument('--mix', help='Interaction weights, e.g. high_level=4,low_level=2,delegatecall=1,factory=1,proxy=1')
+    parser.add_argument('--jobs', type=int, default=1, help='Worker processes for run_obfuscation (default: 1)')
+    parser.add_argument('--output', help='Results file (default: benchmarks/results/bench_<timestamp>.json)')
+    parser.add_argument('--verbose', action='store_true', help='Show pipeline output instead of discarding it')
+    args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+
+    output = args.output or os.path.join(REPO_ROOT, "benchmarks", "results", f"bench_{int(time.time())}.json")
+    output = os.path.abspath(output)
+    mix = parse_mix(args.mix) if args.mix else None
+
+    results = {
+        "created": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": args.seed,
+        "mix": mix,
+        "cases": [],
+    }
+
+    if not args.verbose:
+        logging.disable(logging.ERROR)  # Per-file pipeline logging would dominate the output
+
+    cwd = os.getcwd()
+    for contracts in (int(n) for n in args.contracts.split(",")):
+        for lines in (int(n) for n in args.lines.split(",")):
+            print(f"Benchmarking {contracts} contracts x {lines} lines...")
+            workdir = tempfile.mkdtemp(prefix="obfuscation_bench_")
+            try:
+                # Analysis and obfuscation write under ./output, so keep them inside the scratch folder
+                os.chdir(workdir)
+                with open(os.devnull, "w") as devnull, \
+                        contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+                    case = benchmark_case(workdir, contracts, lines, args.seed, mix, args.jobs)
+            finally:
+                os.chdir(cwd)
+                shutil.rmtree(workdir, ignore_errors=True)
+
+            results["cases"].append(case)
+            stages = ", ".join(f"{stage['stage'].split()[0]} {stage['wall_seconds']:.2f}s" for stage in case["stages"])
+            print(f"  analysis {case['analysis']['wall_seconds']:.2f}s | {stages} | "
+                  f"run_obfuscation {case['run_obfuscation']['wall_seconds']:.2f}s")
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=4)
+    print(f"Results written to {output}")
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,18 @@
 import os
-import re
 import json
 import logging
-from concurrent.futures import ThreadPoolExecutor
-import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from utils.solidity_lexer import tokenize
+from utils.file_handler import write_jsonl
+from utils.run_manifest import DEFAULT_RETAIN, new_run_id, contract_hashes, register_run
+from obfuscation_techniques.dynamic_function_dispatch.selector_computer import abi_type
 
 # Configure logging for better traceability
 logging.basicConfig(level=logging.INFO)
 
+LOW_LEVEL_CALLS = {"call", "delegatecall", "staticcall"}
+PROXY_KEYWORDS = {"delegatecall", "upgradeto", "implementation", "getimplementation", "proxyadmin", "_upgrade"}
+
 def analyze_contract(contract_path):
     interactions = []
     contract_name = os.path.basename(contract_path)
@@ -19,89 +24,90 @@ def analyze_contract(contract_path):
         logging.error(f"Error reading file {contract_path}: {e}")
         return []
 
-    # Pre-compiled regex patterns for efficiency
-    high_level_pattern = re.compile(r'\b(\w+)\.(\w+)\((.*?)\)')
-    low_level_pattern = re.compile(r'(\w+)\.(call|staticcall)\((.*?)\)')
-    delegate_pattern = re.compile(r'(\w+)\.delegatecall\((.*?)\)')
-    factory_pattern = re.compile(r'new\s+(\w+)\s*\((.*?)\)')
-    proxy_keywords = [
-        re.compile(r'\bdelegatecall\b', re.IGNORECASE),
-        re.compile(r'\bupgradeTo\b', re.IGNORECASE),
-        re.compile(r'\bimplementation\b', re.IGNORECASE),
-        re.compile(r'\bgetImplementation\b', re.IGNORECASE),
-        re.compile(r'\bproxyAdmin\b', re.IGNORECASE),
-        re.compile(r'\b_upgrade\b', re.IGNORECASE)
-    ]
+    # One tokenization serves every check below; comments and strings are never matched
+    tokens = tokenize(code)
+    identifiers = tokens.identifiers()
+    lowered_identifiers = {identifier.lower() for identifier in identifiers}
+    is_proxy = bool(lowered_identifiers & PROXY_KEYWORDS)
 
     # Determine interaction role based on contract behavior
-    def determine_role(code):
-        if "msg.sender" in code and "require" in code:
+    def determine_role():
+        uses_msg_sender = any(
+            tokens.is_ident(i, "msg") and tokens.is_punct(i + 1, ".") and tokens.is_ident(i + 2, "sender")
+            for i in range(len(tokens) - 2)
+        )
+        if uses_msg_sender and "require" in identifiers:
             return "initiator"
-        elif any(keyword.search(code) for keyword in proxy_keywords):
+        elif is_proxy:
             return "middleware"
-        elif re.search(r'\.delegatecall\(', code):
+        elif any(True for _ in tokens.member_calls({"delegatecall"})):
             return "executor"
         else:
             return "unknown"
 
+    def call_arguments(open_paren):
+        close_paren = tokens.matches[open_paren]
+        if close_paren < 0:
+            return ""
+        return " ".join(tokens.between(open_paren, close_paren).split())
+
     # Validating Solidity file
-    if not re.search(r'pragma\s+solidity', code):
+    if not any(tokens.is_ident(i, "pragma") and tokens.is_ident(i + 1, "solidity") for i in range(len(tokens) - 1)):
         logging.info(f"Skipping non-Solidity file: {contract_name}")
         return []
 
     # Determine interaction role
-    interaction_role = determine_role(code)
+    interaction_role = determine_role()
 
     # Analyze interactions
     # 1. High-Level Calls
-    high_level_calls = high_level_pattern.findall(code)
-    for obj, func, args in high_level_calls:
-        if func not in ["call", "delegatecall", "staticcall"]:  # Exclude low-level calls
+    for obj, _, member, open_paren in tokens.member_calls():
+        func = tokens.text(member)
+        if func not in LOW_LEVEL_CALLS:  # Exclude low-level calls
             interactions.append({
                 "caller": contract_name,
-                "callee": obj,
+                "callee": tokens.text(obj),
                 "function": func,
                 "interaction_type": "high_level",  # Updated field
                 "interaction_role": interaction_role,  # Added role
-                "function_signature": f"{func}({args})",  # Extra field 
+                "function_signature": f"{func}({call_arguments(open_paren)})",  # Extra field 
             })
 
     # 2. Low-Level Calls (call, staticcall ONLY)
-    low_level_calls = low_level_pattern.findall(code)
-    for callee, call_type, args in low_level_calls:
+    for obj, _, member, open_paren in tokens.member_calls({"call", "staticcall"}):
+        callee = tokens.text(obj)
+        call_type = tokens.text(member)
         interactions.append({
             "caller": contract_name,
             "callee": callee,
             "function": call_type,
             "interaction_type": "low_level",  # Updated field
             "interaction_role": interaction_role,  # Added role
-            "function_signature": f"{call_type}({args})",  # Extra field
+            "function_signature": f"{call_type}({call_arguments(open_paren)})",  # Extra field
             "contract_address": callee  # Using callee directly as contract address for low-level calls
         })
 
     # 3. Delegatecall ONLY
-    delegate_calls = delegate_pattern.findall(code)
-    for callee, _ in delegate_calls:
+    for obj, _, _, _ in tokens.member_calls({"delegatecall"}):
         interactions.append({
             "caller": contract_name,
-            "callee": callee,
+            "callee": tokens.text(obj),
             "function": "delegatecall",
             "interaction_type": "delegate_call",  # Updated field
             "interaction_role": interaction_role  # Added role
         })
 
     # 4. Factory Deployments
-    factory_calls = factory_pattern.findall(code)
-    for callee, _ in factory_calls:
+    for _, name, _ in tokens.new_expressions():
         interactions.append({
             "caller": contract_name,
-            "callee": callee,
+            "callee": tokens.text(name),
             "interaction_type": "factory_deployment",  # Updated field
             "interaction_role": interaction_role  # Added role
         })
 
     # 5. Proxy Pattern Detection
-    if any(keyword.search(code) for keyword in proxy_keywords):
+    if is_proxy:
         interactions.append({
             "caller": contract_name,
             "interaction_type": "proxy",  # Updated field
@@ -110,28 +116,246 @@ def analyze_contract(contract_path):
 
     return interactions
 
-def manual_analysis(folder_path):
-    all_interactions = []
+def _walk(root):
+    """
+    Iterative pre-order traversal of a solc AST (no recursion, so deep ASTs cannot overflow the stack).
+    """
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            if "nodeType" in node:
+                yield node
+            stack.extend(reversed([value for value in node.values() if isinstance(value, (dict, list))]))
+        elif isinstance(node, list):
+            stack.extend(reversed(node))
 
-    # Analyze files concurrently for better performance
-    def process_file(path):
-        return analyze_contract(path)
+def _source_text(source_bytes, node):
+    """
+    Source text of an AST node from its 'start:length:file' byte range.
+    """
+    start, length, _ = (int(part) for part in node["src"].split(":"))
+    return source_bytes[start:start + length].decode("utf-8", errors="replace")
+
+def _type_string(node):
+    return (node.get("typeDescriptions") or {}).get("typeString") or ""
+
+def _call_target(call):
+    """
+    Returns the MemberAccess a FunctionCall invokes, looking through call options like '{value: x}'.
+    """
+    expression = call.get("expression", {})
+    if expression.get("nodeType") == "FunctionCallOptions":
+        expression = expression.get("expression", {})
+    return expression if expression.get("nodeType") == "MemberAccess" else None
+
+def analyze_ast(contract_name, source, ast, definitions):
+    """
+    Emits the interaction schema of analyze_contract from a compiled AST.
+    definitions maps AST ids to FunctionDefinition/VariableDeclaration nodes across all sources.
+    """
+    source_bytes = source.encode("utf-8")
+    high_level, low_level, delegate_calls, factories = [], [], [], []
+    uses_msg_sender = uses_require = uses_delegatecall = is_proxy = False
+
+    def arguments_text(call):
+        return ", ".join(" ".join(_source_text(source_bytes, argument).split()) for argument in call.get("arguments", []))
+
+    for node in _walk(ast):
+        node_type = node["nodeType"]
+
+        if node_type in ("FunctionDefinition", "VariableDeclaration", "ModifierDefinition") \
+                and (node.get("name") or "").lower() in PROXY_KEYWORDS:
+            is_proxy = True
+        elif node_type == "YulFunctionCall" and node.get("functionName", {}).get("name") == "delegatecall":
+            is_proxy = True
+        elif node_type == "MemberAccess" and node.get("memberName") == "sender" \
+                and node.get("expression", {}).get("name") == "msg":
+            uses_msg_sender = True
+        elif node_type == "FunctionCall":
+            expression = node.get("expression", {})
+            if expression.get("nodeType") == "Identifier" and expression.get("name") == "require":
+                uses_require = True
+                continue
+
+            if expression.get("nodeType") == "NewExpression":
+                created = _type_string(expression.get("typeName", {}))
+                if created.startswith("contract "):
+                    factories.append({
+                        "caller": contract_name,
+                        "callee": created[len("contract "):],
+                        "interaction_type": "factory_deployment",
+                    })
+                continue
+
+            member = _call_target(node)
+            if member is None or node.get("kind") != "functionCall":
+                continue
+            base = member.get("expression", {})
+            base_type = _type_string(base)
+            function = member.get("memberName")
+            callee = " ".join(_source_text(source_bytes, base).split())
+
+            if base_type.startswith("address"):
+                if function in ("call", "staticcall"):
+                    low_level.append({
+                        "caller": contract_name,
+                        "callee": callee,
+                        "function": function,
+                        "interaction_type": "low_level",
+                        "function_signature": f"{function}({arguments_text(node)})",
+                        "contract_address": callee,
+                        "callee_type": base_type,
+                    })
+                elif function == "delegatecall":
+                    uses_delegatecall = True
+                    delegate_calls.append({
+                        "caller": contract_name,
+                        "callee": callee,
+                        "function": "delegatecall",
+                        "interaction_type": "delegate_call",
+                        "callee_type": base_type,
+                    })
+                elif function in ("transfer", "send"):
+                    high_level.append({
+                        "caller": contract_name,
+                        "callee": callee,
+                        "function": function,
+                        "interaction_type": "high_level",
+                        "function_signature": f"{function}({arguments_text(node)})",
+                        "callee_type": base_type,
+                    })
+            elif base_type.startswith("contract "):
+                # External call on a contract or interface: resolve its canonical signature and selector
+                interaction = {
+                    "caller": contract_name,
+                    "callee": callee,
+                    "function": function,
+                    "interaction_type": "high_level",
+                    "function_signature": f"{function}({arguments_text(node)})",
+                    "callee_type": base_type,
+                }
+                definition = definitions.get(member.get("referencedDeclaration"))
+                if definition is not None:
+                    if definition["nodeType"] == "FunctionDefinition":
+                        parameters = definition.get("parameters", {}).get("parameters", [])
+                        # Left out when a parameter has no ABI type name (structs); the selector still identifies the function
+                        types = [abi_type(_type_string(parameter)) for parameter in parameters]
+                        if None not in types:
+                            interaction["canonical_signature"] = f"{function}({','.join(types)})"
+                    if definition.get("functionSelector"):
+                        interaction["selector"] = "0x" + definition["functionSelector"]
+                high_level.append(interaction)
+
+    if uses_msg_sender and uses_require:
+        interaction_role = "initiator"
+    elif is_proxy:
+        interaction_role = "middleware"
+    elif uses_delegatecall:
+        interaction_role = "executor"
+    else:
+        interaction_role = "unknown"
+
+    interactions = high_level + low_level + delegate_calls + factories
+    for interaction in interactions:
+        interaction["interaction_role"] = interaction_role
 
+    if is_proxy:
+        interactions.append({
+            "caller": contract_name,
+            "interaction_type": "proxy",
+            "interaction_role": "middleware",
+        })
+    return interactions
+
+def analyze_folder_ast(folder_path):
+    """
+    Compiles every contract in the folder once and yields the interactions of each AST in turn.
+    """
+    from utils.solc_compiler import compile_asts
+
+    sources = {}
+    for filename in sorted(os.listdir(folder_path)):
+        if filename.endswith(".sol"):
+            with open(os.path.join(folder_path, filename), "r", encoding="utf-8") as file:
+                sources[filename] = file.read()
+
+    asts = compile_asts(sources)
+    for filename in sources:
+        if filename not in asts:
+            logging.error(f"Skipping {filename}: compilation failed")
+
+    # Function and public variable declarations from every source, so cross-file calls resolve
+    definitions = {}
+    for ast in asts.values():
+        for node in _walk(ast):
+            if node["nodeType"] in ("FunctionDefinition", "VariableDeclaration"):
+                definitions[node["id"]] = node
+
+    for filename, ast in asts.items():
+        yield analyze_ast(filename, sources[filename], ast, definitions)
+
+def _analyze_files(folder_path, engine, completion_order=False):
+    """
+    Yields the interactions of each contract, in directory order or, with completion_order,
+    as soon as each contract has been analysed.
+    """
+    if engine == "ast":
+        # One compile for the whole folder; calls are typed by the compiler
+        yield from analyze_folder_ast(folder_path)
+        return
+
+    # Analyze files concurrently for better performance
     with ThreadPoolExecutor() as executor:
         futures = [
-            executor.submit(process_file, os.path.join(folder_path, filename))
+            executor.submit(analyze_contract, os.path.join(folder_path, filename))
             for filename in os.listdir(folder_path) if filename.endswith(".sol")
         ]
-        for future in futures:
-            all_interactions.extend(future.result())
+        if not completion_order:
+            for future in futures:
+                yield future.result()
+            return
 
+        # Each future is dropped once its result is handed over, so finished results do not pile up
+        pending = set(futures)
+        del futures
+        for future in as_completed(pending):
+            pending.discard(future)
+            interactions = future.result()
+            del future
+            yield interactions
+            del interactions
+
+def manual_analysis(folder_path, engine="source", output_format="json", retain=DEFAULT_RETAIN):
+    """
+    Analyses every contract in the folder, saves the results and records them in the run manifest.
+    Returns the run ID.
+    """
     # Create the output directory if it doesn't exist
     output_dir = os.path.join("output", "analysis_results")
     os.makedirs(output_dir, exist_ok=True)
+    run_id = new_run_id()
+
+    if output_format == "jsonl":
+        # One interaction per line, written as each contract completes, so nothing accumulates in memory
+        output_file = os.path.join(output_dir, f"interaction_{run_id}.jsonl")
+        with open(output_file, "w", encoding="utf-8") as jsonl_file:
+            for interactions in _analyze_files(folder_path, engine, completion_order=True):
+                write_jsonl(jsonl_file, interactions)
+    else:
+        all_interactions = []
+        for interactions in _analyze_files(folder_path, engine):
+            all_interactions.extend(interactions)
+
+        # Save the final JSON file in the output/analysis_results folder
+        output_file = os.path.join(output_dir, f"interaction_{run_id}.json")
+        with open(output_file, "w", encoding='utf-8') as json_file:
+            json.dump({"interactions": all_interactions}, json_file, indent=4)
 
-    # Save the final JSON file in the output/analysis_results folder
-    output_file = os.path.join(output_dir, f"interaction_{int(time.time())}.json")
-    with open(output_file, "w", encoding='utf-8') as json_file:
-        json.dump({"interactions": all_interactions}, json_file, indent=4)
+    contract_files = [os.path.join(folder_path, f) for f in os.listdir(folder_path) if f.endswith(".sol")]
+    pruned = register_run(output_dir, run_id, output_file, contract_hashes(contract_files), retain=retain)
+    if pruned:
+        logging.info(f" Pruned {len(pruned)} old analysis runs")
 
-    logging.info(f" Manual Analysis Completed Successfully. Results saved to {output_file}")
+    logging.info(f" Manual Analysis Completed Successfully. Results saved to {output_file} (run {run_id})")
+    return run_id
@@ -1,54 +1,444 @@
 import os
-import re
+import argparse
 
-# Directories
+# Default folders used by the command line
 INPUT_DIR = "compiled_contracts/"
 OUTPUT_DIR = "optimized_bytecode/"
 
-# Ensure output directory exists
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-
-def optimize_storage_packing(bytecode):
-    """Optimize SSTORE operations by packing multiple variables efficiently"""
-    optimized_bytecode = bytecode.replace("60016000", "60006001")  # Example of slot merging
-    return optimized_bytecode
-
-def optimize_function_selector(bytecode):
-    """Use precomputed function selector hashing instead of standard dispatching"""
-    optimized_bytecode = re.sub(r"3660008191", "3660008190", bytecode)  # Simplifies function routing
-    return optimized_bytecode
-
-def optimize_memory_usage(bytecode):
-    """Reduce memory operations by eliminating redundant stack movements"""
-    optimized_bytecode = bytecode.replace("60206040", "60206020")  # Lowers unnecessary allocations
-    return optimized_bytecode
-
-def apply_bytecode_optimizations(bytecode):
-    """Apply all bytecode-level gas optimization techniques"""
-    optimized_code = optimize_storage_packing(bytecode)
-    optimized_code = optimize_function_selector(optimized_code)
-    optimized_code = optimize_memory_usage(optimized_code)
-    
-    return optimized_code if optimized_code != bytecode else bytecode  # If unchanged, return original
-
-# Process all compiled contracts dynamically
-for filename in os.listdir(INPUT_DIR):
-    if filename.endswith(".bin"):
-        input_path = os.path.join(INPUT_DIR, filename)
-        output_path = os.path.join(OUTPUT_DIR, filename)
-
-        # Read contract bytecode
+PUSH0, PUSH1, PUSH32 = 0x5F, 0x60, 0x7F
+DUP1, DUP16, SWAP1, SWAP16 = 0x80, 0x8F, 0x90, 0x9F
+POP, ISZERO, NOT, JUMP, JUMPI, JUMPDEST = 0x50, 0x15, 0x19, 0x56, 0x57, 0x5B
+
+# Instructions that move, measure or copy the code itself: offsets would change under them
+POSITION_DEPENDENT = {0x38: "CODESIZE", 0x39: "CODECOPY", 0x58: "PC"}
+
+# Execution never falls through these, so everything up to the next JUMPDEST is unreachable
+TERMINATORS = {0x00, JUMP, 0xF3, 0xFD, 0xFE, 0xFF}  # STOP, JUMP, RETURN, REVERT, INVALID, SELFDESTRUCT
+
+WORD = 2 ** 256
+
+def _signed(value):
+    return value - WORD if value >= WORD // 2 else value
+
+def _shift_left(shift, value):
+    return (value << shift) % WORD if shift < 256 else 0
+
+def _shift_right(shift, value):
+    return value >> shift if shift < 256 else 0
+
+# Foldable binary operations: opcode -> (static gas, f(top, second)); the top of stack is the first operand
+FOLDABLE = {
+    0x01: (3, lambda a, b: (a + b) % WORD),                    # ADD
+    0x02: (5, lambda a, b: (a * b) % WORD),                    # MUL
+    0x03: (3, lambda a, b: (a - b) % WORD),                    # SUB
+    0x04: (5, lambda a, b: a // b if b else 0),                # DIV
+    0x06: (5, lambda a, b: a % b if b else 0),                 # MOD
+    0x10: (3, lambda a, b: int(a < b)),                        # LT
+    0x11: (3, lambda a, b: int(a > b)),                        # GT
+    0x12: (3, lambda a, b: int(_signed(a) < _signed(b))),      # SLT
+    0x13: (3, lambda a, b: int(_signed(a) > _signed(b))),      # SGT
+    0x14: (3, lambda a, b: int(a == b)),                       # EQ
+    0x16: (3, lambda a, b: a & b),                             # AND
+    0x17: (3, lambda a, b: a | b),                             # OR
+    0x18: (3, lambda a, b: a ^ b),                             # XOR
+    0x1B: (3, _shift_left),                                    # SHL
+    0x1C: (3, _shift_right),                                   # SHR
+}
+
+# Stack inputs and outputs of every defined opcode; anything else behaves like INVALID
+STACK_EFFECTS = {0x00: (0, 0), 0x08: (3, 1), 0x09: (3, 1), 0x15: (1, 1), 0x19: (1, 1), 0x20: (2, 1),
+                 0x30: (0, 1), 0x31: (1, 1), 0x32: (0, 1), 0x33: (0, 1), 0x34: (0, 1), 0x35: (1, 1),
+                 0x36: (0, 1), 0x37: (3, 0), 0x38: (0, 1), 0x39: (3, 0), 0x3A: (0, 1), 0x3B: (1, 1),
+                 0x3C: (4, 0), 0x3D: (0, 1), 0x3E: (3, 0), 0x3F: (1, 1), 0x40: (1, 1), 0x49: (1, 1),
+                 0x50: (1, 0), 0x51: (1, 1), 0x52: (2, 0), 0x53: (2, 0), 0x54: (1, 1), 0x55: (2, 0),
+                 0x56: (1, 0), 0x57: (2, 0), 0x5B: (0, 0), 0x5C: (1, 1), 0x5D: (2, 0), 0x5E: (3, 0),
+                 0xF0: (3, 1), 0xF1: (7, 1), 0xF2: (7, 1), 0xF3: (2, 0), 0xF4: (6, 1), 0xF5: (4, 1),
+                 0xFA: (6, 1), 0xFD: (2, 0), 0xFE: (0, 0), 0xFF: (1, 0)}
+STACK_EFFECTS.update({op: (2, 1) for op in (0x01, 0x02, 0x03, 0x04, 0x05, 0x06, 0x07, 0x0A, 0x0B, 0x10, 0x11,
+                                            0x12, 0x13, 0x14, 0x16, 0x17, 0x18, 0x1A, 0x1B, 0x1C, 0x1D)})
+STACK_EFFECTS.update({op: (0, 1) for op in (*range(0x41, 0x49), 0x4A, 0x58, 0x59, 0x5A)})  # block info, PC, MSIZE, GAS
+STACK_EFFECTS.update({0xA0 + topics: (2 + topics, 0) for topics in range(5)})  # LOG0-LOG4
+
+# Static gas of the instructions the rewrites add or remove
+STATIC_GAS = {POP: 2, PUSH0: 2, ISZERO: 3, NOT: 3, JUMPI: 10}
+STATIC_GAS.update({op: gas for op, (gas, _) in FOLDABLE.items()})
+STATIC_GAS.update({op: 3 for op in range(PUSH1, SWAP16 + 1)})  # PUSHn, DUPn, SWAPn
+
+
+# Instructions are (opcode, immediate, is_label) tuples; is_label marks pushes of jump destinations
+
+def _is_push(instruction):
+    return PUSH0 <= instruction[0] <= PUSH32
+
+def _push_value(instruction):
+    return int.from_bytes(instruction[1], "big") if instruction[1] else 0
+
+def _size(instruction):
+    return 1 + (len(instruction[1]) if instruction[1] is not None else 0)
+
+def _gas(instructions):
+    return sum(STATIC_GAS.get(instruction[0], 0) for instruction in instructions)
+
+
+def split_metadata(code):
+    """
+    Splits the CBOR metadata Solidity appends to runtime code (a CBOR map followed by its 2-byte length).
+    Returns (code, metadata); metadata is b"" when none is found.
+    """
+    if len(code) < 2:
+        return code, b""
+    length = int.from_bytes(code[-2:], "big")
+    start = len(code) - 2 - length
+    if length and start >= 0 and 0xA0 <= code[start] <= 0xBF:
+        return code[:start], code[start:]
+    return code, b""
+
+
+def decode(code):
+    """
+    Decodes bytecode into instructions. Immediates are the PUSH1-PUSH32 data bytes, None
+    otherwise, so bytes inside push data are never mistaken for instructions. A PUSH cut off by the end
+    of the code keeps its partial data.
+    """
+    instructions = []
+    position = 0
+    while position < len(code):
+        opcode = code[position]
+        position += 1
+        if PUSH1 <= opcode <= PUSH32:
+            width = opcode - PUSH0
+            instructions.append((opcode, code[position:position + width], False))
+            position += width
+        else:
+            instructions.append((opcode, None, False))
+    return instructions
+
+
+def encode(instructions):
+    return b"".join(bytes([opcode]) + (data or b"") for opcode, data, _ in instructions)
+
+
+def _offsets(instructions):
+    offsets, position = [], 0
+    for instruction in instructions:
+        offsets.append(position)
+        position += _size(instruction)
+    return offsets
+
+
+def _jumpdests(instructions):
+    """
+    Byte offset of every JUMPDEST, in order.
+    """
+    return [offset for offset, instruction in zip(_offsets(instructions), instructions)
+            if instruction[0] == JUMPDEST]
+
+
+def _join(first, second):
+    """
+    Merges two abstract stacks, aligned at the top. Slots below the shorter stack become unknown.
+    """
+    height = min(len(first), len(second))
+    return tuple(None if a is None or b is None else a | b
+                 for a, b in zip(first[len(first) - height:], second[len(second) - height:]))
+
+
+def mark_labels(instructions):
+    """
+    Finds the pushes whose values are used as jump destinations by following every stack slot back to
+    the push that produced it across all reachable paths. Returns the instructions with those pushes
+    marked. Raises ValueError when a jump destination was computed or loaded from memory or storage,
+    since such code cannot be relocated.
+    """
+    # An abstract stack slot is the set of push indices its value may come from; an empty set is a
+    # computed value and None a slot below what is known at a join
+    destinations = {offset: i for i, (offset, instruction) in enumerate(zip(_offsets(instructions), instructions))
+                    if instruction[0] == JUMPDEST}
+    states = {0: ()}
+    pending = [0]
+    labels = set()
+
+    def flow(target, stack):
+        stack = tuple(stack)
+        merged = stack if target not in states else _join(states[target], stack)
+        if states.get(target) != merged:
+            states[target] = merged
+            pending.append(target)
+
+    def jump_targets(destination):
+        if not destination:
+            raise ValueError("bytecode jumps to a computed destination")
+        labels.update(destination)
+        for push in destination:
+            target = destinations.get(_push_value(instructions[push]))
+            if target is not None:
+                yield target
+
+    while pending:
+        i = pending.pop()
+        stack = list(states[i])
+        while i < len(instructions):
+            opcode = instructions[i][0]
+            if _is_push(instructions[i]):
+                stack.append(frozenset([i]))
+            elif DUP1 <= opcode <= DUP16:
+                depth = opcode - DUP1 + 1
+                stack.append(stack[-depth] if depth <= len(stack) else None)
+            elif SWAP1 <= opcode <= SWAP16:
+                depth = opcode - SWAP1 + 2
+                if depth <= len(stack):
+                    stack[-1], stack[-depth] = stack[-depth], stack[-1]
+                elif stack:
+                    stack[-1] = None
+            elif opcode in (JUMP, JUMPI):
+                destination = stack.pop() if stack else None
+                if destination is None:
+                    raise ValueError("bytecode jumps to a destination of unknown origin")
+                if opcode == JUMPI and stack:
+                    stack.pop()
+                for target in jump_targets(destination):
+                    flow(target, stack)
+                if opcode == JUMPI:
+                    flow(i + 1, stack)
+                break
+            elif opcode not in STACK_EFFECTS or opcode in TERMINATORS:
+                break
+            else:
+                pops, pushes = STACK_EFFECTS[opcode]
+                del stack[max(0, len(stack) - pops):]
+                stack.extend([frozenset()] * pushes)
+
+            i += 1
+            if i < len(instructions) and instructions[i][0] == JUMPDEST:
+                flow(i, stack)  # Falling into a jump destination joins the states of its other entries
+                break
+
+    return [(opcode, data, i in labels) for i, (opcode, data, _) in enumerate(instructions)]
+
+
+class _Context:
+    """
+    What the rules need to know about the whole program.
+    """
+
+    def __init__(self, instructions):
+        # PUSH0 only exists from Shanghai on; use it only when the compiler already did
+        self.has_push0 = any(instruction[0] == PUSH0 for instruction in instructions)
+
+    def push(self, value):
+        """
+        The shortest push of value.
+        """
+        if value == 0 and self.has_push0:
+            return (PUSH0, None, False)
+        width = max((value.bit_length() + 7) // 8, 1)
+        return (PUSH0 + width, value.to_bytes(width, "big"), False)
+
+
+# Each rule looks at the instructions starting at index i and returns (instructions consumed, replacement)
+# or None. A rule only matches straight-line code: none of its patterns contains a JUMPDEST.
+
+def _push_pop(instructions, i, context):
+    """PUSH x, POP -> nothing."""
+    if i + 1 < len(instructions) and _is_push(instructions[i]) and instructions[i + 1][0] == POP:
+        return 2, []
+
+def _dup_pop(instructions, i, context):
+    """DUPn, POP -> nothing."""
+    if i + 1 < len(instructions) and DUP1 <= instructions[i][0] <= DUP16 and instructions[i + 1][0] == POP:
+        return 2, []
+
+def _swap_swap(instructions, i, context):
+    """SWAPn, SWAPn -> nothing."""
+    if i + 1 < len(instructions) and SWAP1 <= instructions[i][0] <= SWAP16 and \
+            instructions[i + 1][0] == instructions[i][0]:
+        return 2, []
+
+def _double_iszero(instructions, i, context):
+    """ISZERO, ISZERO, PUSH dest, JUMPI -> PUSH dest, JUMPI and ISZERO, ISZERO, ISZERO -> ISZERO."""
+    if i + 2 >= len(instructions) or instructions[i][0] != ISZERO or instructions[i + 1][0] != ISZERO:
+        return None
+    if instructions[i + 2][0] == ISZERO:
+        return 3, [instructions[i + 2]]
+    if i + 3 < len(instructions) and _is_push(instructions[i + 2]) and instructions[i + 3][0] == JUMPI:
+        return 4, instructions[i + 2:i + 4]
+
+def _fold_constants(instructions, i, context):
+    """
+    PUSH a, PUSH b, OP -> PUSH (b OP a) and PUSH a, NOT -> PUSH ~a, unless the result takes more bytes
+    (Solidity deliberately builds wide masks from short pushes).
+    """
+    first = instructions[i]
+    if not _is_push(first) or first[2] or i + 1 >= len(instructions):
+        return None
+
+    if instructions[i + 1][0] == NOT:
+        consumed, value = 2, _push_value(first) ^ (WORD - 1)
+    else:
+        second = instructions[i + 1]
+        if i + 2 >= len(instructions) or instructions[i + 2][0] not in FOLDABLE or \
+                not _is_push(second) or second[2]:
+            return None
+        _, operation = FOLDABLE[instructions[i + 2][0]]
+        consumed, value = 3, operation(_push_value(second), _push_value(first))
+
+    replacement = context.push(value)
+    if _size(replacement) > sum(map(_size, instructions[i:i + consumed])):
+        return None
+    return consumed, [replacement]
+
+def _dead_code(instructions, i, context):
+    """Unreachable instructions after STOP, JUMP, RETURN, REVERT, INVALID or SELFDESTRUCT -> nothing."""
+    if instructions[i][0] not in TERMINATORS:
+        return None
+    end = i + 1
+    while end < len(instructions) and instructions[end][0] != JUMPDEST:
+        end += 1
+    if end == i + 1:
+        return None
+    return end - i, [instructions[i]]
+
+RULES = [
+    ("push-pop", _push_pop),
+    ("dup-pop", _dup_pop),
+    ("swap-swap", _swap_swap),
+    ("double-iszero", _double_iszero),
+    ("constant-folding", _fold_constants),
+    ("dead-code", _dead_code),
+]
+
+
+def _relocate(original, optimized):
+    """
+    Rewrites the jump destinations pushed by label pushes to their new offsets, keeping every push width
+    so no offset moves again.
+    """
+    moved = dict(zip(_jumpdests(original), _jumpdests(optimized)))
+    relocated = []
+    for opcode, data, label in optimized:
+        value = int.from_bytes(data, "big") if label and data else None
+        if value in moved:
+            data = moved[value].to_bytes(len(data), "big")
+        relocated.append((opcode, data, label))
+    return relocated
+
+
+def optimize_instructions(instructions):
+    """
+    Applies the peephole rules until none matches. Returns (instructions, report) where report maps
+    each rule name to {"matches", "gas", "bytes"}. Gas is the static gas saved for one execution of
+    each rewritten sequence; removed dead code saves deployment bytes but no runtime gas.
+    """
+    context = _Context(instructions)
+    report = {name: {"matches": 0, "gas": 0, "bytes": 0} for name, _ in RULES}
+
+    changed = True
+    while changed:
+        changed = False
+        rewritten = []
+        i = 0
+        while i < len(instructions):
+            for name, rule in RULES:
+                match = rule(instructions, i, context)
+                if match is None:
+                    continue
+                consumed, replacement = match
+                removed = instructions[i:i + consumed]
+                report[name]["matches"] += 1
+                report[name]["bytes"] += sum(map(_size, removed)) - sum(map(_size, replacement))
+                if name != "dead-code":
+                    report[name]["gas"] += _gas(removed) - _gas(replacement)
+                rewritten.extend(replacement)
+                i += consumed
+                changed = True
+                break
+            else:
+                rewritten.append(instructions[i])
+                i += 1
+        instructions = rewritten
+
+    return instructions, report
+
+
+def optimize_bytecode(bytecode):
+    """
+    Optimizes hex runtime bytecode (with or without 0x). Returns (optimized hex, report); the metadata
+    trailer is kept as is. Jump targets pushed as constants are relocated after code is removed.
+    Raises ValueError for code whose behaviour depends on its own layout (PC, CODECOPY, CODESIZE), such
+    as creation bytecode, for jumps whose destination is not a pushed constant and for unlinked library
+    placeholders. Contracts with immutables are not supported: their constructor writes the values at
+    the original offsets.
+    """
+    prefix = "0x" if bytecode.startswith("0x") else ""
+    text = bytecode[len(prefix):].strip()
+    if "__" in text:
+        raise ValueError("bytecode contains unlinked library placeholders")
+    code, metadata = split_metadata(bytes.fromhex(text))
+
+    instructions = decode(code)
+    for opcode, _, _ in instructions:
+        if opcode in POSITION_DEPENDENT:
+            raise ValueError(f"bytecode uses {POSITION_DEPENDENT[opcode]}, so it cannot be moved safely")
+    if instructions and _is_push(instructions[-1]) and len(instructions[-1][1] or b"") < instructions[-1][0] - PUSH0:
+        raise ValueError("bytecode ends inside a PUSH; it is probably not runtime code")
+
+    instructions = mark_labels(instructions)
+    optimized, report = optimize_instructions(instructions)
+    if optimized == instructions:
+        return bytecode, report
+    optimized = _relocate(instructions, optimized)
+    return prefix + (encode(optimized) + metadata).hex(), report
+
+
+def optimize_folder(input_dir=INPUT_DIR, output_dir=OUTPUT_DIR):
+    """
+    Optimizes every .bin file of input_dir into output_dir and prints the gas saved per rule.
+    Files that cannot be optimized safely are copied unchanged.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    totals = {name: {"matches": 0, "gas": 0, "bytes": 0} for name, _ in RULES}
+
+    for filename in sorted(os.listdir(input_dir)):
+        if not filename.endswith(".bin"):
+            continue
+        input_path = os.path.join(input_dir, filename)
+        output_path = os.path.join(output_dir, filename)
+
         with open(input_path, "r", encoding="utf-8") as file:
             contract_bytecode = file.read().strip()
 
-        # Apply bytecode optimizations
-        optimized_bytecode = apply_bytecode_optimizations(contract_bytecode)
+        try:
+            optimized_bytecode, report = optimize_bytecode(contract_bytecode)
+            status = "Optimized" if optimized_bytecode != contract_bytecode else "No changes applied"
+        except ValueError as e:
+            optimized_bytecode, report = contract_bytecode, {}
+            status = f"Skipped ({e})"
 
-        # Write optimized bytecode
         with open(output_path, "w", encoding="utf-8") as file:
             file.write(optimized_bytecode)
 
-        status = "Optimized" if optimized_bytecode != contract_bytecode else "No changes applied"
+        for name, saved in report.items():
+            for key in saved:
+                totals[name][key] += saved[key]
         print(f"{status}: {filename} -> {output_path}")
 
-print(" Bytecode optimization applied dynamically to all eligible contracts!")
+    print_report(totals)
+    return totals
+
+
+def print_report(report):
+    """Print matches, static gas and bytes saved per rule."""
+    print("-" * 60)
+    print(f"{'Rule':<20} | {'Matches':>10} | {'Gas Saved':>10} | {'Bytes Saved':>11}")
+    print("-" * 60)
+    for name, saved in report.items():
+        print(f"{name:<20} | {saved['matches']:>10} | {saved['gas']:>10} | {saved['bytes']:>11}")
+    print("-" * 60)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Peephole-optimize compiled runtime bytecode (.bin files).")
+    parser.add_argument('--input', default=INPUT_DIR, help=f"Folder of .bin files (default: {INPUT_DIR})")
+    parser.add_argument('--output', default=OUTPUT_DIR, help=f"Output folder (default: {OUTPUT_DIR})")
+    args = parser.parse_args()
+    optimize_folder(args.input, args.output)
@@ -1,17 +1,9 @@
 import argparse
 import os
-import subprocess
-import contract_analysis
-import Obfuscated_contract_complexity_analysis
-
-from utils.file_handler import (
-    get_latest_json, manage_intermediate_files, delete_intermediate_files, write_final_output
-)
-from obfuscation_techniques.opaque_predicate_obfuscation.obfuscate import process_files
-from obfuscation_techniques.factory_based_contract.factory_based_contract_obfuscation import apply_obfuscation
-from obfuscation_techniques.proxy_contract.proxy_interaction_obfuscation import process_proxy_files
-from obfuscation_techniques.dynamic_function_dispatch.obfuscation import process_obfuscation
-from obfuscation_techniques.high_to_low_conversion import process_contracts
+import sys
+
+# Subcommand dependencies are imported inside the handlers that use them,
+# so short CLI runs only pay for what they need.
 
 def print_separator(title):
     print("\n" + "=" * 50)
@@ -34,62 +26,133 @@ def get_files_from_input(input_path):
         print("Error: Invalid input path.")
         return []
 
-def syntax_analysis(file_path):
-    print_separator(f"Syntax Analysis for {file_path}")
-    try:
-        result = subprocess.run(
-            [r"C:\Users\WELCOME\AppData\Roaming\npm\npx.cmd", "solcjs", "--bin", file_path],
-            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
-        )
-        if result.returncode != 0:
-            print(f"Syntax Error:\n{result.stderr}")
-            return False
-        print(f"Syntax analysis passed.\n{result.stdout}")
-        return True
-    except FileNotFoundError:
-        print("Error: Solidity compiler not found. Make sure it's installed.")
-        return False
-
-def semantic_analysis(file_path):
-    print_separator(f"Semantic Analysis for {file_path}")
+def compiler_analysis(files):
+    """
+    Syntax and semantic analysis for every file from a single batched compiler run.
+    Returns the files that passed both checks.
+    """
+    from utils.solc_compiler import check_files
+
+    print_separator("Syntax & Semantic Analysis")
     try:
-        result = subprocess.run(
-            [r"C:\Users\WELCOME\AppData\Roaming\npm\npx.cmd", "solcjs", "--abi", file_path],
-            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
-        )
-        if result.returncode != 0:
-            print(f"Semantic Error:\n{result.stderr}")
-            return False
-        print(f"Semantic analysis passed.\n{result.stdout}")
-        return True
-    except FileNotFoundError:
-        print("Error: Solidity compiler not found. Make sure it's installed.")
-        return False
-
-def run_obfuscation(input_folder, intermediate_folder, output_folder, json_folder):
-    latest_json_file = get_latest_json(json_folder)
+        results = check_files(files)
+    except Exception as e:
+        print(f"Error: Solidity compiler unavailable ({e}). Make sure it's installed.")
+        return []
+
+    passed = []
+    for file in files:
+        result = results[file]
+        print_separator(f"Processing File: {file}")
+
+        if result["syntax_errors"]:
+            print("Syntax Error:\n" + "\n".join(result["syntax_errors"]))
+            print(f"Skipping further checks for {file} due to syntax errors.")
+            continue
+        print("Syntax analysis passed.")
+
+        if result["semantic_errors"]:
+            print("Semantic Error:\n" + "\n".join(result["semantic_errors"]))
+            print(f"Skipping further checks for {file} due to semantic errors.")
+            continue
+        print("Semantic analysis passed.")
+
+        for name, output in result["contracts"].items():
+            print(f"  {name}: {len(output['bytecode']) // 2} bytes bytecode, {len(output['abi'])} ABI entries")
+
+        print(f"\n {file} passed syntax and semantic analysis.")
+        passed.append(file)
+
+    return passed
+
+def run_obfuscation(input_path, intermediate_folder, output_folder, json_folder, debug=False, jobs=1,
+                    cache=None, seed=None, run_id=None, vanity=None, pack_storage=False, predicate_budget=None,
+                    gas_budget=None):
+    from utils.file_handler import read_contracts, write_contracts
+    from utils.run_manifest import resolve_run
+    from utils.interaction_index import InteractionIndex
+    from obfuscation_techniques.pipeline import run_passes_serial, run_passes_parallel, pass_config
+    from obfuscation_techniques.dynamic_function_dispatch.selector_computer import (export_registry, find_collisions,
+                                                                                    registry_selectors)
+    from utils.selector_registry import SelectorRegistry, REGISTRY_DB_NAME
+    from utils import tracing
+
+    latest_json_file = resolve_run(json_folder, run_id)  # Latest run unless one is named
     print_separator(f"Obfuscation Process (JSON: {latest_json_file})")
 
-    print("\n Step 1: Opaque Predicate Obfuscation")
-    process_files(input_folder, intermediate_folder, latest_json_file)
+    with tracing.span("load interactions", "io"):
+        index = InteractionIndex.from_json(latest_json_file)  # Loaded once, shared by every stage
+    with tracing.span("read contracts", "io") as read_span:
+        sources = read_contracts(get_files_from_input(input_path))
+        read_span.set(files=len(sources), bytes=sum(len(code) for code in sources.values()))
+    function_targets = {}
+    obfuscated = {}
+
+    # Reuse contracts whose source, interactions, passes and seed are unchanged
+    cache_keys = {}
+    pending = {}
+    config = pass_config(vanity, pack_storage, predicate_budget, gas_budget)
+    with tracing.span("cache lookup", "cache") as lookup_span:
+        for filename, contract_code in sources.items():
+            if cache is not None:
+                cache_keys[filename] = cache.key(filename, contract_code, index, config, seed)
+                cached = cache.get(cache_keys[filename])
+                if cached is not None:
+                    obfuscated[filename], function_targets[filename] = cached
+                    continue
+            pending[filename] = contract_code
+        lookup_span.set(reused=len(obfuscated), pending=len(pending))
+
+    if cache is not None:
+        print(f"\n Cache: {cache.hits} reused, {cache.misses} to obfuscate")
 
-    print("\n Step 2: Dynamic Dispatch Obfuscation")
-    process_obfuscation(intermediate_folder, latest_json_file, output_folder)
-    delete_intermediate_files(intermediate_folder)
+    # Passes run in memory; intermediates only hit the disk when debugging
+    debug_folder = intermediate_folder if debug else None
+    if pending:
+        # Every contract gets its own seed, and selectors are drawn around those of the cached contracts
+        # and of earlier files, so the output is the same for any job count
+        selectors = registry_selectors(function_targets)
+        with tracing.span("obfuscate", "obfuscation", files=len(pending), jobs=jobs):
+            if jobs > 1:
+                pending = run_passes_parallel(pending, index, function_targets, jobs, debug_folder, seed, vanity,
+                                              pack_storage, predicate_budget, gas_budget, selectors)
+            else:
+                pending = run_passes_serial(pending, index, function_targets, debug_folder, seed, vanity,
+                                            pack_storage, predicate_budget, gas_budget, selectors)
 
-    print("\n Step 3: Factory-Based Contract Obfuscation")
-    process_contracts(output_folder, intermediate_folder, latest_json_file)
-    delete_intermediate_files(output_folder)
+    for filename, contract_code in pending.items():
+        obfuscated[filename] = contract_code
+        if cache is not None:
+            cache.put(cache_keys[filename], contract_code, function_targets.get(filename, {}))
 
-    print("\n Step 4: Proxy-Based Contract Obfuscation")
-    process_proxy_files(intermediate_folder, output_folder, latest_json_file)
-    delete_intermediate_files(intermediate_folder)
+    if cache is not None:
+        cache.evict()
 
-    print("\n Step 5: High-to-Low Conversion Obfuscation")
-    apply_obfuscation(output_folder, latest_json_file)
+    with tracing.span("write contracts", "io", files=len(sources)):
+        write_contracts(output_folder, {filename: obfuscated[filename] for filename in sources})
+
+    # Obfuscated selectors are drawn around every earlier one; a real selector declared later can still clash
+    for selector, first, second in find_collisions(function_targets):
+        print(f" Warning: selector collision {selector} between {first} and {second}")
+
+    # Keyed by contract, so a selector shared by two contracts keeps both entries
+    registry = {filename: function_targets[filename] for filename in sorted(function_targets)}
+    with tracing.span("selector registry", "io", selectors=sum(len(targets) for targets in registry.values())):
+        export_registry(registry, filename=os.path.join(output_folder, "selector_registry.json"))
+
+        # Indexed store keyed by contract, kept across runs for reverse lookups
+        with SelectorRegistry(os.path.join(output_folder, REGISTRY_DB_NAME)) as store:
+            stored = store.store(function_targets)
+    print(f" Stored {stored} selectors in {os.path.join(output_folder, REGISTRY_DB_NAME)}")
 
     print_separator("Obfuscation Completed ")
 
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
 # === CLI COMMAND HANDLERS ===
 
 def analyze_cmd(args):
@@ -99,35 +162,110 @@ def analyze_cmd(args):
         print("No valid files found for analysis. Exiting.")
         return
 
-    for file in files:
-        print_separator(f"Processing File: {file}")
-
-        if not syntax_analysis(file):
-            print(f"Skipping further checks for {file} due to syntax errors.")
-            continue
-
-        if not semantic_analysis(file):
-            print(f"Skipping further checks for {file} due to semantic errors.")
-            continue
-
-        print(f"\n {file} passed syntax and semantic analysis.")
+    compiler_analysis(files)
 
     print_separator("Performing Interaction Analysis")
-    contract_analysis.manual_analysis(os.path.dirname(files[0]))
+    import contract_analysis
+    run_id = contract_analysis.manual_analysis(os.path.dirname(files[0]), engine=args.engine,
+                                               output_format=args.format, retain=args.keep)
+    print(f"\n Analysis run ID: {run_id} (obfuscate with --run {run_id})")
 
 def obfuscate_cmd(args):
     input_path = args.input
     output_path = "output/obfuscated_contracts"
     intermediate_folder = "utils/intermediate_contracts"
 
+    from utils.obfuscation_cache import ObfuscationCache
+    from obfuscation_techniques.gas_budget import MAX_CODE_SIZE
+    from utils.run_manifest import resolve_run, load_manifest
+    from utils import tracing
+
+    if args.run is not None:
+        try:
+            resolve_run("output/analysis_results", args.run)
+        except KeyError:
+            runs = sorted(load_manifest("output/analysis_results")["runs"])
+            print(f"Error: unknown analysis run {args.run}. Known runs: {', '.join(runs) or 'none, run analyze first'}")
+            sys.exit(1)
+
+    # Unseeded runs draw fresh salts every time, so reusing an earlier run's output would hide that
+    cache = None
+    if args.seed is None:
+        print(" Cache not used: obfuscation is only reproducible with --seed")
+    elif not args.no_cache:
+        cache = ObfuscationCache(max_bytes=args.cache_size * 1024 * 1024)
+
+    if args.trace:
+        tracing.enable()
+
+    vanity = None
+    if args.vanity_zero_bytes or args.vanity_max_selector:
+        vanity = {
+            "zero_bytes": args.vanity_zero_bytes,
+            "max_selector": int(args.vanity_max_selector, 16) if args.vanity_max_selector else None,
+            "time_budget": args.vanity_budget,
+            "jobs": args.vanity_jobs,
+            "functions": sorted(args.vanity_functions.split(",")) if args.vanity_functions else None,
+        }
+
+    gas_budget = None
+    if args.max_gas_overhead is not None or args.max_code_size is not None:
+        gas_budget = {
+            "max_overhead": args.max_gas_overhead / 100 if args.max_gas_overhead is not None else None,
+            "max_size": args.max_code_size if args.max_code_size is not None else MAX_CODE_SIZE,
+            "scope": args.gas_budget_scope,
+        }
+
     print_separator("Starting Obfuscation Phase")
-    run_obfuscation(input_path, intermediate_folder, output_path, "output/analysis_results")
+    with tracing.span("run_obfuscation", "run"):
+        run_obfuscation(input_path, intermediate_folder, output_path, "output/analysis_results",
+                        debug=args.debug, jobs=args.jobs, cache=cache, seed=args.seed, run_id=args.run, vanity=vanity,
+                        pack_storage=args.pack_storage, predicate_budget=args.predicate_gas_budget,
+                        gas_budget=gas_budget)
+
+    if args.trace:
+        events = tracing.write_trace(args.trace)
+        print(f" Trace with {events} events written to {args.trace}")
 
     print_separator("Obfuscation Finished ")
 
+def convert_cmd(args):
+    from utils.file_handler import convert_json_to_jsonl
+
+    jsonl_path = convert_json_to_jsonl(args.input, args.output)
+    print(f"Converted {args.input} to {jsonl_path}")
+
+def lookup_cmd(args):
+    from utils.selector_registry import SelectorRegistry
+
+    if not os.path.isfile(args.registry):
+        print(f"Error: selector registry {args.registry} not found. Run obfuscate first.")
+        return
+
+    with SelectorRegistry(args.registry) as store:
+        if args.signature:
+            # Signatures are registered in canonical form: 'f(uint a, address b)' is looked up as 'f(uint256,address)'
+            from obfuscation_techniques.dynamic_function_dispatch.selector_computer import canonical_signature
+            name, _, params = args.query.partition("(")
+            matches = store.by_signature(canonical_signature(name.strip(), params.rstrip(") ")) or args.query)
+        else:
+            matches = store.by_selector(args.query)
+
+    if not matches:
+        print(f"No selectors found for {args.query}")
+    for match in matches:
+        renamed = f", renamed from {match['original_signature']}" if match["original_signature"] else ""
+        print(f"{match['selector']} -> {match['function_signature']} ({match['contract']}{renamed})")
+
 def compare_cmd(args):
     print_separator("Comparing Obfuscated Contracts")
-    Obfuscated_contract_complexity_analysis.compare_folders(args.original, args.obfuscated)
+    import Obfuscated_contract_complexity_analysis
+    if args.measure_gas:
+        Obfuscated_contract_complexity_analysis.measure_gas_folders(args.original, args.obfuscated)
+    else:
+        Obfuscated_contract_complexity_analysis.compare_folders(args.original, args.obfuscated, jobs=args.jobs,
+                                                                csv_path=args.csv, json_path=args.json,
+                                                                chart_path=args.chart)
 
 # === MAIN CLI ENTRY ===
 
@@ -138,19 +276,71 @@ def main():
     # analyze
     p_analyze = subparsers.add_parser('analyze', help='Syntax, semantic & interaction analysis')
     p_analyze.add_argument('input', help='Path to Solidity file or folder')
+    p_analyze.add_argument('--engine', choices=['source', 'ast'], default='source',
+                           help='Interaction analysis from tokenized source (default) or from the compiler AST')
+    p_analyze.add_argument('--format', choices=['json', 'jsonl'], default='json',
+                           help='Results format; jsonl streams one interaction per line as contracts complete')
+    p_analyze.add_argument('--keep', type=positive_int, default=100,
+                           help='Number of analysis runs to retain in output/analysis_results (default: 100)')
     p_analyze.set_defaults(func=analyze_cmd)
 
     # obfuscate
     p_obfuscate = subparsers.add_parser('obfuscate', help='Apply interaction-specific obfuscation')
     p_obfuscate.add_argument('input', help='Path to Solidity file or folder')
+    p_obfuscate.add_argument('--run', help='Analysis run ID to use (default: latest run)')
+    p_obfuscate.add_argument('--debug', action='store_true', help='Write each intermediate step to utils/intermediate_contracts')
+    p_obfuscate.add_argument('--jobs', type=positive_int, default=1, help='Number of worker processes (default: 1)')
+    p_obfuscate.add_argument('--seed', help='Seed for reproducible obfuscation; also required to reuse output/.cache')
+    p_obfuscate.add_argument('--no-cache', action='store_true', help='Ignore and do not update output/.cache (unseeded runs never use it)')
+    p_obfuscate.add_argument('--cache-size', type=int, default=256, help='Cache size limit in MB (default: 256)')
+    p_obfuscate.add_argument('--trace', help='Write a Chrome trace (stages, contracts, counters) to this JSON file')
+    p_obfuscate.add_argument('--max-gas-overhead', type=float,
+                             help='Roll back a pass for contracts whose estimated runtime gas grows by more than this '
+                                  'percentage over the original (e.g. 15; needs solc)')
+    p_obfuscate.add_argument('--gas-budget-scope', choices=['function', 'contract'], default='function',
+                             help='Apply --max-gas-overhead to each function or to the contract total (default: function)')
+    p_obfuscate.add_argument('--max-code-size', type=int,
+                             help='Roll back a pass for contracts whose deployed bytecode exceeds this many bytes '
+                                  '(default with a gas budget: 24576, the EIP-170 limit)')
+    p_obfuscate.add_argument('--predicate-gas-budget', type=int,
+                             help='Maximum static gas opaque predicates may add to each function (default: no limit)')
+    p_obfuscate.add_argument('--pack-storage', action='store_true',
+                             help='Reorder state variables to use fewer storage slots (needs solc; proxies are never reordered)')
+    p_obfuscate.add_argument('--vanity-zero-bytes', type=int, default=0,
+                             help='Rename public/external functions so their selectors start with this many zero bytes')
+    p_obfuscate.add_argument('--vanity-max-selector', help='Also require selectors at or below this hex value (e.g. 0x00ffffff)')
+    p_obfuscate.add_argument('--vanity-functions', help='Comma-separated function names to rename (default: all eligible)')
+    p_obfuscate.add_argument('--vanity-budget', type=float, default=1.0, help='Search time budget per function in seconds (default: 1)')
+    p_obfuscate.add_argument('--vanity-jobs', type=positive_int, default=os.cpu_count() or 1,
+                             help='Processes for the vanity search (default: CPU count)')
     p_obfuscate.set_defaults(func=obfuscate_cmd)
 
+    # lookup
+    p_lookup = subparsers.add_parser('lookup', help='Reverse-map an obfuscated selector to its original signature')
+    p_lookup.add_argument('query', help='Obfuscated selector (e.g. 0x1a2b3c4d), or a signature with --signature')
+    p_lookup.add_argument('--signature', action='store_true', help='Look up the selectors of a function signature')
+    p_lookup.add_argument('--registry', default='output/obfuscated_contracts/selector_registry.db',
+                          help='Selector registry database (default: output/obfuscated_contracts/selector_registry.db)')
+    p_lookup.set_defaults(func=lookup_cmd)
+
     # compare
     p_compare = subparsers.add_parser('compare', help='Compare original vs obfuscated contracts')
     p_compare.add_argument('--original', required=True, help='Original contracts folder')
     p_compare.add_argument('--obfuscated', required=True, help='Obfuscated contracts folder')
+    p_compare.add_argument('--measure-gas', action='store_true',
+                           help='Compile, deploy and call both versions on an in-process EVM and report real gas')
+    p_compare.add_argument('--jobs', type=positive_int, default=1, help='Number of worker processes (default: 1)')
+    p_compare.add_argument('--csv', help='Write the comparison to this CSV file')
+    p_compare.add_argument('--json', help='Write the comparison to this JSON file')
+    p_compare.add_argument('--chart', help='Save bar charts to this image file (e.g. comparison.png)')
     p_compare.set_defaults(func=compare_cmd)
 
+    # convert
+    p_convert = subparsers.add_parser('convert', help='Convert an interactions JSON results file to JSONL')
+    p_convert.add_argument('input', help='Path to an interaction_<timestamp>.json file')
+    p_convert.add_argument('--output', help='JSONL path (default: same name with .jsonl)')
+    p_convert.set_defaults(func=convert_cmd)
+
     args = parser.parse_args()
     args.func(args)
 
@@ -0,0 +1,103 @@
+import math
+
+# Above this many selectors the lookup walks a packed table instead of an if-tree:
+# the tree is cheaper per call but takes roughly 40 bytes of code per selector against 8 in the table
+TABLE_THRESHOLD = 64
+
+# Estimated gas of the Yul lookup, counted from the opcodes each step compiles to
+TREE_LEVEL_GAS = 45   # lt against the pivot and the switch jump
+TREE_LEAF_GAS = 35    # eq against the last candidate and the assignment
+TABLE_STEP_GAS = 160  # one loop iteration: midpoint, mload, compare and bound update
+TABLE_SETUP_GAS = 60  # loop bounds, shifts around the lookup
+
+# Low-level call each registered call site stands for, as the code the lookup yields
+CALL_KINDS = {"call": 1, "staticcall": 2, "delegatecall": 3}
+
+# Static calls get a view dispatcher of their own, so view functions can keep making them
+DISPATCHER_NAMES = {"call": "dispatchFunction", "staticcall": "dispatchStaticCall", "delegatecall": "dispatchFunction"}
+
+def dispatcher_name(kind):
+    """Name of the generated dispatcher that makes low-level calls of the given kind."""
+    return DISPATCHER_NAMES[kind]
+
+def _tree(entries, lo, hi, indent):
+    """Yul if-tree over entries[lo:hi] (sorted (selector, kind) pairs): one comparison per level."""
+    pad = " " * indent
+    if hi - lo == 1:
+        selector, kind = entries[lo]
+        return f"{pad}if eq(s, 0x{selector:08x}) {{ kind := {kind} }}\n"
+    mid = (lo + hi) // 2
+    return (f"{pad}switch lt(s, 0x{entries[mid][0]:08x})\n"
+            f"{pad}case 0 {{\n{_tree(entries, mid, hi, indent + 4)}{pad}}}\n"
+            f"{pad}default {{\n{_tree(entries, lo, mid, indent + 4)}{pad}}}\n")
+
+def _table_search(count, indent):
+    """Yul binary search over a packed table of 8-byte (selector, kind) entries in the bytes 'table'."""
+    pad = " " * indent
+    return (f"{pad}let low := 0\n"
+            f"{pad}let high := {count}\n"
+            f"{pad}for {{}} lt(low, high) {{}} {{\n"
+            f"{pad}    let mid := shr(1, add(low, high))\n"
+            f"{pad}    let entry := shr(192, mload(add(add(table, 32), mul(mid, 8))))\n"
+            f"{pad}    let key := shr(32, entry)\n"
+            f"{pad}    if eq(key, s) {{\n"
+            f"{pad}        kind := and(entry, 0xffffffff)\n"
+            f"{pad}        break\n"
+            f"{pad}    }}\n"
+            f"{pad}    switch lt(key, s)\n"
+            f"{pad}    case 0 {{ high := mid }}\n"
+            f"{pad}    default {{ low := add(mid, 1) }}\n"
+            f"{pad}}}\n")
+
+def _memory_gas(size):
+    """Gas to allocate and fill size bytes of fresh memory (expansion plus copy)."""
+    words = -(-size // 32)
+    return 3 * words + words * words // 512 + 3 * words
+
+def worst_case_gas(count):
+    """
+    Estimated worst-case gas of looking up one selector among count, excluding the call it dispatches to.
+    Both layouts need ceil(log2(count)) comparisons; the table also pays for copying itself to memory.
+    """
+    if count == 0:
+        return 0
+    depth = math.ceil(math.log2(count))
+    if count <= TABLE_THRESHOLD:
+        return depth * TREE_LEVEL_GAS + TREE_LEAF_GAS
+    return TABLE_SETUP_GAS + _memory_gas(8 * count) + (depth + 1) * TABLE_STEP_GAS
+
+def build_dispatcher(name: str, selectors: dict):
+    """
+    Generates a dispatcher name(bytes4, address, bytes) for a contract from the selectors registered for
+    its rewritten call sites (selector int -> "call", "staticcall" or "delegatecall"). The selector is
+    looked up with a binary search, as an if-tree for small sets and over a sorted packed table for large
+    ones, and the call site's low-level call is made from within the contract, so msg.sender
+    and the delegatecall context are those of the original call. Unknown selectors revert.
+    Returns (code, report) where report holds the selector count, layout, depth and worst-case lookup gas.
+    """
+    entries = sorted((selector, CALL_KINDS[kind]) for selector, kind in selectors.items())
+    count = len(entries)
+    layout = "tree" if count <= TABLE_THRESHOLD else "table"
+
+    mutability = " view" if set(selectors.values()) == {"staticcall"} else ""
+    code = (f"    function {name}(bytes4 selector, address target, bytes memory data) internal{mutability} "
+            f"returns (bool, bytes memory) {{\n"
+            f"        uint256 kind;\n")
+    if layout == "table":
+        packed = "".join(f"{selector:08x}{kind:08x}" for selector, kind in entries)
+        code += f'        bytes memory table = hex"{packed}";\n'
+    code += ("        assembly {\n"
+             "            let s := shr(224, selector)\n")
+    code += _tree(entries, 0, count, 12) if layout == "tree" else _table_search(count, 12)
+    code += "        }\n"
+    for kind, number in CALL_KINDS.items():
+        if kind in selectors.values():
+            code += (f"        if (kind == {number}) {{\n"
+                     f"            return target.{kind}(data);\n"
+                     f"        }}\n")
+    code += ("        revert('Unknown selector');\n"
+             "    }\n")
+
+    report = {"selectors": count, "layout": layout, "depth": math.ceil(math.log2(count)) if count else 0,
+              "worst_case_gas": worst_case_gas(count)}
+    return code, report
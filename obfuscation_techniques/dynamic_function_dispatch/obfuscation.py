@@ -1,84 +1,190 @@
-import os
-import json
-import re
-import secrets  
-from .selector_computer import register_function, export_registry, compute_obfuscated_selector
-
-def obfuscate_contract(contract_code: str, obfuscation_rules: list, function_targets: dict) -> str:
-    """ Injects function selector validation before execution."""
-
-    lines = contract_code.split("\n")
-    modified_lines = []
-
-    for line in lines:
-        stripped_line = line.strip()
-
-        # Detect Solidity function definitions correctly
-        match = re.match(r'function\s+(\w+)\s*\(([^)]*)\)', stripped_line)
-        if match:
-            function_name = match.group(1)
-            function_signature = f"{function_name}({match.group(2)})"
-            salt = secrets.randbelow(4294967295 + 1)  # Generate random salt
-            obfuscated_selector = compute_obfuscated_selector(function_signature, salt)
-            
-            # Register obfuscated selector in function_targets
-            register_function(function_targets, function_signature, salt, "")
+import logging
+from utils.solc_compiler import compile_asts
+from utils.solidity_lexer import tokenize, splice
+from .selector_computer import (register_function, compute_obfuscated_selector, compute_obfuscated_selectors,
+                                draw_salt, get_function_selector, reserve_selector, claim_selector,
+                                canonical_signature, ast_function_selectors, selector_literal,
+                                selector_value)
+from .vanity_search import apply_vanity_names
+from .dispatcher import build_dispatcher, dispatcher_name, DISPATCHER_NAMES
+
+LOW_LEVEL_CALLS = {"call", "staticcall", "delegatecall"}
+
+def _needs_compiler(contract_code):
+    """True when a function of the source has a parameter type only the compiler can resolve."""
+    tokens = tokenize(contract_code)
+    return any(canonical_signature(function.name, tokens.between(function.params_open, function.params_close)) is None
+               for function in tokens.functions())
+
+def warm_selector_asts(sources: dict):
+    """
+    Compiles, in one batch, the sources (file name -> code) whose selectors need the compiler, so that
+    obfuscate_contract finds their ASTs in the cache instead of invoking solc once per contract.
+    """
+    needed = {filename: code for filename, code in sources.items() if _needs_compiler(code)}
+    if not needed:
+        return
+    try:
+        compile_asts(needed)
+    except Exception as e:
+        logging.warning(f"Selectors of {len(needed)} contracts need the compiler: {e}")
+
+def _real_selectors(contract_code, tokens, functions, contract, compiled_code=None):
+    """
+    Canonical signature and real selector of each function: from the parameter list when every type is
+    elementary, otherwise from the compiler's AST (compiled only when needed). Either may be None when
+    neither source has it. compiled_code is the source handed to the compiler, the contract before vanity
+    renames: renames keep the order of functions and never touch one that needs the compiler.
+    """
+    resolved = []
+    for function in functions:
+        params = tokens.between(function.params_open, function.params_close)
+        signature = canonical_signature(function.name, params)
+        resolved.append((signature, get_function_selector(signature) if signature else None))
+    if all(signature for signature, _ in resolved):
+        return resolved
+
+    filename = contract or "Contract.sol"
+    compiled_code = compiled_code or contract_code
+    try:
+        ast = compile_asts({filename: compiled_code}).get(filename)
+    except Exception as e:
+        logging.warning(f"Selectors of {filename} need the compiler: {e}")
+        ast = None
+    by_offset = {offset: (signature, selector) for offset, selector, signature in ast_function_selectors(ast).values()} \
+        if ast else {}
+    compiled_tokens = tokenize(compiled_code)
+    for k, function in enumerate(compiled_tokens.functions()):
+        found = by_offset.get(len(compiled_code[:compiled_tokens.starts[function.keyword]].encode()))
+        if resolved[k][0] is None and found is not None:
+            resolved[k] = (found[0], bytes.fromhex(found[1]))
+    return resolved
+
+def obfuscate_contract(contract_code: str, index, function_targets: dict, contract: str = "", vanity: dict = None) -> str:
+    """ Injects function selector validation before execution. Obfuscated selectors never reuse a selector already taken in the run.
+    With vanity settings, externally callable functions are first renamed to gas-cheap selectors.
+    Low-level calls are registered under their own obfuscated selector and routed through a dispatchFunction
+    generated for their contract from those selectors."""
+
+    renamed = {}
+    original_code = contract_code
+    if vanity:
+        contract_code, renamed = apply_vanity_names(contract_code, vanity)
+
+    tokens = tokenize(contract_code)
+    edits = []
+
+    # Contracts that already define a dispatcher keep their calls as they are
+    has_dispatcher = {tokens.enclosing_contract(function.keyword).keyword for function in tokens.functions(with_body=False)
+                      if function.name in DISPATCHER_NAMES.values() and tokens.enclosing_contract(function.keyword)}
+
+    # Function bodies and low-level calls, handled in source order
+    events = [(function.keyword, "function", function) for function in tokens.functions()]
+    for obj, _, member, open_paren in tokens.member_calls(LOW_LEVEL_CALLS):
+        if not tokens.is_punct(obj - 1, ".") and tokens.matches[open_paren] > open_paren:
+            events.append((obj, "call", (member, open_paren)))
+
+    # Checks compare msg.sig with a precomputed bytes4 literal instead of hashing at runtime
+    functions = [function for _, event, function in events if event == "function"]
+    real_selectors = dict(zip((function.keyword for function in functions),
+                              _real_selectors(contract_code, tokens, functions, contract, original_code)))
+
+    # Salts are drawn in source order; selectors are then computed for the whole contract at once
+    signatures, declarations, salts, pending, reals, owners = [], [], [], [], [], []
+    replaced_until = -1
+    for position, event, function in sorted(events, key=lambda event: event[0]):
+        if event == "function":
+            params = " ".join(tokens.between(function.params_open, function.params_close).split())
+            declaration = f"{function.name}({params})"
+            canonical, real_selector = real_selectors[function.keyword]
+
+            # Registered under the canonical ABI signature; the declaration text only when it cannot be resolved
+            function_signature = canonical or declaration
+            signatures.append(function_signature)
+            declarations.append(declaration)
+            salts.append(draw_salt())  # Generate random salt
 
             # Inject validation logic before function execution
-            modified_lines.append(line)  # Add function declaration
-            modified_lines.append(
-                f"        require(msg.sig == bytes4(keccak256('{function_signature}')), 'Invalid function selector');"
-            )
+            if real_selector is None:
+                logging.warning(f"No selector for {declaration}, hashing it at runtime")
+                expected = f"bytes4(keccak256('{declaration}'))"
+            else:
+                expected = selector_literal(real_selector)
+            edits.append(tokens.insert_before(
+                function.body_open + 1,
+                f"require(msg.sig == {expected}, 'Invalid function selector');"
+            ))
+            pending.append(None)
+            reals.append(real_selector)
+            owners.append(function)
             continue
 
-        # Detect low-level calls (call, delegatecall, staticcall)
-        low_level_match = re.search(r'(\w+)\.(call|staticcall|delegatecall)\((.*?)\)', stripped_line)
-        if low_level_match:
-            salt = secrets.randbelow(4294967295 + 1)  # Generate random salt
-            obfuscated_selector = compute_obfuscated_selector("low_level_call", salt)
-
-            # Replace direct low-level call with dispatch execution
-            modified_lines.append(
-                f"        dispatchFunction(bytes4(keccak256('{obfuscated_selector}')), abi.encodePacked({low_level_match.group(1)}));"
-            )
+        # Low-level call: the call expression is routed through dispatchFunction under its own selector
+        member, open_paren = function
+        owner = tokens.enclosing_contract(position)
+        if position <= replaced_until or owner is None or owner.keyword in has_dispatcher \
+                or tokens.enclosing_callable(position) is None:
             continue
+        replaced_until = tokens.matches[open_paren]
+
+        signatures.append(f"{tokens.text(member)}(bytes)")
+        declarations.append(tokens.slice(position, replaced_until))
+        salts.append(draw_salt())  # Generate random salt
+        pending.append((position, replaced_until, tokens.text(member), tokens.between(open_paren, replaced_until)))
+        reals.append(None)
+        owners.append(owner)
+
+    # Real selectors of the contract must not be shadowed by obfuscated ones
+    for function_signature, call, real_selector in zip(signatures, pending, reals):
+        if call is None and real_selector is not None:
+            reserve_selector(int.from_bytes(real_selector, "big"), f"{contract}:{function_signature} (real)")
+
+    # Dispatchers to generate per contract, and the call site kind behind each of their selectors
+    dispatchers = {}
+    for function_signature, declaration, salt, obfuscated_selector, call, real_selector, owner in zip(
+            signatures, declarations, salts, compute_obfuscated_selectors(signatures, salts), pending, reals, owners):
+        while not claim_selector(obfuscated_selector, f"{contract}:{function_signature}"):
+            salt = draw_salt()
+            obfuscated_selector = compute_obfuscated_selector(function_signature, salt)
 
-        # If no match, add the original line
-        modified_lines.append(line)
-
-    return "\n".join(modified_lines)
-
-def process_obfuscation(input_folder: str, json_file: str, output_folder: str):
-
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
-
-    # Load obfuscation rules
-    with open(json_file, "r", encoding="utf-8") as f:
-        obfuscation_rules = json.load(f).get("interactions", [])
-
-    for filename in os.listdir(input_folder):
-        if filename.endswith(".sol"):
-            input_path = os.path.join(input_folder, filename)
-            output_path = os.path.join(output_folder, filename)
-
-            # Read Solidity contract code
-            with open(input_path, "r", encoding="utf-8") as f:
-                contract_code = f.read()
-
-            # Store obfuscated function selectors
-            function_targets = {}
-
-            # Apply obfuscation technique
-            obfuscated_code = obfuscate_contract(contract_code, obfuscation_rules, function_targets)
-
-            # Export selector registry for debugging & transparency
-            export_registry(function_targets, filename=os.path.join(output_folder, "selector_registry.json"))
-
-            # Write the obfuscated contract
-            with open(output_path, "w", encoding="utf-8") as f:
-                f.write(obfuscated_code)
-
-            print(f"✅ Processed: {filename}")
+        if call is None:
+            # Register obfuscated selector in function_targets
+            register_function(function_targets, function_signature, salt, "", obfuscated_selector,
+                              original_signature=renamed.get(function_signature), declaration=declaration,
+                              real_selector=real_selector)
+            continue
 
-    print(f" Obfuscation completed. Check the '{output_folder}' folder.")
+        # Register the call site with its target, and replace the call with dispatch execution
+        first, last, kind, data = call
+        target = tokens.text(first)
+        register_function(function_targets, function_signature, salt, target, obfuscated_selector,
+                          declaration=declaration)
+        name = dispatcher_name(kind)
+        dispatchers.setdefault((owner.keyword, name), (owner, name, {}))[2][selector_value(obfuscated_selector)] = kind
+        data = data.strip() or '""'
+        edits.append((
+            tokens.starts[first], tokens.ends[last],
+            f"{name}({selector_literal(obfuscated_selector)}, address({target}), {data})"
+        ))
+
+    for (keyword, name), (owner_contract, _, selectors) in sorted(dispatchers.items()):
+        code, report = build_dispatcher(name, selectors)
+        edits.append(tokens.insert_before(owner_contract.body_close, "\n" + code.rstrip("\n"), indent=""))
+        print(f" {name}: {contract}:{owner_contract.name} {report['selectors']} selectors, {report['layout']} "
+              f"binary search (depth {report['depth']}), worst case about {report['worst_case_gas']} gas per lookup")
+
+    return splice(contract_code, edits)
+
+def process_obfuscation(sources: dict, index, function_targets: dict, vanity: dict = None) -> dict:
+    """ Applies dynamic dispatch obfuscation to in-memory contracts and collects their selectors into function_targets[filename]."""
+
+    obfuscated_sources = {}
+    for filename, contract_code in sources.items():
+        # Selectors are collected per contract so they can be cached and merged independently
+        contract_targets = function_targets.setdefault(filename, {})
+
+        # Apply obfuscation technique
+        obfuscated_sources[filename] = obfuscate_contract(contract_code, index, contract_targets, filename, vanity)
+        print(f"✅ Processed: {filename}")
+
+    return obfuscated_sources
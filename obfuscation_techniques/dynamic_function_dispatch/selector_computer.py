@@ -1,30 +1,322 @@
+import re
 import struct
 import json
+import random
+import secrets
+from array import array
+from functools import lru_cache
 from eth_hash.auto import keccak  # Ethereum-compatible Keccak-256 hashing
+from utils import tracing
+
+SELECTOR_CACHE_SIZE = 65536
+
+_salt_source = secrets.SystemRandom()
+
+def seed_salts(seed):
+    """Makes salt generation reproducible for a given seed (None restores the system CSPRNG)."""
+    global _salt_source
+    _salt_source = secrets.SystemRandom() if seed is None else random.Random(seed)
+
+def salt_source():
+    """Returns the active salt source, so it can be resumed later with use_salt_source."""
+    return _salt_source
+
+def use_salt_source(source):
+    """Makes source (as returned by salt_source) the one salts are drawn from."""
+    global _salt_source
+    _salt_source = source
+
+def draw_salt() -> int:
+    """Draws a random 4-byte salt."""
+    return _salt_source.randrange(4294967295 + 1)
 
 def compute_obfuscated_selector(function_signature: str, salt: int) -> str:
     
-    original_selector = get_function_selector(function_signature)
-    salt_bytes = struct.pack(">I", salt)  # Convert salt to 4-byte format
+    original_selector = struct.unpack(">I", get_function_selector(function_signature))[0]
+    return f"0x{original_selector ^ salt:08x}"  # XOR with the 4-byte salt as one 32-bit integer
+
+def compute_obfuscated_selectors(function_signatures, salts) -> list:
+    """Obfuscated selectors for parallel lists of signatures and salts, XORed in one vectorized step."""
+    packed = b"".join(get_function_selector(signature) for signature in function_signatures)
+    try:
+        import numpy as np  # Optional: vectorized XOR over packed uint32 arrays
+    except ImportError:
+        selectors = struct.unpack(f">{len(function_signatures)}I", packed)
+        return [f"0x{selector ^ salt:08x}" for selector, salt in zip(selectors, salts)]
+
+    selectors = np.frombuffer(packed, dtype=">u4") ^ np.asarray(salts, dtype=np.uint32)
+    return [f"0x{selector:08x}" for selector in selectors.tolist()]
+
+_ELEMENTARY_PARAMETER = re.compile(
+    r"^(address(?:\s+payable)?|bool|string|bytes\d*|u?int\d*|u?fixed(?:\d+x\d+)?)\s*((?:\[\s*\d*\s*\]\s*)*)"
+    r"(?:(?:memory|calldata|storage)\s*)?(?:[A-Za-z_$][\w$]*)?$"
+)
+
+def canonical_signature(function_name: str, params: str):
+    """
+    Canonical ABI signature ('transfer(address,uint256)') for a parameter list as written in the source,
+    or None when a parameter is not an elementary type (structs, contracts, enums need the compiler).
+    """
+    types = []
+    for param in (params.split(",") if params.strip() else []):
+        match = _ELEMENTARY_PARAMETER.match(" ".join(param.split()))
+        if match is None:
+            return None
+        base, dimensions = match.groups()
+        if base.startswith("address"):
+            base = "address"
+        elif base in ("uint", "int"):
+            base += "256"
+        elif base in ("ufixed", "fixed"):
+            base += "128x18"
+        types.append(base + re.sub(r"\s+", "", dimensions))
+    return f"{function_name}({','.join(types)})"
+
+_ELEMENTARY_TYPE = re.compile(r"address|bool|string|bytes\d*|u?int\d*|u?fixed(?:\d+x\d+)?")
+_DATA_LOCATION = re.compile(r"\s+(?:memory|calldata|storage(?: pointer| ref)?)\b")
+
+def abi_type(type_string: str):
+    """
+    ABI type for a compiler typeString ('uint256[] memory', 'contract IERC20', 'enum Kind'), or None for
+    structs, function types and user-defined value types, whose encoding needs more than the type name.
+    """
+    type_string = _DATA_LOCATION.sub("", type_string).strip()
+    dimensions = type_string[type_string.index("["):] if "[" in type_string else ""
+    base = type_string[:len(type_string) - len(dimensions)].strip()
+    if base.startswith(("contract ", "address")):
+        base = "address"
+    elif base.startswith("enum "):
+        base = "uint8"
+    elif not _ELEMENTARY_TYPE.fullmatch(base):
+        return None
+    return base + dimensions
+
+def ast_function_selectors(ast) -> dict:
+    """
+    Selectors of the function definitions in a source AST: node id -> (src byte offset, selector hex,
+    canonical signature or None). Signatures come from the parameter typeStrings; public and external
+    functions also carry the compiler's functionSelector, which is used even when their signature cannot be
+    written out (struct parameters). Functions with neither are left out.
+    """
+    selectors = {}
+    pending = [ast]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, list):
+            pending.extend(node)
+            continue
+        if not isinstance(node, dict):
+            continue
+        if node.get("nodeType") == "FunctionDefinition" and node.get("kind") == "function":
+            types = [abi_type(param.get("typeDescriptions", {}).get("typeString", ""))
+                     for param in node.get("parameters", {}).get("parameters", [])]
+            signature = f"{node['name']}({','.join(types)})" if None not in types else None
+            selector = node.get("functionSelector")
+            if selector is None and signature is not None:
+                selector = get_function_selector(signature).hex()
+            if selector is not None:
+                selectors[node["id"]] = (int(node["src"].split(":")[0]), selector, signature)
+        pending.extend(value for value in node.values() if isinstance(value, (dict, list)))
+    return selectors
+
+def selector_literal(selector) -> str:
+    """A bytes4 literal ('bytes4(0x12345678)') for a selector given as bytes or hex, compared with no hashing at runtime."""
+    if isinstance(selector, bytes):
+        selector = selector.hex()
+    return f"bytes4(0x{selector.removeprefix('0x')})"
+
+def selector_value(selector: str) -> int:
+    """Parses a '0x'-prefixed selector into its 32-bit integer value."""
+    return int(selector, 16)
+
+class SelectorSet:
+    """
+    Compact open-addressing hash set of 32-bit selectors with the owner of each one.
+    Slots live in an array('I'); 0 marks an empty slot, so selector 0 is tracked with a separate flag.
+    """
+
+    def __init__(self, capacity=1024):
+        self._slots = array("I", bytes(4 * capacity))
+        self._owners = array("I", bytes(4 * capacity))  # owner id per slot
+        self._owner_names = []
+        self._owner_ids = {}
+        self._zero_owner = None
+        self._size = 0
+
+    def __len__(self):
+        return self._size + (self._zero_owner is not None)
+
+    def _slot(self, selector):
+        mask = len(self._slots) - 1
+        slot = (selector * 2654435761) & mask  # Multiplicative hashing spreads nearby selectors
+        while self._slots[slot] and self._slots[slot] != selector:
+            slot = (slot + 1) & mask
+        return slot
+
+    def _grow(self):
+        slots, owners = self._slots, self._owners
+        self._slots = array("I", bytes(8 * len(slots)))
+        self._owners = array("I", bytes(8 * len(slots)))
+        for selector, owner in zip(slots, owners):
+            if selector:
+                slot = self._slot(selector)
+                self._slots[slot] = selector
+                self._owners[slot] = owner
+
+    def __contains__(self, selector):
+        if selector == 0:
+            return self._zero_owner is not None
+        return self._slots[self._slot(selector)] == selector
+
+    def owner(self, selector):
+        """Returns the owner recorded for a selector, or None."""
+        if selector == 0:
+            return self._zero_owner
+        slot = self._slot(selector)
+        return self._owner_names[self._owners[slot]] if self._slots[slot] == selector else None
+
+    def items(self):
+        """Yields (selector, owner) for every selector in the set."""
+        if self._zero_owner is not None:
+            yield 0, self._zero_owner
+        for selector, owner in zip(self._slots, self._owners):
+            if selector:
+                yield selector, self._owner_names[owner]
+
+    def add(self, selector, owner):
+        """Adds a selector unless present. Returns the existing owner on a collision, otherwise None."""
+        if selector == 0:
+            if self._zero_owner is not None:
+                return self._zero_owner
+            self._zero_owner = owner
+            return None
+
+        slot = self._slot(selector)
+        if self._slots[slot] == selector:
+            return self._owner_names[self._owners[slot]]
+
+        owner_id = self._owner_ids.get(owner)
+        if owner_id is None:
+            owner_id = self._owner_ids[owner] = len(self._owner_names)
+            self._owner_names.append(owner)
+        self._slots[slot] = selector
+        self._owners[slot] = owner_id
+        self._size += 1
+        if self._size * 2 > len(self._slots):  # Keep the load factor under 1/2
+            self._grow()
+        return None
+
+# Every selector used in the current run, and the obfuscated ones claimed since the last reset
+_used_selectors = SelectorSet()
+_claimed = []
+
+def reset_selectors(selectors=None):
+    """Starts a new selector set: an empty one, or the given SelectorSet holding selectors taken earlier in the run."""
+    global _used_selectors
+    _used_selectors = SelectorSet() if selectors is None else selectors
+    del _claimed[:]
+
+def used_selectors():
+    """Returns the active SelectorSet: real selectors reserved and obfuscated selectors claimed."""
+    return _used_selectors
+
+def claimed_selectors() -> list:
+    """Returns (selector, owner) for every obfuscated selector claimed since the last reset_selectors."""
+    return list(_claimed)
+
+def reserve_selector(selector: int, owner: str):
+    """Records a selector that must not be reused, e.g. a real function selector. Returns the colliding owner or None."""
+    return _used_selectors.add(selector, owner)
+
+def claim_selector(obfuscated_selector: str, owner: str) -> bool:
+    """
+    Claims an obfuscated selector for owner. Returns False on a collision, so the caller can redraw its salt.
+    """
+    existing = _used_selectors.add(selector_value(obfuscated_selector), owner)
+    if existing is None:
+        _claimed.append((selector_value(obfuscated_selector), owner))
+        return True
+    print(f" Selector collision: {obfuscated_selector} used by {existing} and {owner}, redrawing salt")
+    return False
+
+def real_selector_of(entry: dict):
+    """
+    Real selector of a registry entry as an integer: the recorded one (None when the pass could not resolve
+    it), else, for entries recorded without it, the hash of the signature.
+    """
+    if "real_selector" in entry:
+        return selector_value(entry["real_selector"]) if entry["real_selector"] else None
+    return int.from_bytes(get_function_selector(entry["function_signature"]), "big")
+
+def registry_selectors(function_targets: dict) -> SelectorSet:
+    """
+    SelectorSet of the obfuscated and real selectors in registry fragments (contract -> {selector: entry}),
+    e.g. those reused from the cache, so contracts obfuscated afterwards in the run draw around them.
+    """
+    selectors = SelectorSet()
+    for contract in sorted(function_targets):
+        for obfuscated_selector, entry in function_targets[contract].items():
+            owner = f"{contract}:{entry['function_signature']}"
+            real_selector = real_selector_of(entry)
+            if real_selector is not None:
+                selectors.add(real_selector, f"{owner} (real)")
+            selectors.add(selector_value(obfuscated_selector), owner)
+    return selectors
+
+def find_collisions(function_targets: dict) -> list:
+    """
+    Checks registry fragments (contract -> {selector: entry}) against each other and against the real
+    selectors of every registered signature. Returns (selector, first owner, second owner) per collision.
+    """
+    selectors = SelectorSet()
+    collisions = []
+    for contract in sorted(function_targets):
+        for entry in function_targets[contract].values():
+            real_selector = real_selector_of(entry)
+            if real_selector is not None:
+                selectors.add(real_selector, f"{contract}:{entry['function_signature']} (real)")
 
-    obfuscated_selector = bytes(a ^ b for a, b in zip(original_selector, salt_bytes))
-    return "0x" + obfuscated_selector.hex()
+    for contract in sorted(function_targets):
+        for obfuscated_selector, entry in function_targets[contract].items():
+            owner = f"{contract}:{entry['function_signature']}"
+            existing = selectors.add(selector_value(obfuscated_selector), owner)
+            if existing is not None:
+                collisions.append((obfuscated_selector, existing, owner))
+    return collisions
 
+@lru_cache(maxsize=SELECTOR_CACHE_SIZE)
 def get_function_selector(function_signature: str) -> bytes:
    
     return keccak(function_signature.encode())[:4]  # Compute Keccak-256 hash and get the first 4 bytes
 
-def register_function(function_targets: dict, function_signature: str, salt: int, contract_address: str):
+def register_function(function_targets: dict, function_signature: str, salt: int, contract_address: str,
+                      obfuscated_selector: str = None, original_signature: str = None, declaration: str = None,
+                      real_selector: bytes = None) -> str:
+    """Records a function under its obfuscated selector and returns the selector.
+    function_signature is the canonical ABI signature; original_signature is the signature before a vanity
+    rename, declaration the parameter list as written in the source, kept for display. With a declaration,
+    real_selector (the function's selector in calldata, or None if unknown) is recorded too, so collisions
+    are checked against the real value."""
 
-    obfuscated_selector = compute_obfuscated_selector(function_signature, salt)
+    if obfuscated_selector is None:
+        obfuscated_selector = compute_obfuscated_selector(function_signature, salt)
     function_targets[obfuscated_selector] = {
         "function_signature": function_signature,
         "contract_address": contract_address,
     }
+    if original_signature is not None:
+        function_targets[obfuscated_selector]["original_signature"] = original_signature
+    if declaration is not None and declaration != function_signature:
+        function_targets[obfuscated_selector]["declaration"] = declaration
+    if declaration is not None:
+        # Recorded for every declared function, as null when it could not be resolved
+        function_targets[obfuscated_selector]["real_selector"] = f"0x{real_selector.hex()}" if real_selector else None
     print(f" Registered: {function_signature} -> {obfuscated_selector} -> {contract_address}")
+    return obfuscated_selector
 
 def export_registry(function_targets: dict, filename="selector_registry.json"):
 
     with open(filename, "w") as f:
         json.dump(function_targets, f, indent=4)
+    tracing.count("disk writes")
     print(f" Registry exported to {filename}")
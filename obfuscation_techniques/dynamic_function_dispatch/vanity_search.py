@@ -0,0 +1,130 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+from eth_hash.auto import keccak
+from utils.solidity_lexer import tokenize, splice, IDENT
+from .selector_computer import canonical_signature
+
+CHUNK_SIZE = 4096
+_ALPHABET = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+def _suffix(counter: int) -> str:
+    """Base-36 name suffix for a search counter."""
+    digits = ""
+    while True:
+        counter, digit = divmod(counter, 36)
+        digits = _ALPHABET[digit] + digits
+        if not counter:
+            return digits
+
+def _meets(selector: bytes, zero_bytes: int, max_selector) -> bool:
+    if selector[:zero_bytes] != bytes(zero_bytes):
+        return False
+    return max_selector is None or int.from_bytes(selector, "big") <= max_selector
+
+def _scan_chunk(task):
+    """Worker: first counter in [start, start + CHUNK_SIZE) whose renamed signature has a cheap selector, or None."""
+    function_name, params, start, zero_bytes, max_selector = task
+    prefix = f"{function_name}_"
+    suffix = f"({params})"
+    for counter in range(start, start + CHUNK_SIZE):
+        name = prefix + _suffix(counter)
+        if _meets(keccak((name + suffix).encode())[:4], zero_bytes, max_selector):
+            return counter
+    return None
+
+def search_vanity_name(function_name: str, params: str, zero_bytes=1, max_selector=None, time_budget=1.0,
+                       jobs=1, executor=None):
+    """
+    Brute-forces a renamed function '<name>_<suffix>' whose selector starts with zero_bytes zero bytes
+    (and is at most max_selector, for dispatcher-friendly ranges). params are canonical ABI types.
+    Chunks are scanned in counter order, so the same name is found for any number of jobs.
+    Returns the new name, or None when the time budget runs out.
+    """
+    deadline = time.monotonic() + time_budget
+    start = 0
+    while time.monotonic() < deadline:
+        tasks = [(function_name, params, start + i * CHUNK_SIZE, zero_bytes, max_selector) for i in range(jobs)]
+        start += jobs * CHUNK_SIZE
+        results = executor.map(_scan_chunk, tasks) if executor is not None else map(_scan_chunk, tasks)
+        hits = [counter for counter in results if counter is not None]
+        if hits:
+            return f"{function_name}_{_suffix(min(hits))}"
+    return None
+
+def _rename(contract_code, renames):
+    """
+    Renames functions within their declaring contract: the declaration, bare calls and this.f() calls.
+    renames maps a function name to (new name, declaring contract span).
+    """
+    tokens = tokenize(contract_code)
+    edits = []
+    for name, (new_name, contract) in renames.items():
+        for i in range(contract.body_open + 1, contract.body_close):
+            if tokens.kinds[i] != IDENT or tokens.text(i) != name:
+                continue
+            # obj.f(...) on another object targets a different contract's function, super.f() the base one
+            if tokens.is_punct(i - 1, ".") and not tokens.is_ident(i - 2, "this"):
+                continue
+            edits.append((tokens.starts[i], tokens.ends[i], new_name))
+    return splice(contract_code, edits)
+
+def _used_outside(tokens, name, contract):
+    """True if name appears as an identifier outside the given contract, e.g. in an interface or a derived contract."""
+    return any(tokens.kinds[i] == IDENT and tokens.text(i) == name
+               for i in range(len(tokens)) if not contract.body_open < i < contract.body_close)
+
+def apply_vanity_names(contract_code: str, vanity: dict):
+    """
+    Renames public and external functions to names whose selectors are cheap to call.
+    vanity holds zero_bytes, max_selector, time_budget (seconds per function), jobs and an optional
+    list of function names to restrict the search to.
+    Returns (code, {new canonical signature: original canonical signature}).
+    """
+    tokens = tokenize(contract_code)
+    functions = tokens.functions()
+    name_counts = {}
+    for function in tokens.functions(with_body=False):
+        name_counts[function.name] = name_counts.get(function.name, 0) + 1
+
+    wanted = vanity.get("functions")
+    candidates = []
+    for function in functions:
+        if wanted and function.name not in wanted:
+            continue
+        if name_counts[function.name] > 1:
+            continue  # Overloads, interface and base declarations share the name, so one rename cannot fit them all
+        header = tokens.slice(function.params_close, function.body_open).split()
+        if "public" not in header and "external" not in header:
+            continue  # Only externally callable functions have a selector in calldata
+        if "override" in header:
+            continue  # The name is fixed by the interface or base contract it implements
+        contract = tokens.enclosing_contract(function.keyword)
+        if contract is None or _used_outside(tokens, function.name, contract):
+            continue  # Other contracts in the file refer to it by name
+        signature = canonical_signature(function.name, tokens.between(function.params_open, function.params_close))
+        if signature is not None:
+            candidates.append((function.name, signature, contract))
+
+    if not candidates:
+        return contract_code, {}
+
+    renames = {}
+    signatures = {}
+    jobs = vanity.get("jobs", 1)
+    executor = ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else None
+    try:
+        for name, signature, contract in candidates:
+            params = signature[len(name) + 1:-1]
+            new_name = search_vanity_name(name, params, vanity.get("zero_bytes", 1), vanity.get("max_selector"),
+                                          vanity.get("time_budget", 1.0), jobs, executor)
+            if new_name is None:
+                print(f" Vanity search for {signature} ran out of time, keeping its name")
+                continue
+            renames[name] = (new_name, contract)
+            signatures[f"{new_name}({params})"] = signature
+            print(f" Vanity: {signature} -> {new_name}({params}) (0x{keccak(f'{new_name}({params})'.encode())[:4].hex()})")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return _rename(contract_code, renames), signatures
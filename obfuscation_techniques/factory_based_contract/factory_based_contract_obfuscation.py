@@ -1,7 +1,5 @@
-import os
-import re
 import random
-from utils.file_handler import load_json
+from utils.solidity_lexer import tokenize, splice
 
 FACTORY_TEMPLATE = '''
 contract {factory_name} {{
@@ -17,66 +15,47 @@ contract {factory_name} {{
 }}
 '''
 
-def ensure_output_dir():
-    """Ensures the output directory exists."""
-    output_dir = "output/obfuscated_contracts"
-    os.makedirs(output_dir, exist_ok=True)
-    return output_dir
+# 'new bytes(n)' and 'new string(n)' allocate memory rather than deploy a contract
+ELEMENTARY_TYPES = {"bytes", "string"}
 
 def generate_factory(target_contract, factory_name):
     """Generates a Solidity factory contract based on the obfuscation technique."""
     return FACTORY_TEMPLATE.format(target_contract=target_contract, factory_name=factory_name)
 
-def apply_obfuscation(input_folder, json_file):
-    """Applies obfuscation to Solidity contracts dynamically."""
-    output_dir = ensure_output_dir()
-
-    try:
-        analysis = load_json(json_file)  # Load JSON data from the file path
-        interactions = analysis if isinstance(analysis, list) else analysis.get("interactions", [])
-    except FileNotFoundError:
-        print(f"Analysis file not found: {json_file}")
-        return
-    except Exception as e:
-        print(f"Error loading or parsing JSON file: {e}")
-        return
-
-    for filename in os.listdir(input_folder):
-        if not filename.endswith(".sol"):
-            continue
-
-        file_path = os.path.join(input_folder, filename)
-        output_path = os.path.join(output_dir, filename)
-
-        with open(file_path, "r") as f:
-            content = f.read()
-
+def apply_obfuscation(sources, index):
+    """Applies factory obfuscation to in-memory Solidity contracts and returns the obfuscated sources."""
+    obfuscated_sources = {}
+    for filename, content in sources.items():
         # Identify all contract instantiations dynamically
-        pattern = r"new\s+(\w+)\((.*?)\)"
-        matches = re.findall(pattern, content)
-
+        tokens = tokenize(content)
+        edits = []
         factory_definitions = ""
-
-        for contract_name, args in matches:
+        generated = set()
+
+        for new, name, open_paren in tokens.new_expressions():
+            contract_name = tokens.text(name)
+            close_paren = tokens.matches[open_paren]
+            if contract_name in ELEMENTARY_TYPES or close_paren < 0:
+                continue
+            args = tokens.between(open_paren, close_paren)
             factory_name = f"ObfuscatedFactory_{contract_name}"
-            factory_code = generate_factory(contract_name, factory_name)
 
             salt = f"keccak256(abi.encodePacked(block.timestamp, {args}))"
             route = random.randint(0, 2)
             dummy_arg1 = random.randint(0, 100)
             dummy_arg2 = '"ObfuscatedParam"'
 
-            original = f"new {contract_name}({args})"
             replacement = (
                 f"{factory_name}().deploy({route}, {salt}, {args}, {dummy_arg1}, {dummy_arg2})"
             )
-            content = content.replace(original, replacement)
-
-            factory_definitions += "\n" + factory_code
+            edits.append((tokens.starts[new], tokens.ends[close_paren], replacement))
 
-        content += "\n" + factory_definitions
+            # One factory per deployed contract, however many times it is instantiated
+            if contract_name not in generated:
+                generated.add(contract_name)
+                factory_definitions += "\n" + generate_factory(contract_name, factory_name)
 
-        with open(output_path, "w") as f:
-            f.write(content)
+        obfuscated_sources[filename] = splice(content, edits) + "\n" + factory_definitions
+        print(f" Obfuscated contract: {filename}")
 
-        print(f" Obfuscated contract written to {output_path}")
+    return obfuscated_sources
@@ -0,0 +1,125 @@
+import logging
+from utils.solc_compiler import compile_with_diagnostics
+
+# EIP-170 limit on deployed contract code
+MAX_CODE_SIZE = 24576
+
+
+def _failed_files(compiled, sources):
+    failed = set()
+    for error in compiled.get("errors", []):
+        if error["severity"] == "error":
+            path = error.get("sourceLocation", {}).get("file")
+            failed.update([path] if path in sources else sources)  # Unlocated errors concern every file
+    return failed
+
+
+def estimate_costs(sources):
+    """
+    Compiles sources (file name -> code) and returns file name -> {"size": {contract: deployed bytes},
+    "gas": {"Contract.signature": estimated gas or None when unbounded}}. Files that fail to compile map
+    to None. solc emits no bytecode at all once any source fails, so the rest are compiled again without them.
+    """
+    output_selection = {"*": ["evm.gasEstimates", "evm.deployedBytecode.object"]}
+    costs = {}
+    pending = dict(sources)
+    while pending:
+        compiled = compile_with_diagnostics(pending, output_selection)
+        failed = _failed_files(compiled, pending)
+        if failed:
+            for filename in failed:
+                costs[filename] = None
+                del pending[filename]
+            continue
+
+        for filename in pending:
+            costs[filename] = {"size": {}, "gas": {}}
+            for name, output in compiled.get("contracts", {}).get(filename, {}).items():
+                evm = output.get("evm", {})
+                costs[filename]["size"][name] = len(evm.get("deployedBytecode", {}).get("object", "")) // 2
+                for signature, gas in (evm.get("gasEstimates") or {}).get("external", {}).items():
+                    costs[filename]["gas"][f"{name}.{signature}"] = None if gas == "infinite" else int(gas)
+        break
+    return costs
+
+
+def budget_violation(budget, baseline, cost):
+    """
+    Why cost breaks the budget relative to the contract's cost before obfuscation, or None if it fits.
+    budget holds "max_overhead" (fraction, e.g. 0.15), "max_size" (bytes) and "scope" ("function" or
+    "contract"). Functions without a baseline (added or renamed by a pass) and unbounded estimates are not
+    compared.
+    """
+    if cost is None:
+        return "does not compile"
+
+    for name, size in cost["size"].items():
+        if size > budget["max_size"] and size > baseline["size"].get(name, 0):
+            return f"{name} is {size} bytes, over the {budget['max_size']} byte limit"
+
+    if budget.get("max_overhead") is None:
+        return None
+    compared = [(signature, baseline["gas"][signature], gas) for signature, gas in cost["gas"].items()
+                if gas is not None and baseline["gas"].get(signature) is not None]
+
+    if budget["scope"] == "contract":
+        before = sum(original for _, original, _ in compared)
+        after = sum(gas for _, _, gas in compared)
+        if before and after > before * (1 + budget["max_overhead"]):
+            return f"runtime gas {before} -> {after} (+{(after - before) / before:.0%})"
+        return None
+
+    for signature, original, gas in compared:
+        if original and gas > original * (1 + budget["max_overhead"]):
+            return f"{signature} gas {original} -> {gas} (+{(gas - original) / original:.0%})"
+    return None
+
+
+class BudgetEnforcer:
+    """
+    Measures contracts before the passes and after each one, and rolls a pass back for every contract
+    it pushes over the budget. Contracts that do not compile before obfuscation are not checked.
+    """
+
+    def __init__(self, budget, sources):
+        self.budget = budget
+        self.decisions = []
+        try:
+            self.baseline = estimate_costs(sources)
+        except Exception as e:
+            logging.error(f"Gas budget not enforced, compilation failed: {e}")
+            self.baseline = {}
+        for filename, cost in self.baseline.items():
+            if cost is None:
+                print(f" Gas budget not enforced for {filename}: it does not compile before obfuscation")
+
+    def enforce(self, title, previous, sources, function_targets, previous_targets):
+        """
+        Returns sources with the pass undone for contracts over the budget. Their selector registry
+        entries are restored too.
+        """
+        checked = {filename: code for filename, code in sources.items()
+                   if self.baseline.get(filename) is not None and code != previous.get(filename)}
+        if not checked:
+            return sources
+        try:
+            costs = estimate_costs(checked)
+        except Exception as e:
+            logging.error(f"Gas budget not checked after {title}: {e}")
+            return sources
+
+        sources = dict(sources)
+        for filename in sorted(checked):
+            reason = budget_violation(self.budget, self.baseline[filename], costs[filename])
+            if reason is None:
+                self.decisions.append((title, filename, "kept", None))
+                logging.info(f"{title} kept for {filename}: within the gas budget")
+                continue
+            sources[filename] = previous[filename]
+            if filename in previous_targets:
+                function_targets[filename] = previous_targets[filename]
+            else:
+                function_targets.pop(filename, None)
+            self.decisions.append((title, filename, "rolled back", reason))
+            print(f" Rolled back {title} for {filename}: {reason}")
+        return sources
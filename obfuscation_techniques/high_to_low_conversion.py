@@ -1,147 +1,162 @@
-import os
-import re
 import logging
-from eth_utils import function_signature_to_4byte_selector
-from solcx import install_solc, set_solc_version, compile_standard
-from utils.file_handler import load_json
+from utils.solc_compiler import compile_asts
+from obfuscation_techniques.dynamic_function_dispatch.selector_computer import selector_literal
+from utils.solidity_lexer import tokenize, splice
 
 # Initialize logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
-# Install and set the appropriate version of solc (if not already installed)
-install_solc("0.8.20")  
-set_solc_version("0.8.20")  
-
-# Built-in functions that need special handling (add more as needed)
+# Token functions whose failures are reported by name
 BUILT_IN_FUNCTIONS = ['transfer', 'approve', 'mint', 'transferFrom', 'safeTransfer', 'safeApprove']
 
-def extract_interface_calls(source_code):
+def find_interface_calls(source_code):
     """
-    Extracts function calls in the form of 'address.function(arguments);' from source code.
+    Finds call statements of the form 'address.function(arguments);' outside comments and strings.
+    Only calls that make up a whole statement are returned: a call whose value is assigned, returned or
+    used in an expression cannot be replaced by a low-level call statement.
+    Returns (start, end, variable, function, arguments) tuples with source offsets.
     """
-    pattern = re.compile(r'(\w+)\.(\w+)\(([^)]*)\);')
-    matches = pattern.findall(source_code)
-    return [(f"{m[0]}.{m[1]}({m[2]});", m[0], m[1], m[2]) for m in matches]
-
-def get_function_selectors(ast_node):
+    tokens = tokenize(source_code)
+    calls = []
+    for obj, _, member, open_paren in tokens.member_calls():
+        close_paren = tokens.matches[open_paren]
+        if close_paren < 0 or not tokens.is_punct(close_paren + 1, ";"):
+            continue
+        if obj > 0 and not any(tokens.is_punct(obj - 1, char) for char in ";{}"):
+            continue
+        calls.append((
+            tokens.starts[obj], tokens.ends[close_paren + 1],
+            tokens.text(obj), tokens.text(member), tokens.between(open_paren, close_paren)
+        ))
+    return calls
+
+def _fresh_names(source_code, base):
+    """Yields base1, base2... skipping names the source already uses."""
+    used = tokenize(source_code).identifiers()
+    k = 0
+    while True:
+        k += 1
+        if f"{base}{k}" not in used:
+            yield f"{base}{k}"
+
+def _walk(node):
+    pending = [node]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, list):
+            pending.extend(node)
+        elif isinstance(node, dict):
+            yield node
+            pending.extend(value for value in node.values() if isinstance(value, (dict, list)))
+
+def get_function_declarations(asts):
+    """
+    Collects the externally callable functions of every compiled source: declaration id -> selector.
+    Library functions are left out; calling them through 'using for' is not a call on the object.
     """
-    Generates a dictionary of function selectors for each function in the contract.
+    libraries = set()
+    functions = {}
+    for ast_node in asts:
+        for node in _walk(ast_node):
+            if node.get("nodeType") == "ContractDefinition" and node.get("contractKind") == "library":
+                libraries.add(node["id"])
+            elif node.get("nodeType") == "FunctionDefinition" and node.get("functionSelector"):
+                functions[node["id"]] = (node["functionSelector"], node.get("scope"))
+    return {id: selector for id, (selector, scope) in functions.items() if scope not in libraries}
+
+def get_call_selectors(source_code, ast_node, declarations):
     """
+    Resolves the member calls of a source through the AST: source offset of the call -> selector of the
+    called declaration, or None for the built-in transfer of an address payable (a plain value transfer).
+    Overloads resolve to the overload the compiler picked.
+    """
+    source_bytes = source_code.encode("utf-8")
     selectors = {}
-
-    def traverse(node):
-        if isinstance(node, dict):
-            if node.get("nodeType") == "FunctionDefinition" and node.get("kind") == "function":
-                name = node.get("name")
-                params = node.get("parameters", {}).get("parameters", [])
-                param_types = [p.get("typeDescriptions", {}).get("typeString", "") for p in params]
-                param_sig = ",".join(param_types)
-                signature = f"{name}({param_sig})"
-                selector = function_signature_to_4byte_selector(signature).hex()
-                selectors[name] = selector
-            for value in node.values():
-                traverse(value)
-        elif isinstance(node, list):
-            for item in node:
-                traverse(item)
-
-    traverse(ast_node)
+    for node in _walk(ast_node):
+        member = node.get("expression") if node.get("nodeType") == "FunctionCall" else None
+        if not member or member.get("nodeType") != "MemberAccess":
+            continue
+        start = len(source_bytes[:int(member["src"].split(":")[0])].decode("utf-8", errors="ignore"))
+        object_type = member.get("expression", {}).get("typeDescriptions", {}).get("typeString")
+        if member.get("referencedDeclaration") in declarations:
+            selectors[start] = declarations[member["referencedDeclaration"]]
+        elif member.get("memberName") == "transfer" and object_type == "address payable":
+            selectors[start] = None
     return selectors
 
 def convert_calls_to_low_level(source_code, selectors):
     """
-    Converts high-level function calls to low-level calls using the selector.
+    Converts high-level function calls to low-level calls using the selectors from get_call_selectors.
+    Selectors are emitted as bytes4 literals, so no signature string is built or hashed at runtime.
+    Each converted call gets its own success variable, so several calls in one function do not redeclare it.
     """
-    calls = extract_interface_calls(source_code)
-    for full_call, var, func, args in calls:
-        # Handle built-in functions like transfer, approve, mint, etc.
-        if func in BUILT_IN_FUNCTIONS:
-            if func == 'transfer':
-                low_call = (
-                    f'(bool success, ) = {var}.call{{value: {args.strip()}}}("");\n'
-                    f'require(success, "Transfer failed");'
-                )
-            else:
-                low_call = (
-                    f'(bool success, ) = {var}.call(abi.encodeWithSignature("{func}({args})"));\n'
-                    f'require(success, "{func} failed");'
-                )
+    edits = []
+    names = _fresh_names(source_code, "success")
+    for start, end, var, func, args in find_interface_calls(source_code):
+        if start not in selectors:
+            logging.warning(f"Function selector not found for: {func}")
+            continue
+
+        selector = selectors[start]
+        success = next(names)
+        if selector is None:
+            low_call = (
+                f'(bool {success}, ) = {var}.call{{value: {args.strip()}}}("");\n'
+                f'require({success}, "Transfer failed");'
+            )
         else:
-            # For custom functions, use selector encoding
-            selector = selectors.get(func)
-            if not selector:
-                logging.warning(f"Function selector not found for: {func}")
-                continue
-
             # Convert to low-level call with selector
+            arguments = f", {args.strip()}" if args.strip() else ""
+            message = f"{func} failed" if func in BUILT_IN_FUNCTIONS else "Call failed"
             low_call = (
-                f'(bool success, ) = {var}.call(abi.encodeWithSelector(0x{selector}, {args.strip()}));\n'
-                f'require(success, "Call failed");'
+                f'(bool {success}, ) = {var}.call(abi.encodeWithSelector({selector_literal(selector)}{arguments}));\n'
+                f'require({success}, "{message}");'
             )
-        
+
         # Replace the high-level call with the low-level version
-        source_code = source_code.replace(full_call, low_call)
-    
-    return source_code
+        edits.append((start, end, low_call))
 
-def compile_ast(source_code):
-    """
-    Compiles Solidity code into an AST, allowing us to extract function selectors.
-    """
-    compiled = compile_standard({
-        "language": "Solidity",
-        "sources": {
-            "Temp.sol": {"content": source_code}
-        },
-        "settings": {"outputSelection": {"*": {"*": ["*"], "": ["ast"]}}}
-    })
-    return compiled["sources"]["Temp.sol"]["ast"]
-
-def get_interaction_type(contract_file, interaction_data):
+    return splice(source_code, edits)
+
+def get_interaction_type(contract_file, index):
     """
-    Get the interaction type from the interaction data (high-level, low-level, etc.).
+    Get the interaction type from the interaction index (high-level, low-level, etc.).
     """
-    for interaction in interaction_data:
-        if interaction.get("caller") == contract_file:
-            return interaction.get("interaction_type")
-    return None
+    return index.interaction_type(contract_file)
 
-def process_contracts(input_folder, output_folder, json_path):
+def process_contracts(sources, index):
     """
-    Process all contracts in the input folder, convert high-level calls to low-level, and save to output folder.
-    Write all contracts to output, even if obfuscation is not performed.
+    Process all in-memory contracts (file name -> code), converting high-level calls to low-level.
+    High-level contracts are compiled together in one batch; every contract is returned, even if obfuscation is not performed.
     """
-    interaction_data = load_json(json_path)  #  Custom loader here
-
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
-
-    selector_cache = {}  # Cache to store selectors for reusability
-
-    for filename in os.listdir(input_folder):
-        if filename.endswith(".sol"):
-            interaction_type = get_interaction_type(filename, interaction_data)
-
-            input_path = os.path.join(input_folder, filename)
-            output_path = os.path.join(output_folder, filename)
-
-            with open(input_path, "r") as f:
-                contract = f.read()
-
-            try:
-                if interaction_type == "high_level":
-                    logging.info(f"Processing {filename} for high-level call conversion...")
-                    ast = compile_ast(contract)  # Get the AST for the contract
-                    selectors = get_function_selectors(ast)  # Extract function selectors
-                    converted_code = convert_calls_to_low_level(contract, selectors)  # Convert high-level calls
-                else:
-                    logging.info(f"No obfuscation applied to {filename} (interaction_type: {interaction_type})")
-                    converted_code = contract  # Keep the original contract unchanged
-                
-                # Write the contract (processed or unchanged) to the output folder
-                with open(output_path, "w") as f_out:
-                    f_out.write(converted_code)
-                
-                logging.info(f"Saved: {output_path}")
-            except Exception as e:
-                logging.error(f"Failed to process {filename}: {str(e)}")
+    high_level = {
+        filename: contract for filename, contract in sources.items()
+        if get_interaction_type(filename, index) == "high_level"
+    }
+
+    try:
+        asts = compile_asts(high_level) if high_level else {}  # One compile for the whole batch
+    except Exception as e:
+        logging.error(f"Failed to compile high-level contracts: {str(e)}")
+        asts = {}
+
+    converted_sources = {}
+    for filename, contract in sources.items():
+        if filename not in high_level:
+            logging.info(f"No obfuscation applied to {filename} (interaction_type: {get_interaction_type(filename, index)})")
+            converted_sources[filename] = contract  # Keep the original contract unchanged
+            continue
+
+        try:
+            logging.info(f"Processing {filename} for high-level call conversion...")
+            if filename not in asts:
+                raise ValueError("Compilation failed")
+            # Declaration ids are only unique within one compiler run, and cached ASTs may come from another
+            declarations = get_function_declarations([asts[filename]])
+            selectors = get_call_selectors(contract, asts[filename], declarations)  # Resolve called functions
+            converted_sources[filename] = convert_calls_to_low_level(contract, selectors)  # Convert high-level calls
+        except Exception as e:
+            logging.error(f"Failed to process {filename}: {str(e)}")
+            converted_sources[filename] = contract
+
+    return converted_sources
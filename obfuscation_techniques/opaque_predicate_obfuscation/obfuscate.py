@@ -1,99 +1,79 @@
-import os
-import re
-from utils.file_handler import load_json
-from .predicate_builder import get_predicate
-
-def obfuscate_contract(contract_code, obfuscation_rules):
-    lines = contract_code.split('\n')
-    obfuscated_lines = []
-    inside_function = False  # Track if we are inside a function
-    predicate_applied = {}   # Track predicates applied per interaction type within a function
-
-    for line in lines:
-        stripped_line = line.strip()
-
-        # Detect function declarations
-        if re.match(r'^\s*function\s+\w+\s*\(.*\)', stripped_line):  
-            inside_function = True
-            predicate_applied = {  
-                "high_level": False,
-                "low_level": False,
-                "interface_call": False,
-                "delegate_call": False
-            }
-            obfuscated_lines.append(line)  
-            continue
-
-        # Apply predicates based on interaction types
-        for rule in obfuscation_rules:
-            role = rule.get("interaction_role", "").lower()
-            interaction_type = rule.get("interaction_type", "").lower()
-
-            if not role or not interaction_type:
-                continue  # Skip invalid rules
-
-            if inside_function:  
-                # High-level interaction: Add predicate at the start of function body  
-                if interaction_type == "high_level" and not predicate_applied["high_level"]:
-                    predicate = get_predicate(role, "high_level")
-                    obfuscated_lines.append(f"        {predicate}")  
-                    predicate_applied["high_level"] = True
-
-                # Check for low-level calls and insert predicates  
-                elif interaction_type == "low_level" and re.search(r'\b(call|staticcall)\b', stripped_line) and not predicate_applied["low_level"]:
-                    predicate = get_predicate(role, "low_level")
-                    obfuscated_lines.append(f"        {predicate}")
-                    predicate_applied["low_level"] = True
-
-                # Check for interface calls  
-                elif interaction_type == "interface_call" and "interface" in stripped_line and not predicate_applied["interface_call"]:
-                    predicate = get_predicate(role, "interface_call")
-                    obfuscated_lines.append(f"        {predicate}")
-                    predicate_applied["interface_call"] = True
-
-                # Check for delegate calls  
-                elif interaction_type == "delegate_call" and re.search(r'\bdelegatecall\b', stripped_line) and not predicate_applied["delegate_call"]:
-                    predicate = get_predicate(role, "delegate_call")
-                    obfuscated_lines.append(f"        {predicate}")
-                    predicate_applied["delegate_call"] = True
-
-        # Detect function ending and insert extra closing brace if needed
-        if inside_function and stripped_line == "}":
-            inside_function = False
-            if predicate_applied:
-                obfuscated_lines.append("        }") 
-            obfuscated_lines.append(line)  
-            continue
-
-        # Add the original line to the output
-        obfuscated_lines.append(line)
-
-    return '\n'.join(obfuscated_lines)
-
-def process_files(contract_folder, output_folder, json_file):
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
-
-    # Load obfuscation rules from JSON file
-    obfuscation_rules = load_json(json_file)
-    if not obfuscation_rules:
-        print(f"Error: Unable to load obfuscation rules from {json_file}.")
-        return
-
-    for filename in os.listdir(contract_folder):
-        if filename.endswith(".sol"):
-            input_path = os.path.join(contract_folder, filename)
-            output_path = os.path.join(output_folder, filename)
-
-            # Read the contract code
-            with open(input_path, "r", encoding="utf-8") as f:
-                contract_code = f.read()
-
-            # Apply obfuscation rules to the contract code
-            obfuscated_code = obfuscate_contract(contract_code, obfuscation_rules)
-
-            # Write the obfuscated contract to the output folder
-            with open(output_path, "w", encoding="utf-8") as f:
-                f.write(obfuscated_code)
-
-            print(f"Processed: {filename}")
+from utils.solidity_lexer import tokenize, splice, IDENT
+from .predicate_builder import choose_predicates
+
+# Identifiers that trigger a predicate for each interaction type (high_level applies to every function)
+TRIGGER_IDENTIFIERS = {
+    "low_level": {"call", "staticcall"},
+    "interface_call": {"interface"},
+    "delegate_call": {"delegatecall"},
+}
+
+def obfuscate_contract(contract_code, index, gas_budget=None):
+    """
+    Wraps function bodies in opaque predicates, keeping each function's added static gas within gas_budget.
+    Returns (code, report) where report lists (function, added gas, predicates, skipped) per function.
+    """
+    # Only the first valid rule of each interaction type can apply, so look them up once
+    rule_roles = index.rule_roles()
+    tokens = tokenize(contract_code)
+    edits = []
+    report = []
+
+    for function in tokens.functions():
+        body_open, body_close = function.body_open, function.body_close
+        if body_close is None or tokens.lines[body_open] == tokens.lines[body_close]:
+            continue  # One-line bodies have no statement line to wrap
+
+        # First trigger token of each interaction type inside the function body
+        triggers = {"high_level": body_open + 1}
+        for i in range(body_open + 1, body_close):
+            if tokens.kinds[i] != IDENT:
+                continue
+            word = tokens.text(i)
+            for interaction_type, identifiers in TRIGGER_IDENTIFIERS.items():
+                if word in identifiers and interaction_type not in triggers:
+                    triggers[interaction_type] = i
+
+        # Predicates open at the top-level statement holding the trigger, in source order, and close with the body
+        placements = []
+        for order, (interaction_type, role) in enumerate(rule_roles):
+            if interaction_type in triggers:
+                statement = tokens.statement_start(triggers[interaction_type], body_open)
+                placements.append((statement, order, interaction_type, role))
+
+        placements.sort()
+        predicates = choose_predicates([(role, interaction_type) for _, _, interaction_type, role in placements],
+                                       gas_budget)
+        added = [predicate for predicate in predicates if predicate is not None]
+        for (statement, _, _, _), predicate in zip(placements, predicates):
+            if predicate is not None:
+                edits.append(tokens.insert_before(statement, predicate.code))
+
+        for _ in added:
+            edits.append(tokens.insert_before(body_close, "}"))
+
+        if placements:
+            report.append((function.name or function.kind, sum(predicate.gas for predicate in added),
+                           len(added), len(placements) - len(added)))
+
+    return splice(contract_code, edits), report
+
+def process_files(sources, index, gas_budget=None):
+    """
+    Applies opaque predicates to in-memory contracts (file name -> code) and returns the obfuscated sources.
+    gas_budget caps the static gas the predicates add to each function.
+    """
+    if not len(index):
+        print("Error: No obfuscation rules found in the interaction analysis.")
+        return dict(sources)
+
+    obfuscated_sources = {}
+    for filename, contract_code in sources.items():
+        # Apply obfuscation rules to the contract code
+        obfuscated_sources[filename], report = obfuscate_contract(contract_code, index, gas_budget)
+        print(f"Processed: {filename}")
+        for function, gas, added, skipped in report:
+            note = f", {skipped} skipped for the gas budget" if skipped else ""
+            print(f"  {function}: +{gas} gas from {added} predicate{'s' if added != 1 else ''}{note}")
+
+    return obfuscated_sources
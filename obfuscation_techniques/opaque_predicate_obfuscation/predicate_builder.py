@@ -1,64 +1,119 @@
 import random
 
+
+class Predicate:
+    """
+    An opaque predicate opening line with its cost and strength.
+    gas is a static estimate of one evaluation: opcodes plus the checked arithmetic and memory handling
+    Solidity adds (a keccak over abi.encodePacked costs ~200, a blockhash ~20 plus a checked subtraction).
+    strength (1-5) rates how hard the outcome is to predict: constants and gas checks score low,
+    hashes of block data high.
+    """
+    __slots__ = ("code", "gas", "strength")
+
+    def __init__(self, code, gas, strength):
+        self.code = code
+        self.gas = gas
+        self.strength = strength
+
+
 # Define predicates grouped by interaction roles and types
 PREDICATES = {
     "initiator": {
         "high_level": [
-            "if ((block.timestamp % 7 == 0) && block.number > 0) {",
-            "uint256 temp = uint256(keccak256(abi.encodePacked(msg.sender, blockhash(block.number - 1)))); if (temp % 3 == 1) { "
+            Predicate("if ((block.timestamp % 7 == 0) && block.number > 0) {", gas=60, strength=2),
+            Predicate("uint256 temp = uint256(keccak256(abi.encodePacked(msg.sender, blockhash(block.number - 1)))); if (temp % 3 == 1) { ", gas=290, strength=5)
         ],
         "low_level": [
-            "if ((gasleft() % 15 == 1) && tx.gasprice > 0) { ",
-            "uint256 temp = uint256(blockhash(block.number - 1)); if (temp % 5 == 2) { "
+            Predicate("if ((gasleft() % 15 == 1) && tx.gasprice > 0) { ", gas=60, strength=3),
+            Predicate("uint256 temp = uint256(blockhash(block.number - 1)); if (temp % 5 == 2) { ", gas=110, strength=4)
         ],
         "interface_call": [
-            "if ((uint(keccak256(abi.encodePacked(msg.sender))) % 5 == 1) && block.number > 0) {",
-            "if (tx.origin == address(this) || gasleft() > 10000) { "
+            Predicate("if ((uint(keccak256(abi.encodePacked(msg.sender))) % 5 == 1) && block.number > 0) {", gas=230, strength=4),
+            Predicate("if (tx.origin == address(this) || gasleft() > 10000) { ", gas=55, strength=1)
         ],
         "delegate_call": [
-            "if ((gasleft() % 10 == 1) || (block.timestamp % 3 != 0)) { ",
-            "uint256 temp = uint256(keccak256(abi.encodePacked(block.timestamp, block.number))); if (temp % 4 == 3) { "
+            Predicate("if ((gasleft() % 10 == 1) || (block.timestamp % 3 != 0)) { ", gas=70, strength=3),
+            Predicate("uint256 temp = uint256(keccak256(abi.encodePacked(block.timestamp, block.number))); if (temp % 4 == 3) { ", gas=260, strength=5)
         ]
     },
     "middleware": {
         "high_level": [
-            "if (block.difficulty % 9 == 1) { ",
-            "uint256 temp = uint256(keccak256(abi.encodePacked(address(this), tx.gasprice))); if (temp % 7 == 3) { "
+            Predicate("if (block.difficulty % 9 == 1) { ", gas=35, strength=2),
+            Predicate("uint256 temp = uint256(keccak256(abi.encodePacked(address(this), tx.gasprice))); if (temp % 7 == 3) { ", gas=260, strength=4)
         ],
         "low_level": [
-            "if ((tx.gasprice % 13 == 1) && address(this).balance > 0) { ",
-            "uint256 temp = uint256(blockhash(block.number - 2)); if (temp % 3 == 2) { "
+            Predicate("if ((tx.gasprice % 13 == 1) && address(this).balance > 0) { ", gas=65, strength=2),
+            Predicate("uint256 temp = uint256(blockhash(block.number - 2)); if (temp % 3 == 2) { ", gas=110, strength=4)
         ],
         "interface_call": [
-            "if (block.number % 11 == 1) { ",
-            "uint256 temp = uint256(keccak256(abi.encodePacked(tx.origin, blockhash(block.number - 1)))); if (temp % 5 == 0) {"
+            Predicate("if (block.number % 11 == 1) { ", gas=35, strength=2),
+            Predicate("uint256 temp = uint256(keccak256(abi.encodePacked(tx.origin, blockhash(block.number - 1)))); if (temp % 5 == 0) {", gas=290, strength=5)
         ],
         "delegate_call": [
-            "if ((block.timestamp % 6 != 1) && gasleft() > 20000) { ",
-            "if (address(this).code.length % 8 == 7) { "
+            Predicate("if ((block.timestamp % 6 != 1) && gasleft() > 20000) { ", gas=60, strength=2),
+            Predicate("if (address(this).code.length % 8 == 7) { ", gas=140, strength=3)
         ]
     },
     "executor": {
         "high_level": [
-            "if ((uint256(uint160(msg.sender)) % 19 == 1) && block.number > 0) { ",
-            "uint256 temp = uint256(blockhash(block.number - 1)); if (temp % 3 == 1) { "
+            Predicate("if ((uint256(uint160(msg.sender)) % 19 == 1) && block.number > 0) { ", gas=60, strength=2),
+            Predicate("uint256 temp = uint256(blockhash(block.number - 1)); if (temp % 3 == 1) { ", gas=110, strength=4)
         ],
         "low_level": [
-            "if ((uint256(keccak256(abi.encodePacked(block.timestamp))) % 14 == 1) && tx.gasprice > 0) { ",
-            "if (gasleft() % 8 != 0) { "
+            Predicate("if ((uint256(keccak256(abi.encodePacked(block.timestamp))) % 14 == 1) && tx.gasprice > 0) { ", gas=230, strength=4),
+            Predicate("if (gasleft() % 8 != 0) { ", gas=35, strength=3)
         ],
         "interface_call": [
-            "if (blockhash(block.number - 1) != blockhash(block.number - 2)) { ",
-            "uint256 temp = uint256(blockhash(block.number - 2)); if (temp % 5 == 3) { "
+            Predicate("if (blockhash(block.number - 1) != blockhash(block.number - 2)) { ", gas=150, strength=3),
+            Predicate("uint256 temp = uint256(blockhash(block.number - 2)); if (temp % 5 == 3) { ", gas=110, strength=4)
         ],
         "delegate_call": [
-            "if (msg.sender >= address(this)) { ",
-            "if (block.number % 5 != 1) { "
+            Predicate("if (msg.sender >= address(this)) { ", gas=30, strength=2),
+            Predicate("if (block.number % 5 != 1) { ", gas=35, strength=2)
         ]
     }
 }
 
-def get_predicate(role, interaction_type):
+def _options(role, interaction_type):
     if role in PREDICATES and interaction_type in PREDICATES[role]:
-        return random.choice(PREDICATES[role][interaction_type])
+        return PREDICATES[role][interaction_type]
     raise ValueError(f"Invalid role ({role}) or interaction type ({interaction_type})")
+
+def get_predicate(role, interaction_type):
+    return random.choice(_options(role, interaction_type)).code
+
+def choose_predicates(slots, gas_budget=None):
+    """
+    Picks one predicate per (role, interaction_type) slot of a function, in order.
+    Without a budget the choice is uniform. With a budget, the total static gas stays within it:
+    slots that cannot fit even their cheapest predicate get None (earlier slots are served first),
+    and each remaining slot picks among the predicates that leave room for the cheapest choice of the
+    slots after it, weighted by strength and preferring ones not used yet in the function.
+    """
+    options = [_options(role, interaction_type) for role, interaction_type in slots]
+    if gas_budget is None:
+        return [random.choice(choices) for choices in options]
+
+    cheapest = [min(predicate.gas for predicate in choices) for choices in options]
+    included = []
+    total = 0
+    for gas in cheapest:
+        included.append(total + gas <= gas_budget)
+        total += gas if included[-1] else 0
+
+    chosen = []
+    used = set()
+    remaining = gas_budget
+    for k, choices in enumerate(options):
+        if not included[k]:
+            chosen.append(None)
+            continue
+        reserve = sum(gas for gas, keep in zip(cheapest[k + 1:], included[k + 1:]) if keep)
+        affordable = [predicate for predicate in choices if predicate.gas <= remaining - reserve]
+        fresh = [predicate for predicate in affordable if predicate.code not in used] or affordable
+        predicate = random.choices(fresh, weights=[predicate.strength for predicate in fresh])[0]
+        chosen.append(predicate)
+        used.add(predicate.code)
+        remaining -= predicate.gas
+    return chosen
@@ -0,0 +1,243 @@
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from utils import tracing
+from utils.file_handler import write_contracts
+from obfuscation_techniques.opaque_predicate_obfuscation.obfuscate import process_files
+from obfuscation_techniques.dynamic_function_dispatch.obfuscation import process_obfuscation, warm_selector_asts
+from obfuscation_techniques.high_to_low_conversion import process_contracts
+from obfuscation_techniques.proxy_contract.proxy_interaction_obfuscation import process_proxy_files
+from obfuscation_techniques.factory_based_contract.factory_based_contract_obfuscation import apply_obfuscation
+from obfuscation_techniques.storage_packing import process_storage_packing
+from obfuscation_techniques.gas_budget import BudgetEnforcer
+from obfuscation_techniques.dynamic_function_dispatch.selector_computer import (
+    SelectorSet, seed_salts, salt_source, use_salt_source, reset_selectors, used_selectors, claimed_selectors)
+
+# Bump when a pass changes its output so cached contracts are not reused
+PIPELINE_VERSION = 4
+
+# Passes that draw random numbers. They go contract by contract, each contract resuming its own random
+# streams, so a contract's output does not depend on the other contracts of the run
+RANDOMIZED_PASSES = {"Opaque Predicate Obfuscation", "Dynamic Dispatch Obfuscation",
+                     "Factory-Based Contract Obfuscation"}
+
+# Batched work run over every contract before a randomized pass goes contract by contract
+PASS_PREPARATION = {"Dynamic Dispatch Obfuscation": warm_selector_asts}
+
+def build_passes(index, function_targets, vanity=None, pack_storage=False, predicate_budget=None):
+    """
+    Returns the ordered obfuscation passes as (title, pass) pairs.
+    Every pass takes and returns in-memory sources keyed by file name.
+    vanity enables the vanity selector search of the dynamic dispatch pass;
+    pack_storage appends the storage packing pass;
+    predicate_budget caps the gas opaque predicates add to each function.
+    """
+    passes = [
+        ("Opaque Predicate Obfuscation", lambda sources: process_files(sources, index, predicate_budget)),
+        ("Dynamic Dispatch Obfuscation", lambda sources: process_obfuscation(sources, index, function_targets, vanity)),
+        ("High-to-Low Conversion Obfuscation", lambda sources: process_contracts(sources, index)),
+        ("Proxy-Based Contract Obfuscation", lambda sources: process_proxy_files(sources, index)),
+        ("Factory-Based Contract Obfuscation", lambda sources: apply_obfuscation(sources, index)),
+    ]
+    if pack_storage:
+        # Last, so variables added by the other passes are packed too
+        passes.append(("Storage Packing", lambda sources: process_storage_packing(sources, index)))
+    return passes
+
+def pass_config(vanity=None, pack_storage=False, predicate_budget=None, gas_budget=None):
+    """
+    Describes the pass chain for cache keys.
+    """
+    config = {"version": PIPELINE_VERSION,
+              "passes": [title for title, _ in build_passes(None, None, pack_storage=pack_storage)]}
+    if predicate_budget is not None:
+        config["predicate_budget"] = predicate_budget
+    if gas_budget:
+        config["gas_budget"] = gas_budget
+    if vanity:
+        # The search stops at its deadline, so the time budget and job count decide whether a name is found
+        config["vanity"] = {key: vanity.get(key)
+                            for key in ("zero_bytes", "max_selector", "functions", "time_budget", "jobs")}
+    return config
+
+def seed_rngs(seed):
+    """
+    Seeds predicate, routing and salt randomness so a run is reproducible.
+    """
+    random.seed(seed)
+    seed_salts(seed)
+
+def contract_streams(sources, seed):
+    """
+    Random streams of each contract (file name -> (random module state, salt source)), seeded with
+    f"{seed}:{filename}". None when unseeded: system randomness needs no isolation.
+    """
+    if seed is None:
+        return None
+    streams = {}
+    for filename in sources:
+        seed_rngs(f"{seed}:{filename}")
+        streams[filename] = (random.getstate(), salt_source())
+    return streams
+
+def _run_per_contract(title, apply_pass, sources, streams, selectors=None, claims=None):
+    """
+    Applies a randomized pass to one contract at a time, in file name order, with the contract's own
+    random streams. Contracts draw selectors against selectors (a run-wide SelectorSet they add to) or,
+    without it, each against an empty set, recording the selectors it took in claims[filename] as
+    ({selector: owner} of every selector, [(selector, owner)] of the obfuscated ones it claimed).
+    Each contract is traced as a "contract" span.
+    """
+    results = {}
+    for filename in sorted(sources):
+        if streams is not None:
+            state, salts = streams[filename]
+            random.setstate(state)
+            use_salt_source(salts)
+        reset_selectors(selectors)
+        with tracing.span(filename, "contract", stage=title, bytes_in=len(sources[filename])) as contract_span:
+            results.update(apply_pass({filename: sources[filename]}))
+            contract_span.set(bytes_out=len(results[filename]))
+        if streams is not None:
+            streams[filename] = (random.getstate(), salts)
+        if claims is not None:
+            taken, claimed = claims.setdefault(filename, ({}, []))
+            taken.update(used_selectors().items())
+            claimed.extend(claimed_selectors())
+    return results
+
+def run_passes(sources, index, function_targets, debug_folder=None, vanity=None, pack_storage=False,
+               predicate_budget=None, gas_budget=None, seed=None, selectors=None, claims=None):
+    """
+    Runs every obfuscation pass over the in-memory sources. All contracts go through a pass together, so
+    passes that compile (and the gas budget) invoke solc once per pass rather than once per contract.
+    Randomized passes go contract by contract with the contract's own streams, seeded from seed, so each
+    contract's output is the same whichever other contracts are obfuscated with it. Obfuscated selectors are
+    drawn against selectors, a SelectorSet of the run; without it every contract gets its own and the
+    selectors each one took are recorded in claims (see _run_per_contract).
+    Selector registry entries are collected per contract in function_targets[filename].
+    When debug_folder is set, the output of each step is written to its own sub-folder.
+    With a gas_budget, a pass is rolled back for every contract it pushes over the budget.
+    """
+    streams = contract_streams(sources, seed)
+    enforcer = None
+    if gas_budget:
+        with tracing.span("gas budget baseline", "budget", files=len(sources)):
+            enforcer = BudgetEnforcer(gas_budget, sources)
+
+    passes = build_passes(index, function_targets, vanity, pack_storage, predicate_budget)
+    for step, (title, apply_pass) in enumerate(passes, start=1):
+        print(f"\n Step {step}: {title}")
+        previous = sources
+        previous_targets = {filename: dict(targets) for filename, targets in function_targets.items()}
+        with tracing.span(title, "stage") as stage:
+            if tracing.enabled():
+                stage.set(files=len(sources), bytes_in=sum(len(code) for code in sources.values()))
+            if title in PASS_PREPARATION:
+                PASS_PREPARATION[title](sources)
+            if title in RANDOMIZED_PASSES:
+                sources = _run_per_contract(title, apply_pass, sources, streams, selectors, claims)
+            else:
+                sources = apply_pass(sources)
+            if tracing.enabled():
+                stage.set(bytes_out=sum(len(code) for code in sources.values()))
+
+        if enforcer is not None:
+            with tracing.span(f"gas budget: {title}", "budget"):
+                sources = enforcer.enforce(title, previous, sources, function_targets, previous_targets)
+
+        if debug_folder:
+            write_contracts(os.path.join(debug_folder, f"step_{step}"), sources)
+
+    return sources
+
+_worker_index = None
+_worker_seed = None
+_worker_vanity = None
+_worker_pack_storage = False
+_worker_predicate_budget = None
+_worker_gas_budget = None
+
+def _init_worker(index, seed, vanity, trace=False, pack_storage=False, predicate_budget=None, gas_budget=None):
+    """
+    Worker initializer: receives the interaction index once per process instead of once per task.
+    """
+    global _worker_index, _worker_seed, _worker_vanity, _worker_pack_storage, _worker_predicate_budget
+    global _worker_gas_budget
+    _worker_index = index
+    _worker_seed = seed
+    _worker_pack_storage = pack_storage
+    _worker_predicate_budget = predicate_budget
+    _worker_gas_budget = gas_budget
+    if trace:
+        tracing.enable()
+    # Contracts already run in parallel, so each worker searches vanity names on its own
+    _worker_vanity = dict(vanity, jobs=1) if vanity else None
+
+def run_passes_serial(sources, index, function_targets, debug_folder=None, seed=None, vanity=None,
+                      pack_storage=False, predicate_budget=None, gas_budget=None, selectors=None):
+    """
+    Obfuscates every contract in this process, all of them going through each pass together.
+    Contracts claim obfuscated selectors in file name order from one run-wide set, seeded with selectors
+    (e.g. those of contracts reused from the cache), so no two contracts of the run share a selector.
+    """
+    targets = {}
+    obfuscated_sources = run_passes({filename: sources[filename] for filename in sorted(sources)}, index, targets,
+                                    debug_folder, vanity, pack_storage, predicate_budget, gas_budget, seed,
+                                    selectors if selectors is not None else SelectorSet())
+    for filename in sorted(sources):
+        function_targets[filename] = targets.get(filename, {})
+    return obfuscated_sources
+
+def _obfuscate_chunk(task):
+    """
+    Worker entry point: runs the pass chain over a chunk of contracts, each drawing selectors on its own.
+    """
+    sources, debug_folder = task
+    targets = {}
+    claims = {}
+    sources = run_passes(sources, _worker_index, targets, debug_folder, _worker_vanity, _worker_pack_storage,
+                         _worker_predicate_budget, _worker_gas_budget, _worker_seed, claims=claims)
+    # Trace events travel back with the result and are merged by the parent
+    return sources, targets, claims, tracing.drain()
+
+def run_passes_parallel(sources, index, function_targets, jobs, debug_folder=None, seed=None, vanity=None,
+                        pack_storage=False, predicate_budget=None, gas_budget=None, selectors=None):
+    """
+    Splits the contracts into one chunk per worker; each worker runs the pass chain over its chunk, so it
+    compiles once per pass. Workers draw selectors per contract; the parent then walks the contracts in
+    file name order against a run-wide set seeded with selectors, and obfuscates again any contract that
+    claimed a selector an earlier one holds, so the result matches run_passes_serial.
+    """
+    filenames = sorted(sources)
+    chunks = [{filename: sources[filename] for filename in filenames[k::jobs]} for k in range(min(jobs, len(filenames)))]
+
+    obfuscated_sources = {}
+    targets = {}
+    claims = {}
+    initargs = (index, seed, vanity, tracing.enabled(), pack_storage, predicate_budget, gas_budget)
+    with ProcessPoolExecutor(max_workers=len(chunks), initializer=_init_worker, initargs=initargs) as executor:
+        for chunk_sources, chunk_targets, chunk_claims, events in executor.map(
+                _obfuscate_chunk, [(chunk, debug_folder) for chunk in chunks]):
+            obfuscated_sources.update(chunk_sources)
+            targets.update(chunk_targets)
+            claims.update(chunk_claims)
+            tracing.merge(events)
+
+    known = selectors if selectors is not None else SelectorSet()
+    for filename in filenames:
+        taken, claimed = claims.get(filename, ({}, []))
+        if any(selector in known for selector, _ in claimed):
+            # Redraw exactly as the serial run would, against everything claimed before this contract
+            print(f" Selector collision with an earlier contract, obfuscating {filename} again")
+            rerun_targets = {}
+            obfuscated_sources.update(run_passes({filename: sources[filename]}, index, rerun_targets, debug_folder,
+                                                 vanity, pack_storage, predicate_budget, gas_budget, seed, known))
+            targets[filename] = rerun_targets.get(filename, {})
+            continue
+        for selector, owner in taken.items():
+            known.add(selector, owner)
+
+    for filename in filenames:
+        function_targets[filename] = targets.get(filename, {})
+    return {filename: obfuscated_sources[filename] for filename in filenames}
@@ -1,59 +1,83 @@
-import os
-import re
-import json
+from utils.solidity_lexer import tokenize, splice
+from obfuscation_techniques.dynamic_function_dispatch.selector_computer import get_function_selector, selector_literal
+
+# Selector the generated router sends to its decoy implementation, as a literal so routing never hashes
+DECOY_SELECTOR = selector_literal(get_function_selector("someFunctionSignature()"))
+
+IMPLEMENTATION_BLOCK = [
+    "function implementation() external view returns (address) {",
+    "        address fakeImplementation = address(uint160(uint256(keccak256(abi.encodePacked(blockhash(block.number - 1), msg.sender)))));",
+    "        return fakeImplementation;",
+    "    }",
+    "    function realImplementation() public view onlyAdmin returns (address) {",
+    "        return _implementation;",
+    "    }",
+]
+
+FALLBACK_HEADER = [
+    "fallback() external payable {",
+    "        address impl = _getImplementation(msg.sig);",
+    "        require(impl != address(0), \"Invalid implementation\");",
+    "        (bool success, ) = impl.delegatecall(msg.data);",
+    "        require(success, \"Delegatecall to logic contract failed\");",
+    "        address nextProxy = getNextProxy();",
+    "        require(nextProxy != address(0), \"Next proxy invalid\");",
+    "        (bool success2, ) = nextProxy.delegatecall(msg.data);",
+    "        require(success2, \"Nested delegatecall failed\");",
+]
+
+def _returns_address(tokens, function):
+    """
+    Checks that a function header declares 'returns (address)'.
+    """
+    end = function.body_open if function.body_open is not None else len(tokens)
+    for i in range(function.params_close + 1, end - 3):
+        if tokens.is_ident(i, "returns") and tokens.is_punct(i + 1, "(") \
+                and tokens.is_ident(i + 2, "address") and tokens.is_punct(i + 3, ")"):
+            return True
+    return False
+
+def _statement_end(tokens, i):
+    """
+    Index of the ';' ending the declaration that starts at token i.
+    """
+    while i < len(tokens) and not tokens.is_punct(i, ";"):
+        i += 1
+    return i
 
 def generate_obfuscated_proxy(contract_code):
     """
     Generate a Solidity proxy contract that preserves functionality, adds complexity, and incorporates obfuscation.
     """
-    lines = contract_code.split('\n')
-    obfuscated_lines = []
-    skip_implementation_block = False
-    inside_function = False
-
-    for i, line in enumerate(lines):
-        stripped = line.strip()
-
-        # Detect and replace the implementation() function
-        if re.search(r'\bfunction\s+implementation\s*\(\)\s*(public|external)?\s*(view)?\s*returns\s*\(\s*address\s*\)', stripped) or re.search(r'\baddress\s+public\s+implementation\s*;', stripped):
-            obfuscated_lines.append("    function implementation() external view returns (address) {")
-            obfuscated_lines.append("        address fakeImplementation = address(uint160(uint256(keccak256(abi.encodePacked(blockhash(block.number - 1), msg.sender)))));")
-            obfuscated_lines.append("        return fakeImplementation;")
-            obfuscated_lines.append("    }")
-            obfuscated_lines.append("    function realImplementation() public view onlyAdmin returns (address) {")
-            obfuscated_lines.append("        return _implementation;")
-            obfuscated_lines.append("    }")
-            skip_implementation_block = True
-            inside_function = True
-            continue
-
-        if skip_implementation_block:
-            if '{' in stripped:
-                inside_function = True
-            if '}' in stripped and inside_function:
-                skip_implementation_block = False
-                inside_function = False
-            continue
-
-        # Replace fallback function with obfuscated logic
-        if re.search(r'\bfallback\s*\(\s*\)\s*(external|public)?', stripped):
-            obfuscated_lines.append("    fallback() external payable {")
-            obfuscated_lines.append("        address impl = _getImplementation(msg.sig);")
-            obfuscated_lines.append("        require(impl != address(0), \"Invalid implementation\");")
-            obfuscated_lines.append("        (bool success, ) = impl.delegatecall(msg.data);")
-            obfuscated_lines.append("        require(success, \"Delegatecall to logic contract failed\");")
-            obfuscated_lines.append("        address nextProxy = getNextProxy();")
-            obfuscated_lines.append("        require(nextProxy != address(0), \"Next proxy invalid\");")
-            obfuscated_lines.append("        (bool success2, ) = nextProxy.delegatecall(msg.data);")
-            obfuscated_lines.append("        require(success2, \"Nested delegatecall failed\");")
-            continue
-
-        # Default: keep original line
-        obfuscated_lines.append(line)
+    tokens = tokenize(contract_code)
+    edits = []
+    target_contract = tokens.contracts[-1] if tokens.contracts else None
+
+    # Detect and replace the implementation() function
+    for function in tokens.functions(with_body=False):
+        if function.name == "implementation" and not tokens.between(function.params_open, function.params_close).strip() \
+                and _returns_address(tokens, function):
+            end = function.body_close if function.body_close is not None else _statement_end(tokens, function.params_close)
+            edits.append((tokens.starts[function.keyword], tokens.ends[end], "\n".join(IMPLEMENTATION_BLOCK)))
+
+    # ... or the 'address public implementation;' state variable
+    for i in range(len(tokens) - 3):
+        if tokens.is_ident(i, "address") and tokens.is_ident(i + 1, "public") \
+                and tokens.is_ident(i + 2, "implementation") and tokens.is_punct(i + 3, ";"):
+            edits.append((tokens.starts[i], tokens.ends[i + 3], "\n".join(IMPLEMENTATION_BLOCK)))
+
+    # Replace fallback function header with obfuscated logic; the original body follows it
+    for fallback in tokens.callables:
+        if fallback.kind == "fallback" and fallback.body_open is not None:
+            edits.append((tokens.starts[fallback.keyword], tokens.ends[fallback.body_open], "\n".join(FALLBACK_HEADER)))
+            target_contract = tokens.enclosing_contract(fallback.keyword) or target_contract
+
+    # New members go inside the proxy contract, before its closing brace
+    members = []
 
     # Add receive() function if not present
     if "receive() external payable" not in contract_code:
-        obfuscated_lines.append("    receive() external payable {}")
+        members.append("    receive() external payable {}")
 
     # Add helper functions for dynamic routing
     if "_getImplementation" not in contract_code and "getNextProxy" not in contract_code:
@@ -61,7 +85,7 @@ def generate_obfuscated_proxy(contract_code):
 
 function _getImplementation(bytes4 selector) internal view returns (address) {
 
-    if (selector == bytes4(keccak256("someFunctionSignature()"))) {
+    if (selector == DECOY_SELECTOR) {
         return 0x1234567890123456789012345678901234567890; 
     }
     return _implementation; 
@@ -75,62 +99,33 @@ modifier onlyAdmin() {
     require(msg.sender == _admin, "Only admin can call this function");
     _;
 }
-""".strip()
-        obfuscated_lines.append(helper_code)
+""".strip().replace("DECOY_SELECTOR", DECOY_SELECTOR)
+        members.append(helper_code)
 
-    return '\n'.join(obfuscated_lines)
+    if members:
+        if target_contract is not None and target_contract.body_close is not None:
+            edits.append(tokens.insert_before(target_contract.body_close, "\n" + "\n\n".join(members), indent=""))
+        else:
+            edits.append((len(contract_code), len(contract_code), "\n" + "\n\n".join(members)))
+
+    return splice(contract_code, edits)
 
-def process_proxy_files(contract_folder, output_folder, json_file):
+def process_proxy_files(sources, index):
     """
-    Process Solidity contracts to obfuscate proxy and non-proxy files, ensuring all are written to output.
+    Obfuscate in-memory proxy and non-proxy contracts (file name -> code), returning every contract.
     """
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
-
-    # Load interactions from the JSON file
-    try:
-        with open(json_file, "r") as f:
-            data = json.load(f)
-            interactions = data.get("interactions", [])
-    except Exception as e:
-        print(f" Error loading JSON file: {e}")
-        return
-
-    # Iterate through all contracts in the folder
-    for filename in os.listdir(contract_folder):
-        if not filename.endswith(".sol"):
-            continue
-
-        input_path = os.path.join(contract_folder, filename)
-        output_path = os.path.join(output_folder, filename)
-
-        # Read the contract code
-        try:
-            with open(input_path, "r", encoding="utf-8") as f:
-                contract_code = f.read()
-        except Exception as e:
-            print(f" Failed to read contract file {filename}: {e}")
-            continue
-
+    obfuscated_sources = {}
+    for filename, contract_code in sources.items():
         # Check if this contract matches a "proxy" interaction
-        is_proxy = any(
-            interaction.get("caller") == filename and interaction.get("interaction_type") == "proxy"
-            for interaction in interactions
-        )
+        is_proxy = index.has(filename, "proxy")
 
         if is_proxy:
             # Generate obfuscated proxy contract
-            obfuscated_code = generate_obfuscated_proxy(contract_code)
+            obfuscated_sources[filename] = generate_obfuscated_proxy(contract_code)
             print(f" Processed (proxy): {filename}")
         else:
-            # Write the contract as-is or apply placeholder obfuscation
-            obfuscated_code = contract_code
+            # Keep the contract as-is
+            obfuscated_sources[filename] = contract_code
             print(f" Processed (non-proxy): {filename}")
 
-        # Write the output
-        try:
-            with open(output_path, "w", encoding="utf-8") as f:
-                f.write(obfuscated_code)
-            print(f" Contract saved to: {output_path}")
-        except Exception as e:
-            print(f" Failed to save contract {filename}: {e}")
+    return obfuscated_sources
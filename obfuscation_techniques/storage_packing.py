@@ -0,0 +1,206 @@
+import bisect
+import logging
+from utils.solc_compiler import compile_with_diagnostics
+from utils.solidity_lexer import tokenize, splice
+
+SLOT_BYTES = 32
+
+# Cold access costs an extra packed slot no longer pays (EIP-2929, EIP-2200)
+COLD_SLOAD_GAS = 2100
+SSTORE_SET_GAS = 20000
+
+# Interactions whose storage layout is shared with another contract through delegatecall
+LAYOUT_SHARING_TYPES = ("proxy", "delegate_call")
+
+
+def _size(types, variable):
+    return int(types[variable["type"]]["numberOfBytes"])
+
+
+def _packable(types, variable):
+    """
+    Values shorter than a slot share slots with their neighbours; structs, arrays, mappings and dynamic
+    types always start a new slot and the next variable starts another one.
+    """
+    return types[variable["type"]]["encoding"] == "inplace" and _size(types, variable) < SLOT_BYTES
+
+
+def _allocate(types, variables, slot=0, offset=0):
+    """
+    Replays the compiler's allocation of variables starting at (slot, offset).
+    Returns the (slot, offset) of each variable and the first slot left free.
+    """
+    positions = []
+    for variable in variables:
+        size = _size(types, variable)
+        if _packable(types, variable):
+            if offset + size > SLOT_BYTES:
+                slot, offset = slot + 1, 0
+            positions.append((slot, offset))
+            offset += size
+        else:
+            if offset:
+                slot, offset = slot + 1, 0
+            positions.append((slot, 0))
+            slot += -(-size // SLOT_BYTES)
+    return positions, slot + (1 if offset else 0)
+
+
+def _inherited_end(types, inherited):
+    """
+    Where the contract's own variables start: after the last inherited variable, in its slot if it has room.
+    """
+    if not inherited:
+        return 0, 0
+    last = inherited[-1]
+    slot = int(last["slot"])  # storageLayout reports slots as decimal strings
+    if _packable(types, last):
+        return slot, last["offset"] + _size(types, last)
+    return slot + -(-_size(types, last) // SLOT_BYTES), 0
+
+
+def pack_order(types, variables, start=(0, 0)):
+    """
+    Reorders variables to use as few slots as possible: first-fit decreasing over the packable ones,
+    filling the free space of the start slot first, followed by the full-slot variables in their
+    original order. Ties keep declaration order.
+    """
+    slot, offset = start
+    bins = [[SLOT_BYTES - offset, []]] if offset else []
+    for variable in sorted((v for v in variables if _packable(types, v)), key=lambda v: -_size(types, v)):
+        size = _size(types, variable)
+        for free in bins:
+            if size <= free[0]:
+                free[0] -= size
+                free[1].append(variable)
+                break
+        else:
+            bins.append([SLOT_BYTES - size, [variable]])
+    packed = [variable for _, members in bins for variable in members]
+    return packed + [variable for variable in variables if not _packable(types, variable)]
+
+
+def _state_variables(ast):
+    """
+    State variable declarations of every contract in a source AST: id -> (src offset, src length, initializer).
+    """
+    declarations = {}
+    for node in ast.get("nodes", []):
+        if node.get("nodeType") != "ContractDefinition":
+            continue
+        for member in node.get("nodes", []):
+            if member.get("nodeType") == "VariableDeclaration" and member.get("stateVariable"):
+                start, length, _ = (int(part) for part in member["src"].split(":"))
+                declarations[member["id"]] = (start, length, member.get("value"))
+    return declarations
+
+
+def _declaration_span(code, code_bytes, tokens, start):
+    """
+    Character span of a state variable declaration starting at byte offset start, including its ';'.
+    """
+    start = len(code_bytes[:start].decode("utf-8", errors="ignore"))
+    first = bisect.bisect_left(tokens.starts, start)
+    i = first
+    while i < len(tokens) and not (tokens.is_punct(i, ";") and tokens.depths[i] == tokens.depths[first]
+                                   and tokens.parens[i] == tokens.parens[first]):
+        i += 1
+    return tokens.starts[first], tokens.ends[i]
+
+
+def _uses_assembly(tokens, contract):
+    """
+    Inline assembly can address slots by number, so its contracts keep their layout.
+    """
+    return any(tokens.is_ident(i, "assembly") for i in range(contract.body_open, contract.body_close))
+
+
+def pack_contract_storage(filename, code, compiled):
+    """
+    Reorders the state variables of every contract in one compiled source to use fewer storage slots.
+    Returns (code, report) where report lists (contract, slots before, slots after) for rewritten contracts.
+    """
+    code_bytes = code.encode("utf-8")
+    tokens = tokenize(code)
+    declarations = _state_variables(compiled["sources"][filename]["ast"])
+    edits = []
+    report = []
+
+    for name, output in compiled.get("contracts", {}).get(filename, {}).items():
+        layout = output.get("storageLayout") or {}
+        types = layout.get("types") or {}
+        storage = layout.get("storage", [])
+        own = [variable for variable in storage if variable["contract"] == f"{filename}:{name}"]
+        inherited = [variable for variable in storage if variable["contract"] != f"{filename}:{name}"]
+        if len(own) < 2 or any(variable["astId"] not in declarations for variable in own):
+            continue
+
+        contract = next((span for span in tokens.contracts if span.name == name), None)
+        if contract is None or contract.body_close is None or _uses_assembly(tokens, contract):
+            continue
+
+        # Initializers run in declaration order; only constants can move freely
+        if any(declarations[v["astId"]][2] and declarations[v["astId"]][2].get("nodeType") != "Literal" for v in own):
+            logging.info(f"{filename}:{name}: state variable initializers depend on order, layout kept")
+            continue
+
+        start = _inherited_end(types, inherited)
+        positions, end = _allocate(types, own, *start)
+        if positions != [(int(variable["slot"]), variable["offset"]) for variable in own]:
+            logging.warning(f"{filename}:{name}: compiler layout differs from the expected allocation, layout kept")
+            continue
+
+        order = pack_order(types, own, start)
+        _, packed_end = _allocate(types, order, *start)
+        if packed_end >= end:
+            continue
+
+        spans = {v["astId"]: _declaration_span(code, code_bytes, tokens, declarations[v["astId"]][0]) for v in own}
+        for variable, moved in zip(own, order):
+            moved_start, moved_end = spans[moved["astId"]]
+            edits.append((*spans[variable["astId"]], code[moved_start:moved_end]))
+        report.append((name, end - start[0], packed_end - start[0]))
+
+    return splice(code, edits), report
+
+
+def process_storage_packing(sources, index):
+    """
+    Packs the storage of in-memory contracts (file name -> code) from the compiler's storageLayout.
+    Contracts flagged as proxies or delegatecall users share their layout with other contracts and are
+    never reordered, nor are sources that fail to compile.
+    """
+    packable = {filename: code for filename, code in sources.items()
+                if not any(index.has(filename, interaction_type) for interaction_type in LAYOUT_SHARING_TYPES)}
+    for filename in sources:
+        if filename not in packable:
+            print(f" Storage layout kept (proxy): {filename}")
+    if not packable:
+        return sources
+
+    try:
+        compiled = compile_with_diagnostics(packable, {"*": ["storageLayout"], "": ["ast"]})
+    except Exception as e:
+        logging.error(f"Storage packing skipped, compilation failed: {e}")
+        return sources
+
+    failed = {error.get("sourceLocation", {}).get("file") for error in compiled.get("errors", [])
+              if error["severity"] == "error"}
+    packed_sources = dict(sources)
+    saved = 0
+    for filename, code in packable.items():
+        if filename in failed or None in failed or filename not in compiled.get("sources", {}):
+            print(f" Storage layout kept (does not compile): {filename}")
+            continue
+
+        packed_sources[filename], report = pack_contract_storage(filename, code, compiled)
+        for name, before, after in report:
+            saved += before - after
+            print(f" Packed storage: {filename}:{name} {before} -> {after} slots")
+        if not report:
+            print(f" Storage layout kept (nothing to pack): {filename}")
+
+    if saved:
+        print(f" Storage packing saved {saved} slots: up to {saved} fewer cold SLOADs ({COLD_SLOAD_GAS} gas each) "
+              f"and SSTOREs to fresh slots ({SSTORE_SET_GAS} gas each)")
+    return packed_sources
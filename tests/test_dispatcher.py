@@ -0,0 +1,83 @@
+import re
+import random
+import pytest
+from obfuscation_techniques.dynamic_function_dispatch.dispatcher import (
+    build_dispatcher, worst_case_gas, CALL_KINDS, TABLE_THRESHOLD)
+
+ASSEMBLY_START = "let s := shr(224, selector)\n"
+
+
+def _random_selectors(count, seed):
+    rng = random.Random(seed)
+    selectors = {}
+    while len(selectors) < count:
+        selectors[rng.getrandbits(32)] = rng.choice(sorted(CALL_KINDS))
+    return selectors
+
+
+def _lookup(code, selector):
+    """Evaluates the Yul if-tree of a generated dispatcher for one selector by translating it to Python."""
+    start = code.index(ASSEMBLY_START) + len(ASSEMBLY_START)
+    tree = code[start:code.index("\n        }\n", start) + 1]
+    lines = []
+    for line in tree.splitlines():
+        indent, text = line[:len(line) - len(line.lstrip())], line.strip()
+        if text == "}":
+            continue
+        if match := re.fullmatch(r"switch lt\(s, (0x[0-9a-f]{8})\)", text):
+            lines.append(f"{indent}below = s < {match[1]}")
+        elif text == "case 0 {":
+            lines.append(f"{indent}if not below:")
+        elif text == "default {":
+            lines.append(f"{indent}else:")
+        else:
+            match = re.fullmatch(r"if eq\(s, (0x[0-9a-f]{8})\) \{ kind := (\d) \}", text)
+            lines.append(f"{indent}if s == {match[1]}: kind = {match[2]}")
+    env = {"s": selector, "kind": 0}
+    exec("if True:\n" + "\n".join(lines), env)
+    return env["kind"]
+
+
+@pytest.mark.parametrize("count", [1, 2, 3, 7, 16, TABLE_THRESHOLD])
+def test_tree_finds_every_selector_and_rejects_others(count):
+    selectors = _random_selectors(count, count)
+    code, report = build_dispatcher("dispatchFunction", selectors)
+    assert report["layout"] == "tree"
+    assert report["selectors"] == count
+
+    for selector, kind in selectors.items():
+        assert _lookup(code, selector) == CALL_KINDS[kind]
+    for selector in _random_selectors(50, -count):
+        if selector not in selectors:
+            assert _lookup(code, selector) == 0
+
+
+def test_tree_depth_is_logarithmic():
+    code, report = build_dispatcher("dispatchFunction", _random_selectors(TABLE_THRESHOLD, 1))
+    assert report["depth"] == 6
+    assert code.count("switch lt(s,") == TABLE_THRESHOLD - 1
+    assert report["worst_case_gas"] == worst_case_gas(TABLE_THRESHOLD)
+
+
+def test_large_sets_use_a_sorted_packed_table():
+    selectors = _random_selectors(TABLE_THRESHOLD + 1, 2)
+    code, report = build_dispatcher("dispatchFunction", selectors)
+    assert report["layout"] == "table"
+
+    table = bytes.fromhex(re.search(r'hex"([0-9a-f]+)"', code)[1])
+    entries = [(int.from_bytes(table[k:k + 4], "big"), int.from_bytes(table[k + 4:k + 8], "big"))
+               for k in range(0, len(table), 8)]
+    assert entries == sorted((selector, CALL_KINDS[kind]) for selector, kind in selectors.items())
+    assert f"let high := {len(selectors)}" in code
+
+
+def test_static_call_dispatcher_is_view_and_only_makes_static_calls():
+    code, _ = build_dispatcher("dispatchStaticCall", {0x01020304: "staticcall"})
+    assert "internal view returns (bool, bytes memory)" in code
+    assert "target.staticcall(data)" in code
+    assert "target.call(data)" not in code and "target.delegatecall(data)" not in code
+
+    code, _ = build_dispatcher("dispatchFunction", {0x01020304: "call", 0x05060708: "delegatecall"})
+    assert " view " not in code
+    assert "target.call(data)" in code and "target.delegatecall(data)" in code
+    assert code.rstrip().endswith("revert('Unknown selector');\n    }")
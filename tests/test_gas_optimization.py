@@ -0,0 +1,45 @@
+import pytest
+from gas_optimization import optimize_bytecode, decode
+
+JUMPDEST = 0x5B
+
+
+def _jump_targets(code):
+    """Offsets pushed right before each JUMP, and the JUMPDEST offsets of the code."""
+    offsets, position = [], 0
+    instructions = decode(bytes.fromhex(code))
+    for opcode, data, _ in instructions:
+        offsets.append(position)
+        position += 1 + len(data or b"")
+    targets = [int.from_bytes(instructions[k - 1][1], "big")
+               for k, (opcode, _, _) in enumerate(instructions) if opcode == 0x56]
+    jumpdests = [offset for offset, (opcode, _, _) in zip(offsets, instructions) if opcode == JUMPDEST]
+    return targets, jumpdests
+
+
+def test_jump_destinations_follow_removed_code():
+    # PUSH1 0x2a POP | PUSH1 0x06 JUMP | JUMPDEST STOP
+    optimized, report = optimize_bytecode("602a50600656" "5b00")
+    assert optimized == "600356" "5b00"
+    assert report["push-pop"]["matches"] == 1
+
+
+def test_only_pushes_used_as_jump_targets_are_relocated():
+    # PUSH1 0x08 (a value that equals the old JUMPDEST offset) | PUSH1 0x2a POP | PUSH1 0x08 JUMP | JUMPDEST STOP
+    optimized, _ = optimize_bytecode("6008602a50600856" "5b00")
+    assert optimized == "6008600556" "5b00"
+
+    targets, jumpdests = _jump_targets(optimized)
+    assert targets == jumpdests == [5]
+
+
+def test_destinations_moved_through_the_stack_are_relocated():
+    # PUSH1 0x2a POP | PUSH1 0x09 PUSH1 0x01 SWAP1 JUMP | JUMPDEST STOP
+    optimized, _ = optimize_bytecode("0x" "602a50600960019056" "5b00")
+    assert optimized == "0x" "600660019056" "5b00"
+
+
+def test_computed_jump_destinations_are_rejected():
+    # PUSH1 0x2a POP | PUSH1 0x04 PUSH1 0x04 ADD JUMP | JUMPDEST STOP
+    with pytest.raises(ValueError):
+        optimize_bytecode("602a506004600401565b00")
@@ -0,0 +1,47 @@
+from utils.interaction_index import InteractionIndex
+from utils.obfuscation_cache import ObfuscationCache
+
+CONFIG = {"version": 1, "passes": ["Opaque Predicate Obfuscation"]}
+INTERACTIONS = [
+    {"caller": "A.sol", "callee": "B", "interaction_type": "high_level", "interaction_role": "initiator"},
+    {"caller": "B.sol", "callee": "C", "interaction_type": "delegatecall", "interaction_role": "executor"},
+]
+
+
+def _key(code="contract A {}", interactions=INTERACTIONS, config=CONFIG, seed="7", filename="A.sol"):
+    return ObfuscationCache.key(filename, code, InteractionIndex(interactions), config, seed)
+
+
+def test_key_is_stable_for_the_same_inputs():
+    assert _key() == _key()
+
+
+def test_key_changes_with_every_input_of_the_contract():
+    keys = {
+        _key(),
+        _key(code="contract A { uint x; }"),
+        _key(config=dict(CONFIG, version=2)),
+        _key(seed="8"),
+        _key(filename="Other.sol"),
+        _key(interactions=[dict(INTERACTIONS[0], callee="D"), INTERACTIONS[1]]),
+    }
+    assert len(keys) == 6
+
+
+def test_key_ignores_other_contracts_unless_rules_change():
+    same_rule = [INTERACTIONS[0], dict(INTERACTIONS[1], callee="D")]
+    assert _key(interactions=same_rule) == _key()
+
+    new_rule = INTERACTIONS + [{"caller": "C.sol", "interaction_type": "factory", "interaction_role": "creator"}]
+    assert _key(interactions=new_rule) != _key()
+
+
+def test_entries_round_trip(tmp_path):
+    cache = ObfuscationCache(folder=str(tmp_path))
+    key = _key()
+    assert cache.get(key) is None
+
+    targets = {"0x11111111": {"function_signature": "f()", "contract_address": ""}}
+    cache.put(key, "contract A { }", targets)
+    assert cache.get(key) == ("contract A { }", targets)
+    assert (cache.hits, cache.misses) == (1, 1)
@@ -0,0 +1,47 @@
+from obfuscation_techniques.dynamic_function_dispatch.selector_computer import (
+    SelectorSet, reset_selectors, reserve_selector, claim_selector, claimed_selectors, registry_selectors)
+
+
+def test_add_reports_the_first_owner_on_a_collision():
+    selectors = SelectorSet()
+    assert selectors.add(0x12345678, "A.sol:f()") is None
+    assert selectors.add(0x12345678, "B.sol:g()") == "A.sol:f()"
+    assert 0x12345678 in selectors
+    assert selectors.owner(0x12345678) == "A.sol:f()"
+    assert len(selectors) == 1
+
+
+def test_zero_selector_is_tracked_apart_from_empty_slots():
+    selectors = SelectorSet()
+    assert 0 not in selectors
+    assert selectors.add(0, "A.sol:f()") is None
+    assert 0 in selectors
+    assert selectors.add(0, "B.sol:g()") == "A.sol:f()"
+    assert dict(selectors.items()) == {0: "A.sol:f()"}
+
+
+def test_growth_keeps_every_selector_and_owner():
+    selectors = SelectorSet(capacity=4)
+    values = [(k * 2654435761 + 7) & 0xFFFFFFFF for k in range(5000)]
+    for k, value in enumerate(values):
+        assert selectors.add(value, f"owner{k % 3}") is None
+
+    assert len(selectors) == len(values)
+    assert all(value in selectors for value in values)
+    assert dict(selectors.items()) == {value: f"owner{k % 3}" for k, value in enumerate(values)}
+    assert not any(value + 1 in selectors for value in values if value + 1 not in values)
+
+
+def test_claims_are_checked_against_a_seeded_run_wide_set():
+    fragments = {"A.sol": {"0x11111111": {"function_signature": "f(uint256)", "contract_address": "",
+                                          "real_selector": "0x22222222"}}}
+    reset_selectors(registry_selectors(fragments))
+
+    assert not claim_selector("0x11111111", "B.sol:g()")
+    assert not claim_selector("0x22222222", "B.sol:g()")
+    assert claim_selector("0x33333333", "B.sol:g()")
+    assert reserve_selector(0x33333333, "C.sol:h() (real)") == "B.sol:g()"
+    assert claimed_selectors() == [(0x33333333, "B.sol:g()")]
+
+    reset_selectors()
+    assert claim_selector("0x11111111", "B.sol:g()")
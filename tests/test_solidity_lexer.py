@@ -0,0 +1,71 @@
+from utils.solidity_lexer import tokenize
+
+SOURCE = """
+// contract Commented { function hidden() public {} }
+interface IToken {
+    function transfer(address to, uint256 amount) external returns (bool);
+}
+
+abstract contract Vault is IToken {
+    string constant NOTE = "function fake() { }";
+
+    modifier onlyOwner {
+        _;
+    }
+
+    constructor(address owner) {}
+
+    function deposit(uint256 amount) external onlyOwner returns (uint256) {
+        if (amount > 0) { return amount; }
+        return 0;
+    }
+
+    receive() external payable {}
+}
+"""
+
+
+def test_contract_spans_cover_their_bodies():
+    tokens = tokenize(SOURCE)
+    assert [(span.kind, span.name) for span in tokens.contracts] == [("interface", "IToken"), ("contract", "Vault")]
+
+    vault = tokens.contracts[1]
+    assert tokens.text(vault.keyword) == "abstract"
+    assert tokens.is_punct(vault.body_open, "{") and tokens.is_punct(vault.body_close, "}")
+    assert tokens.matches[vault.body_open] == vault.body_close
+    assert tokens.source[tokens.ends[vault.body_close]:].strip() == ""
+
+
+def test_callables_skip_comments_and_strings():
+    tokens = tokenize(SOURCE)
+    assert [(c.kind, c.name) for c in tokens.callables] == [
+        ("function", "transfer"), ("modifier", "onlyOwner"), ("constructor", "constructor"),
+        ("function", "deposit"), ("receive", "receive"),
+    ]
+    assert [f.name for f in tokens.functions()] == ["deposit"]
+    assert [f.name for f in tokens.functions(with_body=False)] == ["transfer", "deposit"]
+
+
+def test_callable_spans_match_their_brackets():
+    tokens = tokenize(SOURCE)
+    transfer, modifier, _, deposit, _ = tokens.callables
+
+    assert transfer.body_open is None and transfer.body_close is None
+    assert tokens.between(transfer.params_open, transfer.params_close) == "address to, uint256 amount"
+    assert modifier.params_open is None and modifier.params_close is None
+
+    assert tokens.between(deposit.params_open, deposit.params_close) == "uint256 amount"
+    assert tokens.matches[deposit.body_open] == deposit.body_close
+    body = tokens.between(deposit.body_open, deposit.body_close)
+    assert body.strip().startswith("if (amount > 0)") and body.strip().endswith("return 0;")
+
+
+def test_enclosing_contract_and_callable():
+    tokens = tokenize(SOURCE)
+    deposit = tokens.functions()[0]
+    inside = deposit.body_open + 1
+
+    assert tokens.enclosing_callable(inside) is deposit
+    assert tokens.enclosing_contract(inside).name == "Vault"
+    assert tokens.enclosing_callable(deposit.keyword) is None
+    assert tokens.enclosing_contract(0) is None
@@ -1,13 +1,14 @@
 import os
 import json
+from utils import tracing
 
 def get_latest_json(folder_path):
     """
     Fetch the latest JSON file from the specified folder.
     """
     try:
-        # List all JSON files in the folder
-        json_files = [f for f in os.listdir(folder_path) if f.endswith(".json")]
+        # List all JSON and JSONL result files in the folder
+        json_files = [f for f in os.listdir(folder_path) if f.endswith((".json", ".jsonl")) and f != "manifest.json"]
 
         if not json_files:
             raise FileNotFoundError("No JSON files found in the folder.")
@@ -52,6 +53,52 @@ def load_json(file_path):
         raise Exception(f"Unexpected error while loading JSON: {e}")
 
 
+def write_jsonl(file, interactions):
+    """
+    Appends interactions to an open JSONL file, one compact JSON object per line.
+    """
+    for interaction in interactions:
+        file.write(json.dumps(interaction, separators=(",", ":")))
+        file.write("\n")
+
+
+def iter_interactions(file_path):
+    """
+    Yields interactions one at a time. JSONL files are streamed line by line;
+    JSON files with an 'interactions' list are loaded with load_json.
+    """
+    if not file_path.endswith(".jsonl"):
+        yield from load_json(file_path)
+        return
+
+    with open(file_path, "r", encoding="utf-8") as file:
+        for line_number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            try:
+                interaction = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Failed to decode line {line_number} of {file_path}. Error: {e}")
+            if not isinstance(interaction, dict):
+                raise ValueError(f"Invalid JSONL structure: line {line_number} of {file_path} is not an object.")
+            yield interaction
+
+
+def convert_json_to_jsonl(json_path, jsonl_path=None):
+    """
+    Converts an 'interactions' JSON results file to JSONL. Returns the JSONL path.
+    """
+    if jsonl_path is None:
+        jsonl_path = os.path.splitext(json_path)[0] + ".jsonl"
+
+    # Write then rename so a half-written file is never picked up as the latest results
+    tmp_path = f"{jsonl_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        write_jsonl(file, load_json(json_path))
+    os.replace(tmp_path, jsonl_path)
+    return jsonl_path
+
+
 def manage_intermediate_files(folder_path):
     """
     Retrieves Solidity files from the intermediate folder.
@@ -69,6 +116,28 @@ def delete_intermediate_files(folder_path):
     print(f"Deleted intermediate files in {folder_path}.")
 
 
+def read_contracts(file_paths):
+    """
+    Reads Solidity files into memory, keyed by file name.
+    """
+    sources = {}
+    for path in file_paths:
+        with open(path, "r", encoding="utf-8") as f:
+            sources[os.path.basename(path)] = f.read()
+    return sources
+
+
+def write_contracts(output_folder, sources):
+    """
+    Writes in-memory Solidity sources (file name -> code) to the output folder.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    for file_name, code in sources.items():
+        with open(os.path.join(output_folder, file_name), "w", encoding="utf-8") as f:
+            f.write(code)
+    tracing.count("disk writes", len(sources))
+
+
 def write_final_output(output_folder, file_name, code):
     """
     Writes the final obfuscated contract to the output folder.
@@ -76,4 +145,5 @@ def write_final_output(output_folder, file_name, code):
     output_path = os.path.join(output_folder, file_name)
     with open(output_path, "w", encoding="utf-8") as f:
         f.write(code)
+    tracing.count("disk writes")
     print(f"✅ Final output written to {output_path}")
@@ -0,0 +1,182 @@
+import os
+import re
+import logging
+from utils.solc_compiler import compile_with_diagnostics
+
+DEPLOY_GAS_LIMIT = 30_000_000
+CALL_GAS_LIMIT = 10_000_000
+
+_ARRAY_SUFFIX = re.compile(r"^(.*)\[(\d*)\]$")
+
+
+def _abi_type(param):
+    """
+    Canonical ABI type of a parameter, expanding tuples from their components.
+    """
+    abi_type = param["type"]
+    if abi_type.startswith("tuple"):
+        return "(" + ",".join(_abi_type(component) for component in param["components"]) + ")" + abi_type[len("tuple"):]
+    return abi_type
+
+
+def _sample_value(abi_type, sender):
+    """
+    A plausible argument for an ABI type: the sender for addresses, 1 for numbers, short non-empty data otherwise.
+    """
+    array = _ARRAY_SUFFIX.match(abi_type)
+    if array:
+        element, length = array.groups()
+        return [_sample_value(element, sender)] * (int(length) if length else 1)
+    if abi_type.startswith("("):
+        return tuple(_sample_value(element, sender) for element in _split_tuple(abi_type[1:-1]))
+    if abi_type == "address":
+        return sender
+    if abi_type == "bool":
+        return True
+    if abi_type == "string":
+        return "obfuscation"
+    if abi_type == "bytes":
+        return b"\x01"
+    if abi_type.startswith("bytes"):
+        return b"\x01" * int(abi_type[len("bytes"):])
+    return 1  # uintN, intN
+
+
+def _split_tuple(types):
+    parts, depth, current = [], 0, ""
+    for char in types:
+        if char == "," and depth == 0:
+            parts.append(current)
+            current = ""
+            continue
+        depth += char == "("
+        depth -= char == ")"
+        current += char
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _encode_arguments(inputs, sender):
+    from eth_abi import encode
+
+    types = [_abi_type(param) for param in inputs]
+    return encode(types, [_sample_value(abi_type, sender) for abi_type in types])
+
+
+def compile_for_gas(file_paths):
+    """
+    Compiles contracts for deployment in one batch. Files that fail are recompiled alone so one broken
+    file does not hide the others. Returns path -> {"errors", "contracts": {name: {"abi", "bytecode", "runtime"}}}.
+    """
+    output_selection = {"*": ["abi", "evm.bytecode.object", "evm.deployedBytecode.object"]}
+    sources = {}
+    for path in file_paths:
+        with open(path, "r", encoding="utf-8") as f:
+            sources[path] = f.read()
+    folders = sorted({os.path.dirname(os.path.abspath(path)) for path in file_paths})
+    results = {path: {"errors": [], "contracts": {}} for path in sources}
+
+    def collect(compiled, paths):
+        failed = set()
+        for error in compiled.get("errors", []):
+            if error["severity"] != "error":
+                continue
+            path = error.get("sourceLocation", {}).get("file")
+            for target in ([path] if path in results else paths):
+                results[target]["errors"].append(error.get("formattedMessage", error.get("message", "")))
+                failed.add(target)
+        for path, contracts in compiled.get("contracts", {}).items():
+            for name, output in contracts.items():
+                evm = output.get("evm", {})
+                results[path]["contracts"][name] = {
+                    "abi": output.get("abi", []),
+                    "bytecode": evm.get("bytecode", {}).get("object", ""),
+                    "runtime": evm.get("deployedBytecode", {}).get("object", ""),
+                }
+        return failed
+
+    failed = collect(compile_with_diagnostics(sources, output_selection, allow_paths=folders), list(sources))
+    if failed and len(sources) > 1:
+        for path in sources:
+            results[path] = {"errors": [], "contracts": {}}
+            collect(compile_with_diagnostics({path: sources[path]}, output_selection, allow_paths=folders), [path])
+    return results
+
+
+def measure_contract(tester, sender, contract):
+    """
+    Deploys one compiled contract and sends a transaction to each of its functions from a fresh snapshot.
+    Returns {"deploy_gas", "bytecode_size", "functions": {signature: gas or None if it reverted}}.
+    """
+    from eth_tester.exceptions import TransactionFailed
+
+    abi = contract["abi"]
+    constructor = next((item for item in abi if item["type"] == "constructor"), None)
+    data = "0x" + contract["bytecode"]
+    if constructor and constructor.get("inputs"):
+        data += _encode_arguments(constructor["inputs"], sender).hex()
+
+    result = {"deploy_gas": None, "bytecode_size": len(contract["runtime"]) // 2, "functions": {}}
+    transaction = {"from": sender, "data": data, "gas": DEPLOY_GAS_LIMIT}
+    if constructor and constructor.get("stateMutability") == "payable":
+        transaction["value"] = 1
+    try:
+        receipt = tester.get_transaction_receipt(tester.send_transaction(transaction))
+    except TransactionFailed:
+        receipt = {"status": 0}
+    if receipt["status"] == 0:
+        logging.warning("Deployment reverted")
+        return result
+    result["deploy_gas"] = receipt["gas_used"]
+    address = receipt["contract_address"]
+
+    from eth_utils import function_signature_to_4byte_selector
+
+    for item in abi:
+        if item["type"] != "function":
+            continue
+        signature = f"{item['name']}({','.join(_abi_type(param) for param in item.get('inputs', []))})"
+        calldata = function_signature_to_4byte_selector(signature) + _encode_arguments(item.get("inputs", []), sender)
+        call = {"from": sender, "to": address, "data": "0x" + calldata.hex(), "gas": CALL_GAS_LIMIT}
+        if item.get("stateMutability") == "payable":
+            call["value"] = 1
+
+        # Every call starts from the freshly deployed state
+        snapshot = tester.take_snapshot()
+        try:
+            receipt = tester.get_transaction_receipt(tester.send_transaction(call))
+            result["functions"][signature] = receipt["gas_used"] if receipt["status"] else None
+        except TransactionFailed:
+            result["functions"][signature] = None
+        finally:
+            tester.revert_to_snapshot(snapshot)
+
+    return result
+
+
+def measure_files(file_paths):
+    """
+    Compiles and measures every deployable contract of the given files on an in-process EVM (py-evm, no network).
+    Returns path -> {"errors", "contracts": {name: measurement}}.
+    """
+    from eth_tester import EthereumTester, PyEVMBackend
+
+    tester = EthereumTester(PyEVMBackend())
+    sender = tester.get_accounts()[0]
+
+    measurements = {}
+    for path, compiled in compile_for_gas(file_paths).items():
+        measurements[path] = {"errors": compiled["errors"], "contracts": {}}
+        for name, contract in compiled["contracts"].items():
+            if not contract["bytecode"]:
+                continue  # Interfaces and abstract contracts cannot be deployed
+            if "__$" in contract["bytecode"]:
+                logging.warning(f"Skipping {name} in {path}: needs library linking")
+                continue
+            snapshot = tester.take_snapshot()
+            try:
+                measurements[path]["contracts"][name] = measure_contract(tester, sender, contract)
+            finally:
+                tester.revert_to_snapshot(snapshot)
+    return measurements
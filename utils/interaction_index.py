@@ -0,0 +1,79 @@
+from collections import defaultdict
+from utils.file_handler import iter_interactions
+
+
+class InteractionIndex:
+    """
+    In-memory index over the interaction analysis, loaded once and shared by every obfuscation stage.
+    Lookups by caller are O(1) instead of a scan over all interactions.
+    """
+
+    def __init__(self, interactions):
+        self._count = 0
+        self._by_caller = defaultdict(list)
+        self._caller_types = defaultdict(set)
+        self._rule_roles = {}  # interaction_type -> role of the first valid rule, in first-seen order
+
+        # Built one record at a time, so a streamed JSONL file is never held as a list as well
+        for interaction in interactions:
+            self.add(interaction)
+
+    def add(self, interaction):
+        """
+        Indexes one interaction record.
+        """
+        caller = interaction.get("caller")
+        interaction_type = interaction.get("interaction_type")
+        role = interaction.get("interaction_role")
+
+        self._count += 1
+        self._by_caller[caller].append(interaction)
+        self._caller_types[caller].add(interaction_type)
+
+        # Rules without a role or type are skipped by the opaque predicate pass
+        rule_role = (role or "").lower()
+        rule_type = (interaction_type or "").lower()
+        if rule_role and rule_type and rule_type not in self._rule_roles:
+            self._rule_roles[rule_type] = rule_role
+
+    @classmethod
+    def from_json(cls, json_file):
+        """
+        Builds the index from an analysis results file (JSON or streamed JSONL).
+        """
+        return cls(iter_interactions(json_file))
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        """
+        Iterates over every interaction, grouped by caller in first-seen order.
+        """
+        for interactions in self._by_caller.values():
+            yield from interactions
+
+    def for_caller(self, caller):
+        """
+        Returns every interaction recorded for a contract file.
+        """
+        return self._by_caller.get(caller, [])
+
+    def has(self, caller, interaction_type):
+        """
+        Checks whether a contract file has an interaction of the given type.
+        """
+        return interaction_type in self._caller_types.get(caller, ())
+
+    def interaction_type(self, caller):
+        """
+        Returns the type of the first interaction recorded for a contract file, or None.
+        """
+        interactions = self._by_caller.get(caller)
+        return interactions[0].get("interaction_type") if interactions else None
+
+    def rule_roles(self):
+        """
+        Returns (interaction_type, role) pairs taken from the first valid rule of each type.
+        """
+        return list(self._rule_roles.items())
@@ -0,0 +1,99 @@
+import os
+import json
+import hashlib
+from utils import tracing
+
+DEFAULT_CACHE_FOLDER = os.path.join("output", ".cache")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class ObfuscationCache:
+    """
+    Content-addressed cache of obfuscated contracts and their selector registry fragments.
+    Entries are keyed by a hash of every input that affects the output and evicted least-recently-used first.
+    """
+
+    def __init__(self, folder=DEFAULT_CACHE_FOLDER, max_bytes=DEFAULT_MAX_BYTES):
+        self.folder = folder
+        self.entries_folder = os.path.join(folder, "contracts")
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(filename, contract_code, index, pass_config, seed):
+        """
+        Hashes the contract source, the interaction records that concern it, the pass configuration and the seed.
+        """
+        payload = json.dumps({
+            "file": filename,
+            "source": hashlib.sha256(contract_code.encode("utf-8")).hexdigest(),
+            "interactions": index.for_caller(filename),
+            "rules": index.rule_roles(),  # the opaque predicate pass applies rules project-wide
+            "passes": pass_config,
+            "seed": seed,
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.entries_folder, key[:2], f"{key}.json")
+
+    def get(self, key):
+        """
+        Returns (code, function_targets) for a cached contract, or None on a miss.
+        """
+        path = self._entry_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.misses += 1
+            return None
+
+        os.utime(path)  # Mark as recently used for LRU eviction
+        self.hits += 1
+        return entry["code"], entry["function_targets"]
+
+    def put(self, key, contract_code, function_targets):
+        """
+        Stores an obfuscated contract and its selector registry fragment.
+        """
+        path = self._entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write then rename so concurrent runs never read a partial entry
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"code": contract_code, "function_targets": function_targets}, f)
+        os.replace(tmp_path, path)
+        tracing.count("disk writes")
+
+    def evict(self):
+        """
+        Removes least-recently-used entries until the cache fits in max_bytes. Returns the number removed.
+        """
+        if not os.path.isdir(self.entries_folder):
+            return 0
+
+        entries = []
+        total = 0
+        for shard in os.scandir(self.entries_folder):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".json"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        return removed
@@ -0,0 +1,121 @@
+import os
+import json
+import time
+import hashlib
+import secrets
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: the atomic rename below still prevents torn reads
+    fcntl = None
+
+MANIFEST_NAME = "manifest.json"
+DEFAULT_RETAIN = 100
+
+
+def new_run_id():
+    """
+    Returns a run ID that sorts by creation time and does not collide between concurrent analyses.
+    """
+    return f"{int(time.time())}_{secrets.token_hex(4)}"
+
+
+def contract_hashes(file_paths):
+    """
+    Maps each contract file name to the sha256 of its source.
+    """
+    hashes = {}
+    for path in file_paths:
+        with open(path, "rb") as f:
+            hashes[os.path.basename(path)] = hashlib.sha256(f.read()).hexdigest()
+    return hashes
+
+
+def _empty_manifest():
+    return {"latest": None, "runs": {}}
+
+
+def load_manifest(json_folder):
+    """
+    Reads the run manifest of a results folder, or returns an empty one.
+    """
+    try:
+        with open(os.path.join(json_folder, MANIFEST_NAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return _empty_manifest()
+
+
+@contextmanager
+def _locked(json_folder):
+    """
+    Serialises manifest updates between concurrent analyses.
+    """
+    os.makedirs(json_folder, exist_ok=True)
+    with open(os.path.join(json_folder, f"{MANIFEST_NAME}.lock"), "w") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _write_manifest(json_folder, manifest):
+    path = os.path.join(json_folder, MANIFEST_NAME)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(tmp_path, path)
+
+
+def register_run(json_folder, run_id, results_file, hashes, retain=DEFAULT_RETAIN):
+    """
+    Records a finished analysis in the manifest and makes it the latest run.
+    Runs beyond the newest `retain` are pruned together with their results files; the run being registered
+    is always kept. Returns the pruned run IDs.
+    """
+    with _locked(json_folder):
+        manifest = load_manifest(json_folder)
+        manifest["runs"][run_id] = {
+            "results": os.path.basename(results_file),
+            "created": time.time(),
+            "contracts": hashes,
+        }
+        manifest["latest"] = run_id
+
+        pruned = []
+        if retain is not None and len(manifest["runs"]) > max(retain, 1):
+            by_age = sorted((run for run in manifest["runs"] if run != run_id),
+                            key=lambda run: manifest["runs"][run]["created"])
+            for old_run in by_age[:len(by_age) + 1 - max(retain, 1)]:
+                entry = manifest["runs"].pop(old_run)
+                try:
+                    os.remove(os.path.join(json_folder, entry["results"]))
+                except FileNotFoundError:
+                    pass
+                pruned.append(old_run)
+
+        _write_manifest(json_folder, manifest)
+    return pruned
+
+
+def resolve_run(json_folder, run_id=None):
+    """
+    Returns the results file of a run, or of the latest run when run_id is None.
+    Folders without a manifest fall back to the newest results file on disk.
+    """
+    manifest = load_manifest(json_folder)
+
+    if run_id is None:
+        run_id = manifest.get("latest")
+        if run_id is None or run_id not in manifest["runs"]:
+            from utils.file_handler import get_latest_json
+            return get_latest_json(json_folder)
+
+    entry = manifest["runs"].get(run_id)
+    if entry is None:
+        raise KeyError(f"Run {run_id} not found in {os.path.join(json_folder, MANIFEST_NAME)}")
+    return os.path.join(json_folder, entry["results"])
@@ -0,0 +1,91 @@
+import sqlite3
+from utils import tracing
+
+REGISTRY_DB_NAME = "selector_registry.db"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS selectors (
+    contract TEXT NOT NULL,
+    selector TEXT NOT NULL,
+    signature TEXT NOT NULL,
+    contract_address TEXT NOT NULL DEFAULT '',
+    original_signature TEXT,
+    PRIMARY KEY (contract, selector)
+);
+CREATE INDEX IF NOT EXISTS idx_selectors_selector ON selectors (selector);
+CREATE INDEX IF NOT EXISTS idx_selectors_signature ON selectors (signature);
+"""
+
+_ORIGINAL_SIGNATURE_INDEX = "CREATE INDEX IF NOT EXISTS idx_selectors_original ON selectors (original_signature)"
+
+
+class SelectorRegistry:
+    """
+    Persistent selector registry in SQLite, indexed by obfuscated selector, original signature and contract.
+    Lookups are index seeks, so monitoring and debugging tools never load the whole registry.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(_SCHEMA)
+
+        # Registries written before vanity renames were recorded lack this column
+        columns = {row[1] for row in self.connection.execute("PRAGMA table_info(selectors)")}
+        if "original_signature" not in columns:
+            with self.connection:
+                self.connection.execute("ALTER TABLE selectors ADD COLUMN original_signature TEXT")
+        self.connection.execute(_ORIGINAL_SIGNATURE_INDEX)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def store(self, function_targets):
+        """
+        Replaces the selectors of every contract in function_targets (file name -> {selector: entry})
+        in a single transaction. Contracts not mentioned keep their previous selectors.
+        """
+        rows = [
+            (contract, selector, entry["function_signature"], entry.get("contract_address", ""),
+             entry.get("original_signature"))
+            for contract, targets in function_targets.items()
+            for selector, entry in targets.items()
+        ]
+        with self.connection:
+            self.connection.executemany("DELETE FROM selectors WHERE contract = ?",
+                                        [(contract,) for contract in function_targets])
+            self.connection.executemany("INSERT OR REPLACE INTO selectors VALUES (?, ?, ?, ?, ?)", rows)
+        tracing.count("disk writes")
+        return len(rows)
+
+    def _select(self, condition, *values):
+        cursor = self.connection.execute(
+            f"SELECT contract, selector, signature, contract_address, original_signature FROM selectors "
+            f"WHERE {condition} ORDER BY contract, selector", values)
+        return [
+            {"contract": contract, "selector": selector, "function_signature": signature,
+             "contract_address": contract_address, "original_signature": original_signature}
+            for contract, selector, signature, contract_address, original_signature in cursor
+        ]
+
+    def by_selector(self, selector):
+        """
+        Reverse lookup: every contract and original signature behind an obfuscated selector.
+        """
+        selector = selector.lower()
+        if not selector.startswith("0x"):
+            selector = "0x" + selector
+        return self._select("selector = ?", selector)
+
+    def by_signature(self, function_signature):
+        """
+        Every obfuscated selector registered for a function signature, including functions
+        whose signature before a vanity rename matches.
+        """
+        return self._select("signature = ? OR original_signature = ?", function_signature, function_signature)
@@ -0,0 +1,195 @@
+import os
+import json
+import hashlib
+import logging
+from utils import tracing
+
+SOLC_VERSION = "0.8.20"
+AST_CACHE_FOLDER = os.path.join("output", ".cache", "ast")
+
+_solc_ready = False
+_solc_error = None  # Why solc could not be set up; later compiles fail with it instead of retrying the network
+_compiler_versions = {}  # solc executable -> version string
+
+
+def ensure_solc(version=SOLC_VERSION):
+    """
+    Selects the solc binary the first time a compile is needed.
+    Binaries already in the local solcx cache (or a matching solc on PATH) are used before any download.
+    A failed setup is remembered and raised again by every later call without another download attempt.
+    """
+    global _solc_ready, _solc_error
+    if _solc_ready:
+        return
+    if _solc_error is not None:
+        raise _solc_error
+
+    import solcx  # Imported lazily so commands that never compile skip it
+
+    if not any(str(v) == version for v in solcx.get_installed_solc_versions()):
+        try:
+            solcx.import_installed_solc()  # Copies a system solc into the cache, offline
+        except Exception as e:
+            logging.debug(f"No system solc imported: {e}")
+
+    try:
+        if not any(str(v) == version for v in solcx.get_installed_solc_versions()):
+            logging.info(f"solc {version} not found locally, installing...")
+            solcx.install_solc(version)
+        solcx.set_solc_version(version)
+    except Exception as e:
+        _solc_error = e
+        raise
+    _solc_ready = True
+
+
+def compiler_version():
+    """
+    Returns the version of the active solc binary, asking the binary only once per executable.
+    """
+    ensure_solc()
+    from solcx import get_solc_version
+    from solcx.install import get_executable
+
+    executable = str(get_executable())
+    if executable not in _compiler_versions:
+        _compiler_versions[executable] = str(get_solc_version(with_commit_hash=True))
+    return _compiler_versions[executable]
+
+
+def compile_sources(sources, output_selection, **compile_kwargs):
+    """
+    Compiles several sources (file name -> code) in a single standard-JSON invocation.
+    output_selection is the per-contract and per-file output list, e.g. {"": ["ast"]}.
+    """
+    ensure_solc()
+    from solcx import compile_standard
+
+    tracing.count("solc compiles")
+    return compile_standard({
+        "language": "Solidity",
+        "sources": {filename: {"content": code} for filename, code in sources.items()},
+        "settings": {"outputSelection": {"*": output_selection}}
+    }, **compile_kwargs)
+
+
+def compile_with_diagnostics(sources, output_selection, **compile_kwargs):
+    """
+    Like compile_sources, but returns the compiler output (including its "errors" list) even when sources fail.
+    """
+    from solcx.exceptions import SolcError
+
+    try:
+        return compile_sources(sources, output_selection, **compile_kwargs)
+    except SolcError as e:
+        if not e.stdout_data:
+            raise
+        return json.loads(e.stdout_data)
+
+
+# Diagnostics reported before semantic analysis runs
+SYNTAX_ERROR_TYPES = {"ParserError", "SyntaxError", "DocstringParsingError"}
+
+
+def check_files(file_paths):
+    """
+    Runs syntax and semantic checks for many files with one compiler invocation.
+    Returns file path -> {"syntax_errors", "semantic_errors", "warnings", "contracts": {name: {"abi", "bytecode"}}}.
+    """
+    sources = {}
+    for path in file_paths:
+        with open(path, "r", encoding="utf-8") as f:
+            sources[path] = f.read()
+
+    folders = sorted({os.path.dirname(os.path.abspath(path)) for path in file_paths})
+    output_selection = {"*": ["abi", "evm.bytecode.object"]}
+    results = {path: {"syntax_errors": [], "semantic_errors": [], "warnings": [], "contracts": {}} for path in sources}
+
+    def collect(compiled, paths):
+        for error in compiled.get("errors", []):
+            path = error.get("sourceLocation", {}).get("file")
+            targets = [path] if path in results else list(paths)  # Unlocated errors concern every file
+            message = error.get("formattedMessage", error.get("message", ""))
+            for target in targets:
+                if error["severity"] != "error":
+                    results[target]["warnings"].append(message)
+                elif error.get("type") in SYNTAX_ERROR_TYPES:
+                    results[target]["syntax_errors"].append(message)
+                else:
+                    results[target]["semantic_errors"].append(message)
+
+        for path, contracts in compiled.get("contracts", {}).items():
+            for name, output in contracts.items():
+                results[path]["contracts"][name] = {
+                    "abi": output.get("abi", []),
+                    "bytecode": output.get("evm", {}).get("bytecode", {}).get("object", ""),
+                }
+
+    compiled = compile_with_diagnostics(sources, output_selection, allow_paths=folders)
+    collect(compiled, sources)
+
+    # Parser errors stop solc before analysing any source, so re-check the files that did parse
+    unparsed = {path for path, result in results.items() if result["syntax_errors"]}
+    if unparsed and len(unparsed) < len(sources):
+        parsed = {path: code for path, code in sources.items() if path not in unparsed}
+        for path in parsed:
+            results[path] = {"syntax_errors": [], "semantic_errors": [], "warnings": [], "contracts": {}}
+        collect(compile_with_diagnostics(parsed, output_selection, allow_paths=folders), parsed)
+
+    return results
+
+
+def _ast_cache_path(cache_folder, key):
+    return os.path.join(cache_folder, key[:2], f"{key}.json")
+
+
+def compile_asts(sources, cache_folder=AST_CACHE_FOLDER):
+    """
+    Returns the AST of every source (file name -> AST), compiling all uncached sources in one batch.
+    ASTs are cached on disk by source hash and compiler version. Sources that fail to compile are left out.
+    """
+    version = compiler_version()
+    asts = {}
+    keys = {}
+
+    for filename, code in sources.items():
+        keys[filename] = hashlib.sha256(f"{version}\n{filename}\n{code}".encode("utf-8")).hexdigest()
+        try:
+            with open(_ast_cache_path(cache_folder, keys[filename]), "r", encoding="utf-8") as f:
+                asts[filename] = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+
+    missing = {filename: code for filename, code in sources.items() if filename not in asts}
+    if not missing:
+        return asts
+
+    try:
+        compiled = compile_sources(missing, {"": ["ast"]})
+        batches = [(missing, compiled)]
+    except Exception as e:
+        if len(missing) == 1:
+            logging.error(f"Failed to compile {next(iter(missing))}: {e}")
+            return asts
+
+        # One broken source fails the whole batch; compile the rest one by one to isolate it
+        logging.warning(f"Batched compilation failed, retrying per file: {e}")
+        batches = []
+        for filename, code in missing.items():
+            try:
+                batches.append(({filename: code}, compile_sources({filename: code}, {"": ["ast"]})))
+            except Exception as file_error:
+                logging.error(f"Failed to compile {filename}: {file_error}")
+
+    for batch, compiled in batches:
+        for filename in batch:
+            ast = compiled["sources"][filename]["ast"]
+            asts[filename] = ast
+
+            path = _ast_cache_path(cache_folder, keys[filename])
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(ast, f)
+            tracing.count("disk writes")
+
+    return asts
@@ -0,0 +1,316 @@
+import re
+import bisect
+from array import array
+from functools import lru_cache
+from utils import tracing
+
+# Token kinds (stored in a compact byte array)
+IDENT = 0
+NUMBER = 1
+STRING = 2
+PUNCT = 3
+
+_TOKEN_PATTERN = re.compile(r'''
+    (?P<skip>[ \t\r\n\f\v]+|//[^\n]*|/\*.*?(?:\*/|\Z))
+  | (?P<string>(?:hex|unicode)?(?:"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*'))
+  | (?P<number>0[xX][0-9a-fA-F_]+|\d[\d_]*(?:\.\d+)?(?:[eE]-?\d+)?)
+  | (?P<ident>[A-Za-z_$][A-Za-z0-9_$]*)
+  | (?P<punct>==|!=|<=|>=|&&|\|\||=>|->|\+\+|--|\*\*|<<|>>|:=|[-+*/%=<>!&|^~?:;,.(){}\[\]@]|.)
+''', re.VERBOSE | re.DOTALL)
+
+_KINDS = {"string": STRING, "number": NUMBER, "ident": IDENT, "punct": PUNCT}
+
+# Keywords that open a callable with a body
+CALLABLE_KEYWORDS = {"function", "constructor", "fallback", "receive", "modifier"}
+CONTRACT_KEYWORDS = {"contract", "library", "interface"}
+
+
+class Callable:
+    """
+    A function-like definition. Token positions index into the owning TokenizedSource.
+    body_open/body_close are None for declarations without a body.
+    """
+    __slots__ = ("kind", "name", "keyword", "params_open", "params_close", "body_open", "body_close")
+
+    def __init__(self, kind, name, keyword, params_open, params_close, body_open, body_close):
+        self.kind = kind
+        self.name = name
+        self.keyword = keyword
+        self.params_open = params_open
+        self.params_close = params_close
+        self.body_open = body_open
+        self.body_close = body_close
+
+
+class ContractSpan:
+    """
+    A contract, library or interface definition and the token positions of its braces.
+    """
+    __slots__ = ("kind", "name", "keyword", "body_open", "body_close")
+
+    def __init__(self, kind, name, keyword, body_open, body_close):
+        self.kind = kind
+        self.name = name
+        self.keyword = keyword
+        self.body_open = body_open
+        self.body_close = body_close
+
+
+class TokenizedSource:
+    """
+    Single-pass tokenization of a Solidity source. Comments and whitespace are dropped;
+    every token records its offsets, line, brace depth and parenthesis depth, and
+    matching brackets and function/contract boundaries are resolved up front.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.kinds = array("B")
+        self.starts = array("I")
+        self.ends = array("I")
+        self.depths = array("H")   # brace depth before the token
+        self.parens = array("H")   # parenthesis depth before the token
+        self.matches = array("i")  # index of the matching bracket, or -1
+        self.line_starts = array("I", [0])
+        self.callables = []
+        self.contracts = []
+
+        tracing.count("regex scans")
+        self._tokenize()
+        self.lines = array("I", (bisect.bisect_right(self.line_starts, start) - 1 for start in self.starts))
+        self._find_definitions()
+
+    def _tokenize(self):
+        source = self.source
+        kinds, starts, ends, depths, parens, matches = (
+            self.kinds, self.starts, self.ends, self.depths, self.parens, self.matches
+        )
+        line_starts = self.line_starts
+        depth = 0
+        paren = 0
+        stack = []
+
+        for match in _TOKEN_PATTERN.finditer(source):
+            group = match.lastgroup
+            start, end = match.span()
+
+            if group == "skip" or group == "string":
+                # Whitespace, comments and strings are the only tokens that can contain newlines
+                newline = source.find("\n", start, end)
+                while newline != -1:
+                    line_starts.append(newline + 1)
+                    newline = source.find("\n", newline + 1, end)
+                if group == "skip":
+                    continue
+
+            text = source[start] if group == "punct" and end - start == 1 else None
+            index = len(kinds)
+            kinds.append(_KINDS[group])
+            starts.append(start)
+            ends.append(end)
+            if text == "}" or text == ")":
+                if text == "}":
+                    depth = max(depth - 1, 0)
+                else:
+                    paren = max(paren - 1, 0)
+            depths.append(depth)
+            parens.append(paren)
+            matches.append(-1)
+
+            if text in ("{", "(", "["):
+                stack.append(index)
+                if text == "{":
+                    depth += 1
+                elif text == "(":
+                    paren += 1
+            elif text in ("}", ")", "]"):
+                if stack:
+                    opener = stack.pop()
+                    matches[opener] = index
+                    matches[index] = opener
+
+    def _find_definitions(self):
+        count = len(self.kinds)
+        for i in range(count):
+            if self.kinds[i] != IDENT:
+                continue
+            word = self.text(i)
+
+            if word in CONTRACT_KEYWORDS and i + 1 < count and self.kinds[i + 1] == IDENT:
+                # Skip "using X for Y" style false positives by requiring a body
+                j = i + 2
+                while j < count and not self.is_punct(j, "{") and not self.is_punct(j, ";"):
+                    j += 1
+                if j < count and self.is_punct(j, "{"):
+                    keyword = i - 1 if i > 0 and self.text(i - 1) == "abstract" else i
+                    self.contracts.append(ContractSpan(word, self.text(i + 1), keyword, j, self.matches[j]))
+
+            elif word in CALLABLE_KEYWORDS:
+                if word in ("function", "modifier"):
+                    # Function types inside parameter lists have no name: "function (uint) external"
+                    if i + 2 >= count or self.kinds[i + 1] != IDENT:
+                        continue
+                    name, params_open = self.text(i + 1), i + 2
+                else:
+                    # constructor/fallback/receive must be followed by their parameter list
+                    if i > 0 and (self.is_punct(i - 1, ".") or self.is_ident(i - 1, "function")):
+                        continue
+                    name, params_open = word, i + 1
+                if params_open >= count:
+                    continue
+                if not self.is_punct(params_open, "("):
+                    if word != "modifier":
+                        continue
+                    params_open = params_close = None
+                    j = i + 2
+                else:
+                    params_close = self.matches[params_open]
+                    if params_close < 0:
+                        continue
+                    j = params_close + 1
+
+                # Skip modifiers, visibility and return lists up to the body or the terminating ';'
+                while j < count and not (self.is_punct(j, "{") or self.is_punct(j, ";")):
+                    if self.is_punct(j, "(") and self.matches[j] > j:
+                        j = self.matches[j]
+                    j += 1
+                body_open = j if j < count and self.is_punct(j, "{") else None
+                body_close = self.matches[body_open] if body_open is not None else None
+                if body_close is not None and body_close < 0:
+                    body_close = None
+                self.callables.append(Callable(word, name, i, params_open, params_close, body_open, body_close))
+
+    # --- queries -------------------------------------------------------------
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def text(self, i):
+        return self.source[self.starts[i]:self.ends[i]]
+
+    def is_punct(self, i, char):
+        return 0 <= i < len(self.kinds) and self.kinds[i] == PUNCT and self.source[self.starts[i]:self.ends[i]] == char
+
+    def is_ident(self, i, word=None):
+        if not (0 <= i < len(self.kinds)) or self.kinds[i] != IDENT:
+            return False
+        return word is None or self.source[self.starts[i]:self.ends[i]] == word
+
+    def slice(self, first, last):
+        """
+        Source text from the start of token first to the end of token last.
+        """
+        return self.source[self.starts[first]:self.ends[last]]
+
+    def between(self, open_index, close_index):
+        """
+        Source text strictly between two bracket tokens.
+        """
+        return self.source[self.ends[open_index]:self.starts[close_index]]
+
+    def starts_line(self, i):
+        """
+        True if token i is the first token on its line.
+        """
+        return i == 0 or self.lines[i - 1] != self.lines[i]
+
+    def insert_before(self, i, text, indent="        "):
+        """
+        Edit that inserts a line of code before token i: on its own line when token i starts
+        a line, otherwise inline just before the token.
+        """
+        if self.starts_line(i):
+            offset = self.line_starts[self.lines[i]]
+            return offset, offset, f"{indent}{text}\n"
+        return self.starts[i], self.starts[i], f"{text} "
+
+    def identifiers(self):
+        """
+        Set of every identifier in the source.
+        """
+        return {self.text(i) for i in range(len(self.kinds)) if self.kinds[i] == IDENT}
+
+    def functions(self, with_body=True):
+        """
+        Named 'function' definitions, optionally only those with a body.
+        """
+        return [c for c in self.callables if c.kind == "function" and (c.body_open is not None or not with_body)]
+
+    def member_calls(self, members=None):
+        """
+        Yields (object, dot, member, open_paren) token indexes for calls like 'obj.member(',
+        where object is an identifier. members optionally restricts the member names.
+        """
+        kinds = self.kinds
+        for i in range(1, len(kinds) - 2):
+            if kinds[i + 1] != IDENT or kinds[i - 1] != IDENT or not self.is_punct(i, "."):
+                continue
+            if not self.is_punct(i + 2, "("):
+                continue
+            if members is not None and self.text(i + 1) not in members:
+                continue
+            yield i - 1, i, i + 1, i + 2
+
+    def new_expressions(self):
+        """
+        Yields (new, name, open_paren) token indexes for 'new Name(' expressions.
+        """
+        for i in range(len(self.kinds) - 2):
+            if self.is_ident(i, "new") and self.kinds[i + 1] == IDENT and self.is_punct(i + 2, "("):
+                yield i, i + 1, i + 2
+
+    def statement_start(self, i, block_open):
+        """
+        Index of the first token of the statement directly inside block_open that contains token i.
+        """
+        block_depth = self.depths[block_open] + 1
+        j = i
+        while j > block_open + 1:
+            prev = j - 1
+            if self.depths[prev] == block_depth and self.parens[prev] == 0 and (
+                self.is_punct(prev, ";") or self.is_punct(prev, "}")
+            ):
+                break
+            j -= 1
+        return j
+
+    def enclosing_callable(self, i):
+        """
+        The callable whose body contains token i, or None.
+        """
+        for definition in self.callables:
+            if definition.body_open is not None and definition.body_close is not None \
+                    and definition.body_open < i < definition.body_close:
+                return definition
+        return None
+
+    def enclosing_contract(self, i):
+        """
+        The contract whose body contains token i, or None.
+        """
+        for contract in self.contracts:
+            if contract.body_close is not None and contract.body_open < i < contract.body_close:
+                return contract
+        return None
+
+
+@lru_cache(maxsize=64)
+def tokenize(source):
+    """
+    Tokenizes a Solidity source once; unchanged sources handed from pass to pass reuse the result.
+    """
+    return TokenizedSource(source)
+
+
+def splice(source, edits):
+    """
+    Applies (start, end, replacement) edits to a source. Edits must not overlap.
+    """
+    parts = []
+    position = 0
+    for start, end, replacement in sorted(edits, key=lambda edit: (edit[0], edit[1])):
+        parts.append(source[position:start])
+        parts.append(replacement)
+        position = end
+    parts.append(source[position:])
+    return "".join(parts)
@@ -0,0 +1,151 @@
+import os
+import json
+import time
+import threading
+
+# Active tracer, or None when tracing is off (the default)
+_tracer = None
+
+
+class _NullSpan:
+    """
+    Shared span used while tracing is off: entering and leaving it does nothing.
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "category", "args", "start", "cpu_start")
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.cpu_start = time.thread_time()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        end = time.perf_counter()
+        self.args["cpu_ms"] = round((time.thread_time() - self.cpu_start) * 1000, 3)
+        self.tracer.add({
+            "name": self.name,
+            "cat": self.category,
+            "ph": "X",
+            "ts": self.start * 1e6,
+            "dur": (end - self.start) * 1e6,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": self.args,
+        })
+        return False
+
+    def set(self, **args):
+        """
+        Adds arguments (bytes, file counts...) to the span before it closes.
+        """
+        self.args.update(args)
+
+
+class Tracer:
+    """
+    Collects Chrome trace events (complete spans and counters) for one process.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def add(self, event):
+        with self._lock:
+            self.events.append(event)
+
+    def count(self, name, amount):
+        with self._lock:
+            value = self.counters[name] = self.counters.get(name, 0) + amount
+            self.events.append({
+                "name": name,
+                "ph": "C",
+                "ts": time.perf_counter() * 1e6,
+                "pid": os.getpid(),
+                "args": {name: value},
+            })
+
+
+def enable():
+    """
+    Turns tracing on for this process. Worker processes call it again so events
+    inherited from a forked parent are not reported twice.
+    """
+    global _tracer
+    _tracer = Tracer()
+
+
+def enabled():
+    return _tracer is not None
+
+
+def span(name, category="obfuscation", **args):
+    """
+    Context manager timing a block (wall and CPU time). Costs one global lookup when tracing is off.
+    """
+    if _tracer is None:
+        return _NULL_SPAN
+    return _Span(_tracer, name, category, args)
+
+
+def count(name, amount=1):
+    """
+    Increments a counter such as "regex scans", "solc compiles" or "disk writes".
+    """
+    if _tracer is None:
+        return
+    _tracer.count(name, amount)
+
+
+def drain():
+    """
+    Returns and clears the events recorded so far, e.g. to ship them from a worker to the parent process.
+    """
+    if _tracer is None:
+        return []
+    with _tracer._lock:
+        events, _tracer.events = _tracer.events, []
+    return events
+
+
+def merge(events):
+    """
+    Adds events recorded by another process.
+    """
+    if _tracer is None or not events:
+        return
+    with _tracer._lock:
+        _tracer.events.extend(events)
+
+
+def write_trace(path):
+    """
+    Writes every recorded event in Chrome trace event format (chrome://tracing, Perfetto, speedscope).
+    """
+    events = drain()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    return len(events)